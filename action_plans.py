@@ -0,0 +1,190 @@
+"""
+Action plans attached to assessments, and due-date reminders for them.
+
+Open actions (no completion_date) are covered by the partial index
+idx_sdg_actions_open_due on (status, target_date), so both the overdue
+dashboard and each reminder tick are a single indexed range scan. Reminders
+are grouped into one digest per user and queued in the mail outbox, whose
+sender delivers them in batches over one SMTP connection.
+
+Run directly to send one round of reminders (e.g. from cron):
+
+    python action_plans.py [--lead-days N]
+
+See mail_outbox.py for sending the queued digests against a local SMTP server.
+"""
+import argparse
+import threading
+from datetime import date, timedelta
+
+import mail_outbox
+
+ACTION_STATUSES = ('planned', 'in_progress', 'completed', 'cancelled')
+OPEN_STATUSES = ('planned', 'in_progress')
+
+# Reminders go out this many days before the target date
+REMINDER_LEAD_DAYS = 3
+
+OPEN_ACTIONS_SQL = '''
+    SELECT act.*, g.name AS sdg_name, g.number AS sdg_number,
+           a.project_id, p.name AS project_name, p.user_id
+    FROM sdg_actions act
+    JOIN assessments a ON a.id = act.assessment_id
+    JOIN projects p ON p.id = a.project_id
+    JOIN sdg_goals g ON g.id = act.sdg_id
+    WHERE act.completion_date IS NULL
+      AND act.status IN ('planned', 'in_progress')
+      AND p.deleted_at IS NULL
+'''
+
+
+def list_actions(conn, assessment_id):
+    """All actions of an assessment, soonest target date first"""
+    return conn.execute('''
+        SELECT act.*, g.name AS sdg_name, g.number AS sdg_number
+        FROM sdg_actions act
+        JOIN sdg_goals g ON g.id = act.sdg_id
+        WHERE act.assessment_id = ?
+        ORDER BY act.target_date IS NULL, act.target_date, act.id
+    ''', (assessment_id,)).fetchall()
+
+
+def create_action(conn, assessment_id, sdg_id, description, target_date=None, status='planned'):
+    """Add an action to an assessment; return its id"""
+    if status not in ACTION_STATUSES:
+        raise ValueError(f'Invalid status: {status}')
+    cursor = conn.execute('''
+        INSERT INTO sdg_actions (assessment_id, sdg_id, description, status, target_date)
+        VALUES (?, ?, ?, ?, ?)
+    ''', (assessment_id, sdg_id, description, status, target_date or None))
+    conn.commit()
+    return cursor.lastrowid
+
+
+def update_action(conn, action_id, status, description=None, target_date=None):
+    """Change an action's status (and optionally text and date)
+
+    Completing an action stamps completion_date, which takes it out of the
+    open-actions index.
+    """
+    if status not in ACTION_STATUSES:
+        raise ValueError(f'Invalid status: {status}')
+    completion_date = date.today().isoformat() if status == 'completed' else None
+    conn.execute('''
+        UPDATE sdg_actions
+        SET status = ?, completion_date = ?,
+            description = COALESCE(?, description),
+            target_date = COALESCE(?, target_date),
+            updated_at = CURRENT_TIMESTAMP
+        WHERE id = ?
+    ''', (status, completion_date, description or None, target_date or None, action_id))
+    conn.commit()
+
+
+def overdue_actions(conn, user_id, today=None):
+    """Open actions past their target date on the user's projects"""
+    today = today or date.today()
+    return conn.execute(
+        OPEN_ACTIONS_SQL + ' AND act.target_date < ? AND p.user_id = ? ORDER BY act.target_date',
+        (today.isoformat(), user_id)
+    ).fetchall()
+
+
+def due_for_reminder(conn, today=None, lead_days=REMINDER_LEAD_DAYS):
+    """Open actions due within lead_days that were not reminded about today"""
+    today = today or date.today()
+    horizon = (today + timedelta(days=lead_days)).isoformat()
+    return conn.execute(
+        OPEN_ACTIONS_SQL + ' AND act.target_date <= ? AND (act.reminded_on IS NULL OR act.reminded_on < ?)'
+        ' ORDER BY p.user_id, act.target_date',
+        (horizon, today.isoformat())
+    ).fetchall()
+
+
+def build_digests(conn, actions):
+    """Group due actions into one (user, [actions]) digest per user"""
+    by_user = {}
+    for action in actions:
+        by_user.setdefault(action['user_id'], []).append(action)
+    if not by_user:
+        return []
+    placeholders = ','.join('?' * len(by_user))
+    users = conn.execute(f'SELECT id, email, name FROM users WHERE id IN ({placeholders})',
+                         list(by_user)).fetchall()
+    return [(user, by_user[user['id']]) for user in users]
+
+
+def digest_message(user, actions, today=None):
+    """Return (subject, body) of the reminder email for one user"""
+    today = today or date.today()
+    lines = [f"Hello {user['name']},", '', 'The following SDG actions need your attention:', '']
+    for action in actions:
+        overdue = str(action['target_date']) < today.isoformat()
+        lines.append(f"- [{action['project_name']}] SDG {action['sdg_number']}: {action['description']} "
+                     f"({'overdue since' if overdue else 'due'} {action['target_date']})")
+    lines += ['', 'SDG Assessment Tool']
+    return f'SDG action reminders ({len(actions)})', '\n'.join(lines)
+
+
+def queue_reminders(conn, today=None, lead_days=REMINDER_LEAD_DAYS):
+    """Queue one round of reminder digests; return the number of emails queued"""
+    today = today or date.today()
+    digests = build_digests(conn, due_for_reminder(conn, today, lead_days))
+    for user, actions in digests:
+        subject, body = digest_message(user, actions, today)
+        mail_outbox.enqueue(conn, user['email'], subject, body, commit=False)
+    # Digests and reminded_on stamps are committed together, so nothing is sent twice
+    conn.executemany('UPDATE sdg_actions SET reminded_on = ? WHERE id = ?',
+                     [(today.isoformat(), action['id']) for _, actions in digests for action in actions])
+    conn.commit()
+    return len(digests)
+
+
+class ReminderScheduler:
+    """Background thread that queues reminders every interval seconds
+
+    Only start this in one process; with several gunicorn workers, run
+    action_plans.py from cron instead.
+    """
+
+    def __init__(self, connect, interval=3600):
+        self.connect = connect
+        self.interval = interval
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name='action-reminders', daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def tick(self):
+        conn = self.connect()
+        try:
+            return queue_reminders(conn)
+        finally:
+            conn.close()
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                self.tick()
+            except Exception as e:
+                print(f"Action reminder tick failed: {e}")
+            self._stop.wait(self.interval)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Queue SDG action reminder digests')
+    parser.add_argument('--lead-days', type=int, default=REMINDER_LEAD_DAYS)
+    args = parser.parse_args()
+
+    from app_simple import get_db_connection, all_shards
+    for shard in all_shards():
+        conn = get_db_connection(shard=shard)
+        count = queue_reminders(conn, lead_days=args.lead_days)
+        conn.close()
+        print(f"{shard}: queued {count} reminder digest(s)")
@@ -1,8 +1,38 @@
-from flask import Flask, render_template, redirect, url_for, request, flash, session
+from flask import Flask, render_template, redirect, url_for, request, flash, session, jsonify, send_file, abort, Response, stream_with_context, has_request_context, g
 from werkzeug.security import check_password_hash, generate_password_hash
-import sqlite3
+from flask_mail import Mail
 import os
-from datetime import datetime
+import time
+from datetime import date, datetime
+from functools import lru_cache, partial
+from config import Config
+import evidence
+import evidence_tagging
+import action_plans
+import mail_outbox
+import project_purge
+import db_backup
+import db_maintenance
+import db_types
+import memory_diagnostics
+import request_profiler
+import score_audit
+import startup
+from static_assets import AssetManifest
+from shared_cache import SharedCache, LocalLRU
+from db_replica import Replica, ReplicaRefresher
+from sharding import ShardRouter, ShardLocal, ShardMoving, MAIN
+from reset_tokens import generate_reset_token, verify_reset_token
+from autosave import AutosaveBuffer, parse_fields
+import live_updates
+from live_updates import ChangeFeed
+from storage import SqliteStorage
+from assessment_versions import VersionConflict, begin_write, field_merge, contention_stats
+from peer_benchmark import PeerBenchmark, ShardedPeerBenchmark
+import similar_projects
+from similar_projects import SimilarProjectIndex, DisabledIndex, METRICS
+from sdg_content import SDG_TITLES, SDG_SUBTITLES, SDG_TARGETS, SDG_APPLICATIONS
+from sdg_suggestions import engine as suggestion_engine, suggest_for_project
 
 # Create Flask app
 app = Flask(__name__, 
@@ -10,36 +40,195 @@ app = Flask(__name__,
             static_folder='app/static')
 
 # Configuration
+app.config.from_object(Config)
 app.config['SECRET_KEY'] = 'your-secret-key'
 app.config['DATABASE'] = os.path.join('instance', 'sdg_assessment.db')
 
+mail = Mail(app)
+
+# Fingerprinted, precompressed static files from 'python static_assets.py build'
+assets = AssetManifest(app.static_folder)
+app.view_functions['static'] = assets.send
+
+# Workers load compiled templates from disk instead of compiling them again
+if app.config['TEMPLATE_CACHE_DIR']:
+    startup.install_bytecode_cache(app, app.config['TEMPLATE_CACHE_DIR'])
+
+# Optional per-organisation shards (see sharding.py); without them everything is MAIN
+router = None
+if app.config['SHARD_COUNT']:
+    router = ShardRouter(app.config['DATABASE'], app.config['SHARD_DIR'], app.config['SHARD_COUNT'],
+                         app.config['UPLOAD_FOLDER'], map_ttl=app.config['SHARD_MAP_TTL'])
+    router.ensure_shards()
+
+def current_shard():
+    """Shard of the logged-in user's organisation"""
+    if router is None or not has_request_context():
+        return MAIN
+    return router.shard_for(session.get('organization'))
+
+def all_shards():
+    return router.all_shards() if router is not None else [MAIN]
+
+def upload_folder(shard=None):
+    """Evidence folder of a shard (default: the current one)"""
+    if router is None:
+        return app.config['UPLOAD_FOLDER']
+    return router.upload_folder(shard or current_shard())
+
+# Percentile ranks of finalized scores against similar projects; with shards,
+# one benchmark over all of them so projects are ranked against every peer
+if router is not None:
+    peer_benchmark = ShardLocal(ShardedPeerBenchmark(router.fan_out).for_shard, current_shard)
+else:
+    peer_benchmark = ShardLocal(lambda shard: PeerBenchmark(), current_shard)
+
+# Nearest-neighbour index over the latest finalized score vector of each project;
+# off with shards, where it could only search the current shard (see similar_projects.py)
+if router is not None:
+    similar_index = ShardLocal(lambda shard: DisabledIndex(), current_shard)
+else:
+    similar_index = ShardLocal(
+        lambda shard: SimilarProjectIndex(similar_projects.snapshot_prefix(app.config['DATABASE'])), current_shard)
+
+# Clean-ups the project purger runs on its schedule, each given a connection
+HOUSEKEEPING = (live_updates.prune, similar_projects.prune_changes)
+
+# Computed results shared by every worker on the host
+shared_cache = SharedCache(app.config['SHARED_CACHE_PATH'], max_entries=app.config['SHARED_CACHE_MAX_ENTRIES'],
+                           l1=LocalLRU(app.config['SHARED_CACHE_L1_SIZE'], app.config['SHARED_CACHE_L1_TTL']))
+
+# The SDG goals are reference data seeded by init_db; the workers share one
+# copy, reloaded after SDG_CATALOGUE_TTL seconds or a bump('sdg_catalogue')
+SDG_CATALOGUE_TTL = 3600
+
+def sdg_catalogue(conn):
+    """All SDG goals ordered by number, as dicts"""
+    return shared_cache.get_or_set(
+        shared_cache.key('sdg_catalogue'),
+        lambda: [dict(row) for row in conn.execute('SELECT * FROM sdg_goals ORDER BY number')],
+        SDG_CATALOGUE_TTL)
+
 # Template filters
 @app.template_filter('format_date')
 def format_date(value, format='%Y-%m-%d'):
     if value is None:
         return ''
+    return _format_date(value, format)
+
+@lru_cache(maxsize=4096)
+def _format_date(value, format):
+    """Memoised: list pages format the same few dates on every row"""
     if isinstance(value, str):
-        try:
-            value = datetime.strptime(value, '%Y-%m-%d %H:%M:%S.%f')
-        except ValueError:
-            try:
-                value = datetime.strptime(value, '%Y-%m-%d %H:%M:%S')
-            except ValueError:
-                try:
-                    value = datetime.strptime(value, '%Y-%m-%d')
-                except ValueError:
-                    return value
+        # Typed connections already return datetimes; strings come from expressions
+        value = db_types.parse_timestamp(value)
+        if isinstance(value, str):
+            return value
     return value.strftime(format)
 
+# Read-only replica for reports and dashboards, if configured
+replica = None
+if app.config['REPLICA_PATH']:
+    replica = Replica(app.config['DATABASE'], app.config['REPLICA_PATH'],
+                      max_staleness=app.config['REPLICA_MAX_STALENESS'])
+
+# Per-route allocation tracking, installed first so it covers the other request hooks
+route_memory = None
+if app.config['MEMORY_DIAGNOSTICS']:
+    route_memory = memory_diagnostics.RouteMemory()
+    route_memory.install(app)
+
 # Database helper functions
-def get_db_connection():
-    conn = sqlite3.connect(app.config['DATABASE'])
-    conn.row_factory = sqlite3.Row
-    return conn
+def get_db_connection(readonly=False, shard=None):
+    """Open the current shard's database, or the replica for readonly=True when it is fresh enough"""
+    shard = shard or current_shard()
+    if shard != MAIN:
+        return router.connect(shard)
+    if readonly and replica is not None:
+        # Never serve users a replica taken before their own last write
+        wrote_at = session.get('wrote_at', 0) if has_request_context() else 0
+        conn = replica.connect(min_refreshed_at=wrote_at)
+        if conn is not None:
+            return conn
+    return db_types.connect(app.config['DATABASE'])
+
+def get_storage(readonly=False, shard=None):
+    """Open the storage layer (see storage.py) on the current shard with STORAGE_ENGINE
+
+    The SQLAlchemy engine keeps pooled connections to the primary, so
+    readonly=True only reaches the replica with the sqlite engine.
+    """
+    if app.config['STORAGE_ENGINE'] == 'sqlalchemy':
+        from storage_sqlalchemy import SqlAlchemyStorage, get_engine
+        shard = shard or current_shard()
+        if router is None:
+            return SqlAlchemyStorage(get_engine(app.config['DATABASE']))
+        directory = router.directory_path if shard != MAIN else None
+        return SqlAlchemyStorage(get_engine(router.path(shard), directory))
+    return SqliteStorage(get_db_connection(readonly, shard))
+
+@app.after_request
+def remember_write(response):
+    """Stamp the session after writes so readonly reads stay on the primary until the replica catches up"""
+    if replica is not None and request.method in ('POST', 'PUT', 'PATCH', 'DELETE') and session.get('user_id'):
+        session['wrote_at'] = time.time()
+    return response
+
+@app.before_request
+def start_request_profile():
+    """Sample this request when an admin sent a profiling token made for it"""
+    token = request.args.get(request_profiler.TOKEN_PARAM) or request.headers.get(request_profiler.TOKEN_HEADER)
+    if token is None:
+        return
+    if session.get('is_admin') and request_profiler.check_token(app, token, session.get('user_id'), request.path):
+        g.profile = request_profiler.StackSampler()
+        g.profile.start()
+
+def finish_request_profile(status):
+    sampler = g.pop('profile', None)
+    if sampler is None:
+        return None
+    sampler.stop()
+    meta = {'path': request.full_path.rstrip('?'), 'method': request.method, 'endpoint': request.endpoint,
+            'status': status, 'user_id': session.get('user_id')}
+    return request_profiler.save_profile(app.config['PROFILE_DIR'], sampler, meta, app.config['PROFILE_KEEP'])
 
-def add_missing_columns():
+@app.after_request
+def save_request_profile(response):
+    name = finish_request_profile(response.status_code)
+    if name:
+        response.headers['X-Profile'] = url_for('show_profile', name=name)
+    return response
+
+@app.teardown_request
+def discard_request_profile(error):
+    # after_request does not run when the view raised
+    if 'profile' in g:
+        finish_request_profile(500)
+
+# Buffers score audit entries and writes them in batches
+audit_log = ShardLocal(lambda shard: score_audit.AuditLog(partial(get_db_connection, shard=shard)), current_shard)
+
+# Coalesces wizard autosave PATCHes into one write per assessment
+autosave_buffer = ShardLocal(lambda shard: AutosaveBuffer(partial(get_db_connection, shard=shard),
+                                                          audit=audit_log.get(shard)), current_shard)
+
+def audit_score_changes(conn, assessment_id, before):
+    """Record what this request changed in an assessment's scores, given read_scores() from before it"""
+    audit_log.record_changes(assessment_id, before, score_audit.read_scores(conn, assessment_id),
+                             session['user_id'], request.endpoint)
+
+# One change-log poller per worker and shard, shared by every live assessment view
+change_feed = ShardLocal(lambda shard: ChangeFeed(partial(get_db_connection, shard=shard)), current_shard)
+
+@app.errorhandler(ShardMoving)
+def shard_moving(error):
+    return ('Your organisation\'s data is being moved. Please try again in a minute.', 503,
+            {'Retry-After': '60'})
+
+def add_missing_columns(connect=get_db_connection):
     """Add any missing columns to the database"""
-    conn = get_db_connection()
+    conn = connect()
     
     # Check if overall_score column exists in assessments table
     columns = conn.execute("PRAGMA table_info(assessments)").fetchall()
@@ -57,6 +246,129 @@ def add_missing_columns():
         conn.commit()
         print("Added user_id column to assessments table")
     
+    # Add row_version column used for optimistic concurrency control
+    if 'row_version' not in column_names:
+        conn.execute('ALTER TABLE assessments ADD COLUMN row_version INTEGER DEFAULT 1')
+        conn.commit()
+        print("Added row_version column to assessments table")
+    
+    # Add the wizard progress flags (previously only added by fix_db.py)
+    for step in range(1, 6):
+        if f'step{step}_completed' not in column_names:
+            conn.execute(f'ALTER TABLE assessments ADD COLUMN step{step}_completed INTEGER DEFAULT 0')
+            conn.commit()
+            print(f"Added step{step}_completed column to assessments table")
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_assessments_status_completed ON assessments (status, completed_at)')
+    conn.commit()
+    
+    # Add the score timestamps the wizard steps write
+    score_columns = [col[1] for col in conn.execute("PRAGMA table_info(sdg_scores)").fetchall()]
+    for column in ('created_at', 'updated_at'):
+        if column not in score_columns:
+            conn.execute(f'ALTER TABLE sdg_scores ADD COLUMN {column} TIMESTAMP')
+            conn.commit()
+            print(f"Added {column} column to sdg_scores table")
+    
+    # Add deleted_at for soft-deleting projects
+    project_columns = [col[1] for col in conn.execute("PRAGMA table_info(projects)").fetchall()]
+    if 'deleted_at' not in project_columns:
+        conn.execute('ALTER TABLE projects ADD COLUMN deleted_at TIMESTAMP')
+        conn.commit()
+        print("Added deleted_at column to projects table")
+    conn.execute('''
+        CREATE INDEX IF NOT EXISTS idx_projects_deleted_at ON projects (deleted_at)
+        WHERE deleted_at IS NOT NULL
+    ''')
+    conn.commit()
+    
+    # Add tag_status to evidence_blobs if it was created before tagging existed
+    blob_columns = [col[1] for col in conn.execute("PRAGMA table_info(evidence_blobs)").fetchall()]
+    if blob_columns and 'tag_status' not in blob_columns:
+        conn.execute("ALTER TABLE evidence_blobs ADD COLUMN tag_status TEXT DEFAULT 'pending'")
+        conn.commit()
+        print("Added tag_status column to evidence_blobs table")
+    
+    # Add reminded_on to sdg_actions and the open-actions partial index
+    action_columns = [col[1] for col in conn.execute("PRAGMA table_info(sdg_actions)").fetchall()]
+    if action_columns and 'reminded_on' not in action_columns:
+        conn.execute('ALTER TABLE sdg_actions ADD COLUMN reminded_on DATE')
+        conn.commit()
+        print("Added reminded_on column to sdg_actions table")
+    if action_columns:
+        conn.execute('''
+            CREATE INDEX IF NOT EXISTS idx_sdg_actions_open_due ON sdg_actions (status, target_date)
+            WHERE completion_date IS NULL
+        ''')
+        conn.commit()
+    
+    # Create the mail outbox if the database predates it
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS mail_outbox (
+            id INTEGER PRIMARY KEY,
+            recipient TEXT NOT NULL,
+            subject TEXT NOT NULL,
+            body TEXT,
+            html TEXT,
+            status TEXT DEFAULT 'pending',
+            attempts INTEGER DEFAULT 0,
+            last_error TEXT,
+            next_attempt_at TIMESTAMP,
+            claim_token TEXT,
+            claimed_at TIMESTAMP,
+            sent_at TIMESTAMP,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_mail_outbox_due ON mail_outbox (status, next_attempt_at)')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_mail_outbox_claim ON mail_outbox (claim_token)')
+    conn.commit()
+    
+    # Create the live-update change log and its triggers if the database predates them
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS assessment_changes (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            assessment_id INTEGER NOT NULL,
+            sdg_id INTEGER NOT NULL,
+            score INTEGER,
+            notes TEXT,
+            changed_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+    conn.execute('''
+        CREATE TRIGGER IF NOT EXISTS trg_sdg_scores_insert_change AFTER INSERT ON sdg_scores
+        BEGIN
+            INSERT INTO assessment_changes (assessment_id, sdg_id, score, notes)
+            VALUES (NEW.assessment_id, NEW.sdg_id, NEW.score, NEW.notes);
+        END
+    ''')
+    conn.execute('''
+        CREATE TRIGGER IF NOT EXISTS trg_sdg_scores_update_change AFTER UPDATE OF score, notes ON sdg_scores
+        WHEN OLD.score IS NOT NEW.score OR OLD.notes IS NOT NEW.notes
+        BEGIN
+            INSERT INTO assessment_changes (assessment_id, sdg_id, score, notes)
+            VALUES (NEW.assessment_id, NEW.sdg_id, NEW.score, NEW.notes);
+        END
+    ''')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_assessment_changes_assessment ON assessment_changes (assessment_id, id)')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_assessment_changes_changed_at ON assessment_changes (changed_at)')
+    conn.commit()
+    
+    # Create the maintenance log if the database predates it
+    db_maintenance.ensure_table(conn)
+    conn.commit()
+    
+    # Create the score audit trail if the database predates it
+    score_audit.ensure_table(conn)
+    conn.commit()
+    
+    # Never reuse a purged assessment's id, or the new one would show its audit history
+    if score_audit.autoincrement_assessments(conn):
+        print("Switched assessments table to AUTOINCREMENT ids")
+    
+    # Create the similar-project change log and its triggers if the database predates them
+    similar_projects.ensure_table(conn)
+    conn.commit()
+    
     conn.close()
 
 # Basic routes
@@ -74,14 +386,15 @@ def login():
         email = request.form.get('email')
         password = request.form.get('password')
         
-        conn = get_db_connection()
-        user = conn.execute('SELECT * FROM users WHERE email = ?', (email,)).fetchone()
-        conn.close()
+        storage = get_storage()
+        user = storage.users.get_by_email(email)
+        storage.close()
         
         if user and check_password_hash(user['password_hash'], password):
             session['user_id'] = user['id']
             session['user_name'] = user['name']
             session['is_admin'] = user['is_admin']
+            session['organization'] = user['organization']
             flash('Login successful!', 'success')
             return redirect(url_for('index'))
         
@@ -99,7 +412,19 @@ def logout():
 def forgot_password():
     if request.method == 'POST':
         email = request.form.get('email')
-        # Implementation for password reset would go here
+        
+        conn = get_db_connection()
+        user = conn.execute('SELECT * FROM users WHERE email = ?', (email,)).fetchone()
+        if user:
+            # Queued in the outbox; the background sender delivers it
+            reset_url = url_for('reset_password', token=generate_reset_token(app, user), _external=True)
+            mail_outbox.enqueue(conn, user['email'], 'Reset your SDG Assessment Tool password',
+                                f"Hello {user['name']},\n\n"
+                                f"Use the link below to choose a new password. It expires in one hour.\n\n"
+                                f"{reset_url}\n\n"
+                                f"If you did not ask for a password reset, you can ignore this email.")
+        conn.close()
+        
         flash('If that email is registered, a password reset link has been sent.', 'info')
         return redirect(url_for('login'))
     
@@ -107,19 +432,33 @@ def forgot_password():
 
 @app.route('/reset-password/<token>', methods=['GET', 'POST'])
 def reset_password(token):
-    # Placeholder route for password reset
+    conn = get_db_connection()
+    user = verify_reset_token(app, conn, token)
+    
+    if not user:
+        conn.close()
+        flash('That password reset link is invalid or has expired.', 'danger')
+        return redirect(url_for('forgot_password'))
+    
     if request.method == 'POST':
         password = request.form.get('password')
         password2 = request.form.get('password2')
         
-        if password != password2:
+        if not password or password != password2:
             flash('Passwords do not match', 'danger')
+            conn.close()
             return render_template('auth/reset_password.html', token=token)
         
-        # Actual implementation would validate token and update password
+        # Changing the hash also invalidates the token
+        conn.execute('UPDATE users SET password_hash = ? WHERE id = ?',
+                    (generate_password_hash(password), user['id']))
+        conn.commit()
+        conn.close()
+        
         flash('Your password has been updated. You can now log in.', 'success')
         return redirect(url_for('login'))
     
+    conn.close()
     return render_template('auth/reset_password.html', token=token)
 
 @app.route('/resources')
@@ -132,20 +471,18 @@ def register():
         email = request.form.get('email')
         name = request.form.get('name')
         password = request.form.get('password')
+        organization = (request.form.get('organization') or '').strip() or None
         
-        conn = get_db_connection()
-        user_exists = conn.execute('SELECT id FROM users WHERE email = ?', (email,)).fetchone()
+        storage = get_storage()
+        user_exists = storage.users.get_by_email(email)
         
         if user_exists:
             flash('Email already registered', 'danger')
-            conn.close()
+            storage.close()
             return render_template('auth/register.html')
         
-        password_hash = generate_password_hash(password)
-        conn.execute('INSERT INTO users (email, password_hash, name) VALUES (?, ?, ?)',
-                    (email, password_hash, name))
-        conn.commit()
-        conn.close()
+        storage.users.create(email, generate_password_hash(password), name, organization)
+        storage.close()
         
         flash('Registration successful! You can now log in.', 'success')
         return redirect(url_for('login'))
@@ -158,10 +495,9 @@ def projects():
         flash('Please log in to view your projects', 'warning')
         return redirect(url_for('login'))
     
-    conn = get_db_connection()
-    projects = conn.execute('SELECT * FROM projects WHERE user_id = ?', 
-                          (session['user_id'],)).fetchall()
-    conn.close()
+    storage = get_storage()
+    projects = storage.projects.list_for_user(session['user_id'])
+    storage.close()
     
     return render_template('projects/index.html', projects=projects)
 
@@ -178,13 +514,9 @@ def new_project():
         location = request.form.get('location')
         size_sqm = request.form.get('size_sqm')
         
-        conn = get_db_connection()
-        conn.execute('''
-            INSERT INTO projects (name, description, project_type, location, size_sqm, user_id)
-            VALUES (?, ?, ?, ?, ?, ?)
-        ''', (name, description, project_type, location, size_sqm, session['user_id']))
-        conn.commit()
-        conn.close()
+        storage = get_storage()
+        storage.projects.create(session['user_id'], name, description, project_type, location, size_sqm)
+        storage.close()
         
         flash('Project created successfully!', 'success')
         return redirect(url_for('projects'))
@@ -198,29 +530,118 @@ def show_project(id):
         return redirect(url_for('login'))
     
     conn = get_db_connection()
-    project = conn.execute('SELECT * FROM projects WHERE id = ? AND user_id = ?', 
+    project = conn.execute('SELECT * FROM projects WHERE id = ? AND user_id = ? AND deleted_at IS NULL', 
                          (id, session['user_id'])).fetchone()
     
     # Fetch assessments for this project
     assessments = conn.execute('SELECT * FROM assessments WHERE project_id = ? ORDER BY created_at DESC', 
                             (id,)).fetchall()
-    conn.close()
     
     if not project:
         flash('Project not found or you don\'t have permission to view it', 'danger')
+        conn.close()
         return redirect(url_for('projects'))
     
-    return render_template('projects/show.html', project=project, assessments=assessments)
+    similar_projects = find_similar_projects(conn, id, k=5)
+    conn.close()
+    
+    return render_template('projects/show.html', project=project, assessments=assessments,
+                          similar_projects=similar_projects)
+
+def find_similar_projects(conn, project_id, k=5, metric='cosine', project_type=None, location=None):
+    """Return the k projects whose latest scores are closest to this project's"""
+    similar_index.ensure_current(conn)
+    matches = similar_index.query(project_id, k=k, metric=metric,
+                                  project_type=project_type, location=location)
+    if not matches:
+        return []
+    
+    placeholders = ','.join('?' * len(matches))
+    rows = conn.execute(f'SELECT id, name, project_type, location, user_id FROM projects '
+                        f'WHERE id IN ({placeholders}) AND deleted_at IS NULL',
+                        [match[0] for match in matches]).fetchall()
+    rows = {row['id']: row for row in rows}
+    
+    # Other users' projects are shown without their name or a link
+    score_key = 'similarity' if metric == 'cosine' else 'distance'
+    similar = []
+    for match_id, score in matches:
+        row = rows.get(match_id)
+        if not row:
+            continue
+        own = row['user_id'] == session.get('user_id')
+        similar.append({
+            'id': match_id if own else None,
+            'name': row['name'] if own else None,
+            'project_type': row['project_type'],
+            'location': row['location'],
+            score_key: score
+        })
+    return similar
+
+@app.route('/api/projects/<int:id>/similar')
+def api_similar_projects(id):
+    """JSON list of projects similar to this one"""
+    if not session.get('user_id'):
+        return jsonify({'error': 'Authentication required'}), 401
+    
+    metric = request.args.get('metric', 'cosine')
+    if metric not in METRICS:
+        return jsonify({'error': f'metric must be one of {", ".join(METRICS)}'}), 400
+    k = min(max(request.args.get('k', 5, type=int), 1), 100)
+    
+    conn = get_db_connection(readonly=True)
+    project = conn.execute('SELECT id FROM projects WHERE id = ? AND user_id = ? AND deleted_at IS NULL',
+                         (id, session['user_id'])).fetchone()
+    if not project:
+        conn.close()
+        return jsonify({'error': 'Project not found'}), 404
+    
+    similar = find_similar_projects(conn, id, k=k, metric=metric,
+                                    project_type=request.args.get('project_type'),
+                                    location=request.args.get('location'))
+    conn.close()
+    return jsonify({'project_id': id, 'metric': metric, 'results': similar})
 
 @app.route('/contact', methods=['GET', 'POST'])
 def contact():
     if request.method == 'POST':
-        # Process form data here
-        # You can add email sending functionality later
+        name = request.form.get('name', '')
+        email = request.form.get('email', '')
+        subject = request.form.get('subject') or 'Contact form message'
+        message = request.form.get('message', '')
+        
+        conn = get_db_connection()
+        mail_outbox.enqueue(conn, app.config['CONTACT_EMAIL'], f'[Contact] {subject}',
+                            f"From: {name} <{email}>\n\n{message}")
+        conn.close()
+        
         flash('Your message has been sent. We will contact you soon!', 'success')
         return redirect(url_for('contact'))
     return render_template('contact.html')
 
+def reindex_project(conn, project_id):
+    """Point the peer benchmark and similar-project indexes at a project's latest completed assessment
+
+    Same rule as PeerBenchmark.load and the similar-project snapshot: the
+    completed assessment with the highest id. A project without one, or a
+    deleted project, is dropped from both.
+    """
+    project = conn.execute('SELECT * FROM projects WHERE id = ? AND deleted_at IS NULL', (project_id,)).fetchone()
+    latest = conn.execute('''
+        SELECT id FROM assessments WHERE project_id = ? AND status = 'completed'
+        ORDER BY id DESC LIMIT 1
+    ''', (project_id,)).fetchone()
+    if not project or not latest:
+        peer_benchmark.remove(project_id)
+        similar_index.remove(project_id)
+        return
+    scores = {row['sdg_id']: row['score'] for row in conn.execute(
+        'SELECT sdg_id, score FROM sdg_scores WHERE assessment_id = ?', (latest['id'],)).fetchall()}
+    peer_benchmark.ensure_loaded(conn)
+    peer_benchmark.update(project_id, project['project_type'], project['size_sqm'], scores)
+    similar_index.upsert(project_id, project['project_type'], project['location'], scores)
+
 @app.route('/projects/<int:id>/edit', methods=['GET', 'POST'])
 def edit_project(id):
     if not session.get('user_id'):
@@ -228,7 +649,7 @@ def edit_project(id):
         return redirect(url_for('login'))
     
     conn = get_db_connection()
-    project = conn.execute('SELECT * FROM projects WHERE id = ? AND user_id = ?', 
+    project = conn.execute('SELECT * FROM projects WHERE id = ? AND user_id = ? AND deleted_at IS NULL', 
                          (id, session['user_id'])).fetchone()
     conn.close()
     
@@ -250,6 +671,8 @@ def edit_project(id):
             WHERE id = ? AND user_id = ?
         ''', (name, description, project_type, location, size_sqm, id, session['user_id']))
         conn.commit()
+        # Re-segment the peer benchmark and re-file the similar-project vector under the new type and location
+        reindex_project(conn, id)
         conn.close()
         
         flash('Project updated successfully!', 'success')
@@ -264,7 +687,7 @@ def delete_project(id):
         return redirect(url_for('login'))
     
     conn = get_db_connection()
-    project = conn.execute('SELECT * FROM projects WHERE id = ? AND user_id = ?', 
+    project = conn.execute('SELECT * FROM projects WHERE id = ? AND user_id = ? AND deleted_at IS NULL', 
                          (id, session['user_id'])).fetchone()
     
     if not project:
@@ -272,19 +695,53 @@ def delete_project(id):
         flash('Project not found or you don\'t have permission to delete it', 'danger')
         return redirect(url_for('projects'))
     
-    # First delete all related assessments and their scores/actions
-    conn.execute('DELETE FROM sdg_actions WHERE assessment_id IN (SELECT id FROM assessments WHERE project_id = ?)', (id,))
-    conn.execute('DELETE FROM sdg_scores WHERE assessment_id IN (SELECT id FROM assessments WHERE project_id = ?)', (id,))
-    conn.execute('DELETE FROM assessments WHERE project_id = ?', (id,))
+    # Autosave must check ownership again rather than trust this worker's cache
+    for assessment in conn.execute('SELECT id FROM assessments WHERE project_id = ?', (id,)).fetchall():
+        _autosave_owners.delete((session['user_id'], assessment['id']))
     
-    # Then delete the project
-    conn.execute('DELETE FROM projects WHERE id = ?', (id,))
-    conn.commit()
+    # Only mark it deleted; its rows are purged in the background after the undo window
+    project_purge.soft_delete(conn, id, session['user_id'])
     conn.close()
+    peer_benchmark.remove(id)
+    similar_index.remove(id)
     
-    flash('Project and all related assessments have been deleted', 'success')
+    hours = app.config['PROJECT_UNDO_SECONDS'] // 3600
+    flash(f'Project deleted. You can restore it from Deleted projects for the next {hours} hours.', 'success')
     return redirect(url_for('projects'))
 
+@app.route('/projects/deleted')
+def deleted_projects():
+    """Deleted projects that can still be restored"""
+    if not session.get('user_id'):
+        flash('Please log in to view your projects', 'warning')
+        return redirect(url_for('login'))
+    
+    conn = get_db_connection()
+    projects = project_purge.deleted_projects(conn, session['user_id'], app.config['PROJECT_UNDO_SECONDS'])
+    conn.close()
+    
+    return render_template('projects/deleted.html', projects=projects,
+                          undo_seconds=app.config['PROJECT_UNDO_SECONDS'])
+
+@app.route('/projects/<int:id>/restore', methods=['POST'])
+def restore_project(id):
+    if not session.get('user_id'):
+        flash('Please log in to restore this project', 'warning')
+        return redirect(url_for('login'))
+    
+    conn = get_db_connection()
+    if not project_purge.restore(conn, id, session['user_id'], app.config['PROJECT_UNDO_SECONDS']):
+        conn.close()
+        flash('Project not found or it can no longer be restored', 'danger')
+        return redirect(url_for('deleted_projects'))
+    
+    # Put the latest finalized scores back into the indexes they were dropped from
+    reindex_project(conn, id)
+    conn.close()
+    
+    flash('Project restored', 'success')
+    return redirect(url_for('show_project', id=id))
+
 # Assessment routes for app_simple.py
 @app.route('/projects/<int:project_id>/assessments/step1', methods=['GET', 'POST'])
 def assessment_step1(project_id):
@@ -295,7 +752,7 @@ def assessment_step1(project_id):
     
     # Get database connection
     conn = get_db_connection()
-    project = conn.execute('SELECT * FROM projects WHERE id = ? AND user_id = ?', 
+    project = conn.execute('SELECT * FROM projects WHERE id = ? AND user_id = ? AND deleted_at IS NULL', 
                          (project_id, session['user_id'])).fetchone()
     
     if not project:
@@ -309,7 +766,7 @@ def assessment_step1(project_id):
     assessment_id = assessment['id'] if assessment else None
     
     # Prepare context manually for Step 1
-    sdgs = conn.execute('SELECT * FROM sdg_goals ORDER BY number').fetchall()
+    sdgs = sdg_catalogue(conn)
     scores = {}
 
     if assessment_id:
@@ -330,110 +787,10 @@ def assessment_step1(project_id):
         15: '#56C02B'   # Light Green
     }
     
-    sdg_titles = {
-        1: 'No Poverty',
-        2: 'Zero Hunger',
-        3: 'Good Health and Well-being',
-        6: 'Clean Water and Sanitation',
-        13: 'Climate Action',
-        14: 'Life Below Water',
-        15: 'Life on Land'        
-    }
-    
-    sdg_subtitles = {
-        1: 'End poverty in all its forms everywhere',
-        2: 'End hunger, achieve food security and improved nutrition',
-        3: 'Ensure healthy lives and promote well-being for all',
-        6: 'Ensure availability and sustainable management of water',
-        13: 'Take urgent action to combat climate change and its impacts',
-        14: 'Conserve and sustainably use the oceans, seas and marine resources',
-        15: 'Protect, restore and promote sustainable use of terrestrial ecosystems'
-    }
-    
-    sdg_targets = {
-        1: [
-            {'code': '1.4', 'text': 'By 2030, ensure that all people have equal rights to economic resources, basic services, ownership and control over land and property'},
-            {'code': '1.5', 'text': 'Build the resilience of the poor to reduce their exposure to climate-related extreme events and disasters'}
-        ],
-        2: [
-            {'code': '2.1', 'text': 'By 2030, end hunger and ensure access to safe, nutritious food'},
-            {'code': '2.4', 'text': 'By 2030, ensure sustainable food production systems and resilient agricultural practices'}
-        ],
-        3: [
-            {'code': '3.4', 'text': 'Reduce premature mortality from non-communicable diseases and promote mental health and well-being'},
-            {'code': '3.9', 'text': 'Reduce deaths and illnesses from hazardous chemicals and air, water and soil pollution'}
-        ],
-        6: [
-            {'code': '6.1', 'text': 'By 2030, achieve universal and equitable access to safe and affordable drinking water'},
-            {'code': '6.2', 'text': 'By 2030, achieve access to adequate and equitable sanitation and hygiene'},
-            {'code': '6.3', 'text': 'By 2030, improve water quality by reducing pollution and increasing recycling and safe reuse'},
-            {'code': '6.4', 'text': 'By 2030, substantially increase water-use efficiency across all sectors'}
-        ],
-        13: [
-            {'code': '13.1', 'text': 'Strengthen resilience and adaptive capacity to climate-related hazards'},
-            {'code': '13.2', 'text': 'Integrate climate change measures into policies and planning'},
-            {'code': '13.3', 'text': 'Improve education and capacity on climate change mitigation and adaptation'}
-        ],
-        14: [
-            {'code': '14.1', 'text': 'Prevent and reduce marine pollution of all kinds'},
-            {'code': '14.2', 'text': 'Sustainably manage and protect marine and coastal ecosystems'}
-        ],
-        15: [
-            {'code': '15.1', 'text': 'Ensure conservation of terrestrial and inland freshwater ecosystems'},
-            {'code': '15.2', 'text': 'Promote sustainable management of forests'},
-            {'code': '15.5', 'text': 'Take action to reduce degradation of natural habitats and halt biodiversity loss'}
-        ]
-    }
-    
-    sdg_applications = {
-        1: [
-            'Energy poverty reduction through efficient building design',
-            'Affordable housing solutions using sustainable materials',
-            'Disaster resilience in vulnerable communities',
-            'Inclusive design for all socioeconomic backgrounds'
-        ],
-        2: [
-            'Urban agriculture integration in building designs',
-            'Food storage solutions to reduce waste',
-            'Community food spaces and markets',
-            'Water-efficient design for food production'
-        ],
-        3: [
-            'Healthy buildings with adequate ventilation and natural light',
-            'Biophilic design to reduce stress and improve mental health',
-            'Active design that encourages physical activity',
-            'Healthcare facilities and wellness centers',
-            'Air quality management systems'
-        ],
-        6: [
-            'Water-efficient fixtures and appliances',
-            'Rainwater harvesting and greywater recycling',
-            'Sustainable drainage solutions',
-            'On-site wastewater treatment',
-            'Water-sensitive urban design'
-        ],
-        13: [
-            'Low-carbon or carbon-neutral design strategies',
-            'Climate-resilient building techniques',
-            'Design for extreme weather events',
-            'Urban heat island mitigation',
-            'Carbon sequestration in building materials and landscapes'
-        ],
-        14: [
-            'Responsible waterfront development',
-            'Stormwater management to prevent water pollution',
-            'Wastewater treatment and recycling',
-            'Prevention of harmful runoff into water bodies',
-            'Marine-friendly construction practices'
-        ],
-        15: [
-            'Biodiversity-friendly site planning',
-            'Native plant species selection',
-            'Preservation of habitats and ecological corridors',
-            'Sustainable forestry practices in material sourcing',
-            'Green roofs and walls for biodiversity'
-        ]
-    }
+    sdg_titles = SDG_TITLES
+    sdg_subtitles = SDG_SUBTITLES
+    sdg_targets = SDG_TARGETS
+    sdg_applications = SDG_APPLICATIONS
     
     sdg_resources = {
         1: [
@@ -495,6 +852,10 @@ def assessment_step1(project_id):
     ]
     
     if request.method == 'POST':
+        # Write this worker's pending autosave first; other workers drop theirs once this save bumps row_version
+        if assessment_id:
+            autosave_buffer.flush(assessment_id)
+        
         # Process form submission
         scores = {}
         notes = {}
@@ -521,8 +882,15 @@ def assessment_step1(project_id):
             assessment = conn.execute('SELECT * FROM assessments WHERE project_id = ?', 
                                    (project_id,)).fetchone()
             assessment_id = assessment['id']
+        else:
+            # Claim the next row version; fails if someone saved since this form was loaded
+            try:
+                begin_write(conn, assessment_id, request.form.get('row_version', type=int))
+            except VersionConflict as conflict:
+                return render_version_conflict(conn, project, assessment, conflict)
         
         # Update scores and notes
+        scores_before = score_audit.read_scores(conn, assessment_id)
         for sdg, score in scores.items():
             existing_score = conn.execute('''
                 SELECT id FROM sdg_scores 
@@ -550,6 +918,9 @@ def assessment_step1(project_id):
         ''', (assessment_id,))
         
         conn.commit()
+        audit_score_changes(conn, assessment_id, scores_before)
+        if assessment['status'] == 'completed':
+            reindex_project(conn, project['id'])
         flash('Assessment step 1 saved successfully!', 'success')
         return redirect(url_for('assessment_step2', project_id=project_id, assessment_id=assessment_id))
     
@@ -573,6 +944,7 @@ def assessment_step1(project_id):
     return render_template('assessments/assessment_step1.html',
                           project=project,
                           assessment_id=assessment_id,
+                          row_version=assessment['row_version'] if assessment else None,
                           sdgs=sdgs,
                           form_data=form_data,
                           sdg_colors=sdg_colors,
@@ -581,7 +953,8 @@ def assessment_step1(project_id):
                           sdg_targets=sdg_targets,
                           sdg_applications=sdg_applications,
                           sdg_resources=sdg_resources,
-                          sdg_connections=sdg_connections)
+                          sdg_connections=sdg_connections,
+                          sdg_suggestions=suggest_for_project(project))
 
 @app.route('/projects/<int:project_id>/assessments/<int:assessment_id>/step2', methods=['GET', 'POST'])
 def assessment_step2(project_id, assessment_id):
@@ -595,7 +968,7 @@ def assessment_step2(project_id, assessment_id):
     conn = get_db_connection()
     
     # Get project and assessment data
-    project = conn.execute('SELECT * FROM projects WHERE id = ? AND user_id = ?', 
+    project = conn.execute('SELECT * FROM projects WHERE id = ? AND user_id = ? AND deleted_at IS NULL', 
                          (project_id, session['user_id'])).fetchone()
     assessment = conn.execute('SELECT * FROM assessments WHERE id = ? AND project_id = ?', 
                             (assessment_id, project_id)).fetchone()
@@ -607,10 +980,20 @@ def assessment_step2(project_id, assessment_id):
         return redirect(url_for('projects'))
     
     # Get all SDGs
-    sdgs = conn.execute('SELECT * FROM sdg_goals ORDER BY number').fetchall()
+    sdgs = sdg_catalogue(conn)
     
     # Handle form submission
     if request.method == 'POST':
+        # Write this worker's pending autosave first; other workers drop theirs once this save bumps row_version
+        autosave_buffer.flush(assessment_id)
+        
+        # Claim the next row version; fails if someone saved since this form was loaded
+        try:
+            begin_write(conn, assessment_id, request.form.get('row_version', type=int))
+        except VersionConflict as conflict:
+            return render_version_conflict(conn, project, assessment, conflict)
+        
+        scores_before = score_audit.read_scores(conn, assessment_id)
         # Process SDG scores for step 2 (SDGs 4, 5, 8, 10)
         step2_sdgs = [4, 5, 8, 10]
         for sdg_number in step2_sdgs:
@@ -647,6 +1030,9 @@ def assessment_step2(project_id, assessment_id):
         )
         
         conn.commit()
+        audit_score_changes(conn, assessment_id, scores_before)
+        if assessment['status'] == 'completed':
+            reindex_project(conn, project['id'])
         conn.close()
         
         flash('Assessment step 2 saved successfully!', 'success')
@@ -693,9 +1079,11 @@ def assessment_step2(project_id, assessment_id):
         project=project,
         assessment=assessment,
         assessment_id=assessment_id,
+        row_version=assessment['row_version'],
         sdgs=sdgs,
         scores=scores,
-        sdg_resources=sdg_resources
+        sdg_resources=sdg_resources,
+        sdg_suggestions=suggest_for_project(project)
     )
 
 @app.route('/projects/<int:project_id>/assessments/<int:assessment_id>/step3', methods=['GET', 'POST'])
@@ -706,7 +1094,7 @@ def assessment_step3(project_id, assessment_id):
         return redirect(url_for('login'))
     
     conn = get_db_connection()
-    project = conn.execute('SELECT * FROM projects WHERE id = ? AND user_id = ?', 
+    project = conn.execute('SELECT * FROM projects WHERE id = ? AND user_id = ? AND deleted_at IS NULL', 
                          (project_id, session['user_id'])).fetchone()
     assessment = conn.execute('SELECT * FROM assessments WHERE id = ? AND project_id = ?', 
                             (assessment_id, project_id)).fetchone()
@@ -717,9 +1105,19 @@ def assessment_step3(project_id, assessment_id):
         return redirect(url_for('projects'))
     
     # Get all SDGs
-    sdgs = conn.execute('SELECT * FROM sdg_goals ORDER BY number').fetchall()
+    sdgs = sdg_catalogue(conn)
     
     if request.method == 'POST':
+        # Write this worker's pending autosave first; other workers drop theirs once this save bumps row_version
+        autosave_buffer.flush(assessment_id)
+        
+        # Claim the next row version; fails if someone saved since this form was loaded
+        try:
+            begin_write(conn, assessment_id, request.form.get('row_version', type=int))
+        except VersionConflict as conflict:
+            return render_version_conflict(conn, project, assessment, conflict)
+        
+        scores_before = score_audit.read_scores(conn, assessment_id)
         # Process SDG scores for step 3 (SDGs 7, 9, 11, 12)
         step3_sdgs = [7, 9, 11, 12]
         for sdg_number in step3_sdgs:
@@ -751,6 +1149,9 @@ def assessment_step3(project_id, assessment_id):
         )
         
         conn.commit()
+        audit_score_changes(conn, assessment_id, scores_before)
+        if assessment['status'] == 'completed':
+            reindex_project(conn, project['id'])
         flash('Step 3 saved successfully!', 'success')
         return redirect(url_for('assessment_step4', project_id=project_id, assessment_id=assessment_id))
     
@@ -791,9 +1192,11 @@ def assessment_step3(project_id, assessment_id):
                         project=project,
                         assessment=assessment,
                         assessment_id=assessment_id,
+                        row_version=assessment['row_version'],
                         sdgs=sdgs,
                         scores=scores,
-                        sdg_resources=sdg_resources)
+                        sdg_resources=sdg_resources,
+                        sdg_suggestions=suggest_for_project(project))
 
 @app.route('/projects/<int:project_id>/assessments/<int:assessment_id>/step4', methods=['GET', 'POST'])
 def assessment_step4(project_id, assessment_id):
@@ -803,7 +1206,7 @@ def assessment_step4(project_id, assessment_id):
         return redirect(url_for('login'))
     
     conn = get_db_connection()
-    project = conn.execute('SELECT * FROM projects WHERE id = ? AND user_id = ?', 
+    project = conn.execute('SELECT * FROM projects WHERE id = ? AND user_id = ? AND deleted_at IS NULL', 
                          (project_id, session['user_id'])).fetchone()
     assessment = conn.execute('SELECT * FROM assessments WHERE id = ? AND project_id = ?', 
                             (assessment_id, project_id)).fetchone()
@@ -814,9 +1217,19 @@ def assessment_step4(project_id, assessment_id):
         return redirect(url_for('projects'))
     
     # Get all SDGs
-    sdgs = conn.execute('SELECT * FROM sdg_goals ORDER BY number').fetchall()
+    sdgs = sdg_catalogue(conn)
     
     if request.method == 'POST':
+        # Write this worker's pending autosave first; other workers drop theirs once this save bumps row_version
+        autosave_buffer.flush(assessment_id)
+        
+        # Claim the next row version; fails if someone saved since this form was loaded
+        try:
+            begin_write(conn, assessment_id, request.form.get('row_version', type=int))
+        except VersionConflict as conflict:
+            return render_version_conflict(conn, project, assessment, conflict)
+        
+        scores_before = score_audit.read_scores(conn, assessment_id)
         # Process SDG scores for step 4 (SDGs 13, 14, 15)
         step4_sdgs = [13, 14, 15]
         for sdg_number in step4_sdgs:
@@ -848,6 +1261,9 @@ def assessment_step4(project_id, assessment_id):
         )
         
         conn.commit()
+        audit_score_changes(conn, assessment_id, scores_before)
+        if assessment['status'] == 'completed':
+            reindex_project(conn, project['id'])
         flash('Step 4 saved successfully!', 'success')
         return redirect(url_for('assessment_step5', project_id=project_id, assessment_id=assessment_id))
     
@@ -865,58 +1281,10 @@ def assessment_step4(project_id, assessment_id):
         15: '#56C02B'   # Light Green
     }
     
-    sdg_titles = {
-        13: 'Climate Action',
-        14: 'Life Below Water',
-        15: 'Life on Land'        
-    }
-    
-    sdg_subtitles = {
-        13: 'Take urgent action to combat climate change and its impacts',
-        14: 'Conserve and sustainably use the oceans, seas and marine resources',
-        15: 'Protect, restore and promote sustainable use of terrestrial ecosystems'
-    }
-    
-    sdg_targets = {
-        13: [
-            {'code': '13.1', 'text': 'Strengthen resilience and adaptive capacity to climate-related hazards'},
-            {'code': '13.2', 'text': 'Integrate climate change measures into policies and planning'},
-            {'code': '13.3', 'text': 'Improve education and capacity on climate change mitigation and adaptation'}
-        ],
-        14: [
-            {'code': '14.1', 'text': 'Prevent and reduce marine pollution of all kinds'},
-            {'code': '14.2', 'text': 'Sustainably manage and protect marine and coastal ecosystems'}
-        ],
-        15: [
-            {'code': '15.1', 'text': 'Ensure conservation of terrestrial and inland freshwater ecosystems'},
-            {'code': '15.2', 'text': 'Promote sustainable management of forests'},
-            {'code': '15.5', 'text': 'Take action to reduce degradation of natural habitats and halt biodiversity loss'}
-        ]
-    }
-    
-    sdg_applications = {
-        13: [
-            'Low-carbon or carbon-neutral design strategies',
-            'Climate-resilient building techniques',
-            'Design for extreme weather events',
-            'Urban heat island mitigation',
-            'Carbon sequestration in building materials and landscapes'
-        ],
-        14: [
-            'Responsible waterfront development',
-            'Stormwater management to prevent water pollution',
-            'Wastewater treatment and recycling',
-            'Prevention of harmful runoff into water bodies',
-            'Marine-friendly construction practices'
-        ],
-        15: [
-            'Biodiversity-friendly site planning',
-            'Native plant species selection',
-            'Preservation of habitats and ecological corridors',
-            'Sustainable forestry practices in material sourcing',
-            'Green roofs and walls for biodiversity'
-        ]
-    }
+    sdg_titles = {n: SDG_TITLES[n] for n in (13, 14, 15)}
+    sdg_subtitles = {n: SDG_SUBTITLES[n] for n in (13, 14, 15)}
+    sdg_targets = {n: SDG_TARGETS[n] for n in (13, 14, 15)}
+    sdg_applications = {n: SDG_APPLICATIONS[n] for n in (13, 14, 15)}
     
     sdg_resources = {
         13: [
@@ -942,6 +1310,7 @@ def assessment_step4(project_id, assessment_id):
                           project=project,
                           assessment=assessment,
                           assessment_id=assessment_id,
+                          row_version=assessment['row_version'],
                           sdgs=sdgs,
                           scores=scores,
                           sdg_colors=sdg_colors,
@@ -949,7 +1318,8 @@ def assessment_step4(project_id, assessment_id):
                           sdg_subtitles=sdg_subtitles,
                           sdg_targets=sdg_targets,
                           sdg_applications=sdg_applications,
-                          sdg_resources=sdg_resources)
+                          sdg_resources=sdg_resources,
+                          sdg_suggestions=suggest_for_project(project))
 
 @app.route('/projects/<int:project_id>/assessments/step5', methods=['GET', 'POST'])
 @app.route('/projects/<int:project_id>/assessments/<int:assessment_id>/step5', methods=['GET', 'POST'])
@@ -974,7 +1344,7 @@ def assessment_step5(project_id, assessment_id=None):
         return redirect(url_for('login'))
     
     conn = get_db_connection()
-    project = conn.execute('SELECT * FROM projects WHERE id = ? AND user_id = ?', 
+    project = conn.execute('SELECT * FROM projects WHERE id = ? AND user_id = ? AND deleted_at IS NULL', 
                      (project_id, session['user_id'])).fetchone()
     assessment = conn.execute('SELECT * FROM assessments WHERE id = ? AND project_id = ?', 
                         (assessment_id, project_id)).fetchone()
@@ -985,9 +1355,19 @@ def assessment_step5(project_id, assessment_id=None):
         return redirect(url_for('projects'))
     
     # Get all SDGs
-    sdgs = conn.execute('SELECT * FROM sdg_goals ORDER BY number').fetchall()
+    sdgs = sdg_catalogue(conn)
     
     if request.method == 'POST':
+        # Write this worker's pending autosave first; other workers drop theirs once this save bumps row_version
+        autosave_buffer.flush(assessment_id)
+        
+        # Claim the next row version; fails if someone saved since this form was loaded
+        try:
+            begin_write(conn, assessment_id, request.form.get('row_version', type=int))
+        except VersionConflict as conflict:
+            return render_version_conflict(conn, project, assessment, conflict)
+        
+        scores_before = score_audit.read_scores(conn, assessment_id)
         # Process SDG scores for step 5 (SDGs 16, 17)
         step5_sdgs = [16, 17]
         for sdg_number in step5_sdgs:
@@ -1019,6 +1399,9 @@ def assessment_step5(project_id, assessment_id=None):
         )
         
         conn.commit()
+        audit_score_changes(conn, assessment_id, scores_before)
+        if assessment['status'] == 'completed':
+            reindex_project(conn, project['id'])
         flash('Step 5 saved successfully!', 'success')
         return redirect(url_for('show_assessment', id=assessment_id))
     
@@ -1049,9 +1432,11 @@ def assessment_step5(project_id, assessment_id=None):
                           project=project,
                           assessment=assessment,
                           assessment_id=assessment_id,
+                          row_version=assessment['row_version'],
                           sdgs=sdgs,
                           scores=scores,
-                          sdg_resources=sdg_resources)
+                          sdg_resources=sdg_resources,
+                          sdg_suggestions=suggest_for_project(project))
 
 @app.route('/assessments/<int:id>')
 def show_assessment(id):
@@ -1060,7 +1445,7 @@ def show_assessment(id):
         flash('Please log in to view assessment results', 'warning')
         return redirect(url_for('login'))
     
-    conn = get_db_connection()
+    conn = get_db_connection(readonly=True)
     assessment = conn.execute('SELECT * FROM assessments WHERE id = ?', (id,)).fetchone()
     
     if not assessment:
@@ -1068,20 +1453,29 @@ def show_assessment(id):
         conn.close()
         return redirect(url_for('projects'))
     
-    project = conn.execute('SELECT * FROM projects WHERE id = ?', (assessment['project_id'],)).fetchone()
+    project = conn.execute('SELECT * FROM projects WHERE id = ? AND deleted_at IS NULL',
+                           (assessment['project_id'],)).fetchone()
     
-    if project['user_id'] != session['user_id']:
+    if not project or project['user_id'] != session['user_id']:
         flash('You do not have permission to view this assessment', 'danger')
         conn.close()
         return redirect(url_for('projects'))
     
     # Get all SDGs
-    sdgs = conn.execute('SELECT * FROM sdg_goals ORDER BY number').fetchall()
+    sdgs = sdg_catalogue(conn)
     
     # Get assessment scores
     scores_data = conn.execute('SELECT * FROM sdg_scores WHERE assessment_id = ?', (id,)).fetchall()
     scores = {score['sdg_id']: score for score in scores_data}
     
+    # Rank each score against projects of the same type and size band
+    peer_benchmark.ensure_loaded(conn)
+    peer_percentiles = peer_benchmark.percentiles(
+        project, {sdg_id: score['score'] for sdg_id, score in scores.items()})
+    
+    evidence_files = evidence.list_for_assessment(conn, id)
+    evidence_tags = evidence_tagging.tags_for_assessment(conn, id)
+    
     conn.close()
     
     return render_template('assessments/show.html',
@@ -1090,7 +1484,10 @@ def show_assessment(id):
                           project_name=project['name'],
                           project_id=project['id'],
                           sdgs=sdgs,
-                          scores=scores)
+                          scores=scores,
+                          peer_percentiles=peer_percentiles,
+                          evidence_files=evidence_files,
+                          evidence_tags=evidence_tags)
 
 @app.route('/assessments/<int:id>/edit', methods=['GET', 'POST'])
 def edit_assessment(id):
@@ -1107,18 +1504,29 @@ def edit_assessment(id):
         conn.close()
         return redirect(url_for('projects'))
     
-    project = conn.execute('SELECT * FROM projects WHERE id = ?', (assessment['project_id'],)).fetchone()
+    project = conn.execute('SELECT * FROM projects WHERE id = ? AND deleted_at IS NULL',
+                           (assessment['project_id'],)).fetchone()
     
-    if project['user_id'] != session['user_id']:
+    if not project or project['user_id'] != session['user_id']:
         flash('You do not have permission to edit this assessment', 'danger')
         conn.close()
         return redirect(url_for('projects'))
     
     # Get all SDGs
-    sdgs = conn.execute('SELECT * FROM sdg_goals ORDER BY number').fetchall()
+    sdgs = sdg_catalogue(conn)
     
     if request.method == 'POST':
+        # Write this worker's pending autosave first; other workers drop theirs once this save bumps row_version
+        autosave_buffer.flush(id)
+        
+        # Claim the next row version; fails if someone saved since this form was loaded
+        try:
+            begin_write(conn, id, request.form.get('row_version', type=int))
+        except VersionConflict as conflict:
+            return render_version_conflict(conn, project, assessment, conflict)
+        
         # Process all SDG scores
+        scores_before = score_audit.read_scores(conn, id)
         for sdg in sdgs:
             score_value = request.form.get(f'score_{sdg["id"]}')
             notes = request.form.get(f'notes_{sdg["id"]}')
@@ -1146,6 +1554,9 @@ def edit_assessment(id):
         )
         
         conn.commit()
+        audit_score_changes(conn, id, scores_before)
+        if assessment['status'] == 'completed':
+            reindex_project(conn, project['id'])
         flash('Assessment updated successfully!', 'success')
         return redirect(url_for('show_assessment', id=id))
     
@@ -1157,11 +1568,28 @@ def edit_assessment(id):
     
     return render_template('assessments/edit.html',
                           assessment=assessment,
+                          row_version=assessment['row_version'],
                           project_id=project['id'],
                           project_name=project['name'],
                           sdgs=sdgs,
                           scores=scores)
 
+def render_version_conflict(conn, project, assessment, conflict):
+    """Show a field-level merge when the assessment changed under the editor"""
+    conflicts, unchanged = field_merge(conn, assessment['id'], request.form)
+    sdgs = {sdg['id']: sdg for sdg in sdg_catalogue(conn)}
+    conn.close()
+    
+    flash('Someone else saved this assessment while you were editing. Please review the differences.', 'warning')
+    return render_template('assessments/conflict.html',
+                          project=project,
+                          assessment=assessment,
+                          sdgs=sdgs,
+                          conflicts=conflicts,
+                          unchanged=unchanged,
+                          row_version=conflict.current,
+                          action_url=request.path), 409
+
 @app.route('/assessments/<int:assessment_id>/finalize', methods=['POST'])
 def finalize_assessment(assessment_id):
     """Finalize an assessment"""
@@ -1177,16 +1605,17 @@ def finalize_assessment(assessment_id):
         conn.close()
         return redirect(url_for('projects'))
     
-    project = conn.execute('SELECT * FROM projects WHERE id = ?', (assessment['project_id'],)).fetchone()
+    project = conn.execute('SELECT * FROM projects WHERE id = ? AND deleted_at IS NULL',
+                           (assessment['project_id'],)).fetchone()
     
-    if project['user_id'] != session['user_id']:
+    if not project or project['user_id'] != session['user_id']:
         flash('You do not have permission to finalize this assessment', 'danger')
         conn.close()
         return redirect(url_for('projects'))
     
     # Calculate overall score
     scores = conn.execute(
-        'SELECT score FROM sdg_scores WHERE assessment_id = ?',
+        'SELECT sdg_id, score FROM sdg_scores WHERE assessment_id = ?',
         (assessment_id,)
     ).fetchall()
     
@@ -1197,9 +1626,12 @@ def finalize_assessment(assessment_id):
     # Update assessment
     conn.execute(
         'UPDATE assessments SET status = ?, completed_at = ?, overall_score = ?, updated_at = ? WHERE id = ?',
-        ('completed', datetime.now(), overall_score, datetime.now(), assessment_id)
+        ('completed', db_types.utcnow(), overall_score, db_types.utcnow(), assessment_id)
     )
     conn.commit()
+    
+    # Keep the peer benchmark and similar-project indexes current without rescanning sdg_scores
+    reindex_project(conn, project['id'])
     conn.close()
     
     flash('Assessment has been finalized successfully!', 'success')
@@ -1216,6 +1648,479 @@ def export_assessment_pdf(id):
     flash('PDF export functionality is not implemented yet', 'info')
     return redirect(url_for('show_assessment', id=id))
 
+@app.route('/assessments/<int:assessment_id>/scores/<int:sdg_id>/evidence', methods=['POST'])
+def upload_evidence(assessment_id, sdg_id):
+    """Attach an evidence file to one SDG score of an assessment"""
+    if not session.get('user_id'):
+        flash('Please log in to upload evidence', 'warning')
+        return redirect(url_for('login'))
+    
+    conn = get_db_connection()
+    assessment = conn.execute('''
+        SELECT a.id FROM assessments a JOIN projects p ON p.id = a.project_id
+        WHERE a.id = ? AND p.user_id = ? AND p.deleted_at IS NULL
+    ''', (assessment_id, session['user_id'])).fetchone()
+    
+    if not assessment:
+        flash('Assessment not found or you don\'t have permission', 'danger')
+        conn.close()
+        return redirect(url_for('projects'))
+    
+    upload = request.files.get('file')
+    if not upload or not upload.filename:
+        flash('Please choose a file to upload', 'warning')
+        conn.close()
+        return redirect(url_for('show_assessment', id=assessment_id))
+    
+    try:
+        _, digest, created = evidence.attach(conn, assessment_id, sdg_id, session['user_id'], upload,
+                                             upload_folder(), app.config['MAX_CONTENT_LENGTH'])
+        if created:
+            evidence_tagging.schedule(evidence.conn_path(conn), upload_folder(),
+                                      digest, upload.mimetype)
+        flash('Evidence uploaded successfully!', 'success')
+    except ValueError as e:
+        flash(str(e), 'danger')
+    finally:
+        conn.close()
+    
+    return redirect(url_for('show_assessment', id=assessment_id))
+
+def get_owned_evidence(conn, evidence_id):
+    """Return an evidence row if it belongs to one of the current user's projects"""
+    return conn.execute('''
+        SELECT e.*, b.size, b.content_type, b.preview_status
+        FROM evidence e
+        JOIN evidence_blobs b ON b.sha256 = e.sha256
+        JOIN assessments a ON a.id = e.assessment_id
+        JOIN projects p ON p.id = a.project_id
+        WHERE e.id = ? AND p.user_id = ? AND p.deleted_at IS NULL
+    ''', (evidence_id, session['user_id'])).fetchone()
+
+@app.route('/evidence/<int:id>')
+def download_evidence(id):
+    """Download an evidence file (supports Range requests)"""
+    if not session.get('user_id'):
+        flash('Please log in to download evidence', 'warning')
+        return redirect(url_for('login'))
+    
+    conn = get_db_connection()
+    item = get_owned_evidence(conn, id)
+    conn.close()
+    
+    if not item:
+        abort(404)
+    
+    # conditional=True lets Werkzeug answer Range and If-None-Match requests
+    return send_file(evidence.blob_path(upload_folder(), item['sha256']),
+                     mimetype=item['content_type'],
+                     as_attachment=True,
+                     download_name=item['filename'],
+                     conditional=True,
+                     etag=item['sha256'],
+                     max_age=3600)
+
+@app.route('/evidence/<int:id>/preview')
+def preview_evidence(id):
+    """Serve the generated thumbnail or text excerpt of an evidence file"""
+    if not session.get('user_id'):
+        abort(401)
+    
+    conn = get_db_connection()
+    item = get_owned_evidence(conn, id)
+    conn.close()
+    
+    if not item or item['preview_status'] not in ('png', 'txt'):
+        abort(404)
+    
+    kind = item['preview_status']
+    return send_file(evidence.preview_path(upload_folder(), item['sha256'], kind),
+                     mimetype='image/png' if kind == 'png' else 'text/plain',
+                     conditional=True,
+                     max_age=3600)
+
+@app.route('/evidence/<int:id>/delete', methods=['POST'])
+def delete_evidence(id):
+    """Remove an evidence attachment"""
+    if not session.get('user_id'):
+        flash('Please log in to delete evidence', 'warning')
+        return redirect(url_for('login'))
+    
+    conn = get_db_connection()
+    item = get_owned_evidence(conn, id)
+    
+    if not item:
+        conn.close()
+        flash('Evidence not found or you don\'t have permission to delete it', 'danger')
+        return redirect(url_for('projects'))
+    
+    evidence.detach(conn, id, upload_folder())
+    conn.close()
+    
+    flash('Evidence deleted', 'success')
+    return redirect(url_for('show_assessment', id=item['assessment_id']))
+
+@app.route('/assessments/<int:assessment_id>/actions', methods=['GET', 'POST'])
+def assessment_actions(assessment_id):
+    """List and add action plan items for an assessment"""
+    if not session.get('user_id'):
+        flash('Please log in to manage actions', 'warning')
+        return redirect(url_for('login'))
+    
+    conn = get_db_connection()
+    assessment = conn.execute('SELECT * FROM assessments WHERE id = ?', (assessment_id,)).fetchone()
+    
+    if not assessment:
+        flash('Assessment not found', 'danger')
+        conn.close()
+        return redirect(url_for('projects'))
+    
+    project = conn.execute('SELECT * FROM projects WHERE id = ? AND deleted_at IS NULL',
+                           (assessment['project_id'],)).fetchone()
+    
+    if not project or project['user_id'] != session['user_id']:
+        flash('You do not have permission to manage actions for this assessment', 'danger')
+        conn.close()
+        return redirect(url_for('projects'))
+    
+    if request.method == 'POST':
+        description = (request.form.get('description') or '').strip()
+        sdg_id = request.form.get('sdg_id', type=int)
+        
+        if not description or not sdg_id:
+            flash('Please choose an SDG and describe the action', 'warning')
+        else:
+            action_plans.create_action(conn, assessment_id, sdg_id, description,
+                                       request.form.get('target_date'))
+            flash('Action added successfully!', 'success')
+        conn.close()
+        return redirect(url_for('assessment_actions', assessment_id=assessment_id))
+    
+    actions = action_plans.list_actions(conn, assessment_id)
+    sdgs = sdg_catalogue(conn)
+    conn.close()
+    
+    return render_template('actions/index.html',
+                          assessment=assessment,
+                          project=project,
+                          actions=actions,
+                          sdgs=sdgs,
+                          statuses=action_plans.ACTION_STATUSES,
+                          today=date.today())
+
+@app.route('/actions/<int:id>/update', methods=['POST'])
+def update_action(id):
+    """Change the status, text or target date of an action"""
+    if not session.get('user_id'):
+        flash('Please log in to update actions', 'warning')
+        return redirect(url_for('login'))
+    
+    conn = get_db_connection()
+    action = conn.execute('''
+        SELECT act.id, act.assessment_id FROM sdg_actions act
+        JOIN assessments a ON a.id = act.assessment_id
+        JOIN projects p ON p.id = a.project_id
+        WHERE act.id = ? AND p.user_id = ? AND p.deleted_at IS NULL
+    ''', (id, session['user_id'])).fetchone()
+    
+    if not action:
+        conn.close()
+        flash('Action not found or you don\'t have permission to update it', 'danger')
+        return redirect(url_for('projects'))
+    
+    try:
+        action_plans.update_action(conn, id, request.form.get('status', 'planned'),
+                                   request.form.get('description'),
+                                   request.form.get('target_date'))
+        flash('Action updated', 'success')
+    except ValueError as e:
+        flash(str(e), 'danger')
+    conn.close()
+    
+    if request.form.get('next') == 'overdue':
+        return redirect(url_for('overdue_actions'))
+    return redirect(url_for('assessment_actions', assessment_id=action['assessment_id']))
+
+@app.route('/actions/<int:id>/delete', methods=['POST'])
+def delete_action(id):
+    """Remove an action from its assessment"""
+    if not session.get('user_id'):
+        flash('Please log in to delete actions', 'warning')
+        return redirect(url_for('login'))
+    
+    conn = get_db_connection()
+    action = conn.execute('''
+        SELECT act.id, act.assessment_id FROM sdg_actions act
+        JOIN assessments a ON a.id = act.assessment_id
+        JOIN projects p ON p.id = a.project_id
+        WHERE act.id = ? AND p.user_id = ? AND p.deleted_at IS NULL
+    ''', (id, session['user_id'])).fetchone()
+    
+    if not action:
+        conn.close()
+        flash('Action not found or you don\'t have permission to delete it', 'danger')
+        return redirect(url_for('projects'))
+    
+    conn.execute('DELETE FROM sdg_actions WHERE id = ?', (id,))
+    conn.commit()
+    conn.close()
+    
+    flash('Action deleted', 'success')
+    return redirect(url_for('assessment_actions', assessment_id=action['assessment_id']))
+
+@app.route('/actions/overdue')
+def overdue_actions():
+    """Dashboard of open actions past their target date"""
+    if not session.get('user_id'):
+        flash('Please log in to view your actions', 'warning')
+        return redirect(url_for('login'))
+    
+    conn = get_db_connection(readonly=True)
+    actions = action_plans.overdue_actions(conn, session['user_id'])
+    conn.close()
+    
+    return render_template('actions/overdue.html', actions=actions)
+
+# Recently verified (user_id, assessment_id) pairs, so autosave skips the ownership query
+AUTOSAVE_OWNER_TTL = 60
+_autosave_owners = LocalLRU(maxsize=4096, ttl=AUTOSAVE_OWNER_TTL)
+
+@app.route('/api/assessments/<int:id>/autosave', methods=['PATCH'])
+def autosave_assessment(id):
+    """Queue changed score_N/notes_N fields of a wizard step"""
+    if not session.get('user_id'):
+        return jsonify({'error': 'Authentication required'}), 401
+    
+    key = (session['user_id'], id)
+    if _autosave_owners.get(key) is None:
+        conn = get_db_connection()
+        owned = conn.execute('''
+            SELECT a.id FROM assessments a JOIN projects p ON p.id = a.project_id
+            WHERE a.id = ? AND p.user_id = ? AND p.deleted_at IS NULL
+        ''', (id, session['user_id'])).fetchone()
+        conn.close()
+        if not owned:
+            return jsonify({'error': 'Assessment not found'}), 404
+        _autosave_owners.set(key, True, 0)
+    
+    data = request.get_json(silent=True)
+    if not isinstance(data, dict):
+        return jsonify({'error': 'Expected a JSON object of score_N/notes_N fields'}), 400
+    # The row_version the page was rendered with; the changes are dropped once a full save moves past it
+    row_version = data.pop('row_version', None)
+    if row_version is not None and (not isinstance(row_version, int) or isinstance(row_version, bool)):
+        return jsonify({'error': 'Invalid row_version'}), 400
+    try:
+        changes = parse_fields(data)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    if changes:
+        autosave_buffer.add(id, changes, session['user_id'], row_version)
+    return jsonify({'queued': sum(len(fields) for fields in changes.values()),
+                    'flush_after': autosave_buffer.window}), 202
+
+@app.route('/assessments/<int:id>/stream')
+def assessment_stream(id):
+    """Server-Sent Events stream of score and notes changes for an assessment"""
+    if not session.get('user_id'):
+        return jsonify({'error': 'Authentication required'}), 401
+    
+    conn = get_db_connection()
+    owned = conn.execute('''
+        SELECT a.id FROM assessments a JOIN projects p ON p.id = a.project_id
+        WHERE a.id = ? AND p.user_id = ? AND p.deleted_at IS NULL
+    ''', (id, session['user_id'])).fetchone()
+    if not owned:
+        conn.close()
+        return jsonify({'error': 'Assessment not found'}), 404
+    
+    feed = change_feed.get()
+    subscriber = feed.subscribe(conn, id)
+    
+    # Replay whatever a reconnecting browser missed
+    backlog = []
+    last_event_id = request.headers.get('Last-Event-ID', type=int)
+    if last_event_id is not None:
+        backlog = feed.backlog(conn, id, last_event_id)
+    conn.close()
+    
+    response = Response(stream_with_context(feed.stream(id, subscriber, backlog)),
+                        mimetype='text/event-stream',
+                        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+    # Also covers clients that disconnect before the stream starts
+    response.call_on_close(lambda: feed.unsubscribe(id, subscriber))
+    return response
+
+@app.route('/admin/metrics/contention')
+def contention_metrics():
+    """Versioned write and conflict counts for this worker"""
+    if not session.get('is_admin'):
+        abort(403)
+    return jsonify(contention_stats.snapshot())
+
+@app.route('/admin/metrics/backups')
+def backup_metrics():
+    """Manifests (size, checksums, timings) of the retained backup snapshots"""
+    if not session.get('is_admin'):
+        abort(403)
+    snapshots = db_backup.list_snapshots(app.config['BACKUP_DIR'])
+    return jsonify([db_backup.read_manifest(path) for path in reversed(snapshots)])
+
+@app.route('/admin/metrics/replica')
+def replica_metrics():
+    """Replica age and how often reads used it or fell back to the primary"""
+    if not session.get('is_admin'):
+        abort(403)
+    if replica is None:
+        return jsonify({'enabled': False})
+    return jsonify(dict(replica.snapshot(), enabled=True))
+
+@app.route('/admin/metrics/maintenance')
+def maintenance_metrics():
+    """Recent maintenance tasks per shard, with durations and space reclaimed"""
+    if not session.get('is_admin'):
+        abort(403)
+    return jsonify({shard: db_maintenance.history(router.path(shard) if router else app.config['DATABASE'], limit=20)
+                    for shard in all_shards()})
+
+@app.route('/admin/metrics/memory')
+def memory_metrics():
+    """RSS, and with MEMORY_DIAGNOSTICS allocations per route and the sites that grew most"""
+    if not session.get('is_admin'):
+        abort(403)
+    if route_memory is None:
+        return jsonify({'enabled': False, 'rss_bytes': memory_diagnostics.rss_bytes()})
+    if request.args.get('rebase'):
+        route_memory.rebase()
+    return jsonify(dict(route_memory.snapshot(), enabled=True))
+
+@app.route('/admin/profiles', methods=['GET', 'POST'])
+def profiles():
+    """Stored request profiles, and a form that makes a profiling link for a path"""
+    if not session.get('is_admin'):
+        abort(403)
+    
+    link = None
+    if request.method == 'POST':
+        path = request.form.get('path', '').strip()
+        if not path.startswith('/'):
+            flash('Enter a path starting with /, such as /assessments/12', 'warning')
+        else:
+            base, _, query = path.partition('?')
+            token = request_profiler.make_token(app, session['user_id'], base)
+            link = f"{path}{'&' if query else '?'}{request_profiler.TOKEN_PARAM}={token}"
+    
+    return render_template('admin/profiles.html', profiles=request_profiler.list_profiles(app.config['PROFILE_DIR']),
+                           link=link, max_age_minutes=request_profiler.TOKEN_MAX_AGE // 60)
+
+@app.route('/admin/profiles/<name>')
+def show_profile(name):
+    """One profile as a flame graph, or as collapsed stacks with ?download=1"""
+    if not session.get('is_admin'):
+        abort(403)
+    
+    loaded = request_profiler.load_profile(app.config['PROFILE_DIR'], name)
+    if loaded is None:
+        abort(404)
+    meta, stacks = loaded
+    if request.args.get('download'):
+        return send_file(os.path.abspath(os.path.join(app.config['PROFILE_DIR'], name + '.collapsed')),
+                         mimetype='text/plain', as_attachment=True, download_name=name + '.collapsed')
+    
+    rows = request_profiler.flame_rows(stacks)
+    return render_template('admin/profile.html', meta=meta, rows=rows,
+                           depth=max((row['depth'] for row in rows), default=0) + 1,
+                           top_frames=request_profiler.top_frames(stacks))
+
+def organization_summary(conn, shard):
+    return conn.execute('''
+        SELECT u.organization, COUNT(DISTINCT p.id) AS projects, COUNT(a.id) AS assessments,
+               SUM(a.status = 'completed') AS completed, COUNT(a.overall_score) AS scored,
+               SUM(a.overall_score) AS score_total
+        FROM projects p
+        JOIN users u ON u.id = p.user_id
+        LEFT JOIN assessments a ON a.project_id = p.id
+        WHERE p.deleted_at IS NULL
+        GROUP BY u.organization
+    ''').fetchall()
+
+# Seconds the organisation report is reused for, by every worker
+ORGANIZATION_METRICS_TTL = 60
+
+@app.route('/admin/metrics/organizations')
+def organization_metrics():
+    """Projects, assessments and average score per organisation, across all shards"""
+    if not session.get('is_admin'):
+        abort(403)
+    if request.args.get('fresh'):
+        shared_cache.delete('organization_metrics')
+    return jsonify(shared_cache.get_or_set('organization_metrics', organization_report, ORGANIZATION_METRICS_TTL))
+
+def organization_report():
+    if router is None:
+        conn = get_db_connection()
+        results = {MAIN: organization_summary(conn, MAIN)}
+        conn.close()
+    else:
+        results = router.fan_out(organization_summary)
+    
+    # An organisation can span shards while it is being moved or after a partial move
+    merged = {}
+    for shard, rows in results.items():
+        for row in rows:
+            entry = merged.setdefault(row['organization'], {
+                'organization': row['organization'], 'shards': [], 'projects': 0, 'assessments': 0,
+                'completed': 0, 'scored': 0, 'score_total': 0.0})
+            entry['shards'].append(shard)
+            for key in ('projects', 'assessments', 'completed', 'scored', 'score_total'):
+                entry[key] += row[key] or 0
+    summary = []
+    for entry in sorted(merged.values(), key=lambda e: e['projects'], reverse=True):
+        scored, total = entry.pop('scored'), entry.pop('score_total')
+        entry['average_score'] = round(total / scored, 2) if scored else None
+        summary.append(entry)
+    return summary
+
+@app.route('/admin/metrics/cache')
+def cache_metrics():
+    """Hits, misses and evictions of the shared cache as seen by this worker"""
+    if not session.get('is_admin'):
+        abort(403)
+    return jsonify(shared_cache.snapshot())
+
+@app.route('/admin/audit')
+def score_audit_history():
+    """Score changes, newest first, for an assessment and/or a user"""
+    if not session.get('is_admin'):
+        abort(403)
+    
+    shard = request.args.get('shard') or current_shard()
+    if shard not in all_shards():
+        abort(404)
+    assessment_id = request.args.get('assessment_id', type=int)
+    user_id = request.args.get('user_id', type=int)
+    
+    # Include what this worker has not written yet; other workers flush within seconds
+    audit_log.get(shard).flush()
+    conn = get_db_connection(shard=shard)
+    entries = score_audit.history(conn, assessment_id, user_id, request.args.get('before', type=int))
+    conn.close()
+    
+    older = entries[-1]['id'] if len(entries) == score_audit.PAGE_SIZE else None
+    return render_template('admin/audit.html', entries=entries, shard=shard, shards=all_shards(),
+                           assessment_id=assessment_id, user_id=user_id, older=older,
+                           stats=audit_log.get(shard).snapshot())
+
+@app.route('/api/sdg-suggestions', methods=['POST'])
+def api_sdg_suggestions():
+    """Suggest relevant SDGs and targets for a draft project description"""
+    if not session.get('user_id'):
+        return jsonify({'error': 'Authentication required'}), 401
+    
+    data = request.get_json(silent=True) or request.form
+    return jsonify(suggestion_engine.suggest(data.get('description', '')))
+
 # Context processor to add data to all templates
 @app.context_processor
 def inject_now():
@@ -1250,9 +2155,94 @@ def utility_processor():
         # Fall back to standard url_for
         return url_for(endpoint, **kwargs)
     
-    return dict(url_for_project_routes=url_for_project_routes)
+    def asset_url(endpoint, **values):
+        """url_for that links static files to their fingerprinted build"""
+        if endpoint == 'static' and 'filename' in values:
+            values['filename'] = assets.url_filename(values['filename'])
+        return url_for(endpoint, **values)
+    
+    return dict(url_for_project_routes=url_for_project_routes, asset_url=asset_url)
+
+_background_started = False
+
+def start_background_workers():
+    """Start this process's background threads (once)
+
+    Only called by the entry points that serve requests: run.py, after_fork()
+    and the ASGI lifespan. Importing the app, as the CLI scripts do, starts
+    nothing.
+    """
+    global _background_started
+    if _background_started:
+        return
+    _background_started = True
+
+    # Optional in-process reminder scheduler (use cron with several workers)
+    if app.config['ACTION_REMINDER_INTERVAL']:
+        for shard in all_shards():
+            action_plans.ReminderScheduler(partial(get_db_connection, shard=shard),
+                                           interval=app.config['ACTION_REMINDER_INTERVAL']).start()
+
+    # Purge soft-deleted projects once their undo window has passed
+    if app.config['PROJECT_PURGE_INTERVAL'] and not app.config['TESTING']:
+        for shard in all_shards():
+            project_purge.ProjectPurger(partial(get_db_connection, shard=shard), app.config['PROJECT_UNDO_SECONDS'],
+                                        upload_folder(shard),
+                                        interval=app.config['PROJECT_PURGE_INTERVAL'],
+                                        housekeeping=HOUSEKEEPING).start()
+
+    # Optional in-process backups (use cron with several workers)
+    if app.config['BACKUP_INTERVAL'] and not app.config['TESTING']:
+        for shard in all_shards():
+            db_backup.BackupScheduler(router.path(shard) if router else app.config['DATABASE'],
+                                      app.config['BACKUP_DIR'],
+                                      app.config['BACKUP_INTERVAL'], app.config['BACKUP_KEEP']).start()
+
+    # Optional in-process maintenance; workers agree on who runs it through the database
+    if app.config['MAINTENANCE_INTERVAL'] and not app.config['TESTING']:
+        for shard in all_shards():
+            db_maintenance.MaintenanceScheduler(router.path(shard) if router else app.config['DATABASE'],
+                                                app.config['MAINTENANCE_INTERVAL'],
+                                                app.config['MAINTENANCE_WINDOW']).start()
+
+    # Keep the replica fresh; workers skip refreshes another worker just made
+    if replica is not None and app.config['REPLICA_REFRESH_INTERVAL'] and not app.config['TESTING']:
+        ReplicaRefresher(replica, interval=app.config['REPLICA_REFRESH_INTERVAL']).start()
+
+    # Background sender for queued email; safe to run in every worker
+    if app.config['MAIL_OUTBOX_INTERVAL'] and not app.config['TESTING']:
+        for shard in all_shards():
+            mail_outbox.OutboxSender(app, mail, partial(get_db_connection, shard=shard),
+                                     interval=app.config['MAIL_OUTBOX_INTERVAL'],
+                                     rate_per_second=app.config['MAIL_SEND_RATE']).start()
+
+def preload_shared_data():
+    """Load data every worker needs into this process so forked workers inherit it"""
+    # A restart picks up a catalogue init_db has reseeded since
+    shared_cache.bump('sdg_catalogue')
+    for shard in all_shards():
+        conn = get_db_connection(shard=shard)
+        try:
+            sdg_catalogue(conn)
+            peer_benchmark.get(shard).ensure_loaded(conn)
+            similar_index.get(shard).ensure_current(conn)
+        finally:
+            conn.close()
+
+def after_fork():
+    """Called in each gunicorn worker after the fork (see gunicorn.conf.py)"""
+    if app.config['STORAGE_ENGINE'] == 'sqlalchemy':
+        # Pooled connections opened by the warmup belong to the master
+        from storage_sqlalchemy import dispose_engines
+        dispose_engines()
+    start_background_workers()
+
+if app.config['FAST_STARTUP']:
+    startup.prepare(app, app.config['TEMPLATE_CACHE_DIR'], preload=preload_shared_data)
 
 if __name__ == '__main__':
-    # Add any missing columns to the database
-    add_missing_columns()
-    app.run(debug=True)
\ No newline at end of file
+    # Add any missing columns to every database
+    for shard in all_shards():
+        add_missing_columns(partial(get_db_connection, shard=shard))
+    start_background_workers()
+    app.run(debug=True)
@@ -0,0 +1,210 @@
+"""
+ASGI entry point, an alternative to run.py and gunicorn's sync workers.
+
+    uvicorn asgi:application --workers 4
+    gunicorn -k uvicorn.workers.UvicornWorker -w 4 asgi:application
+
+Under sync workers a connection holds a whole worker from the first byte of
+its request to the last byte of its response, so a few slow clients can
+leave no worker for anyone else, even for a page like /about. Here the
+event loop reads requests and writes responses, and threads are only held
+while Python code runs. The loop itself only does that I/O; no request
+hook, query or template runs on it:
+
+* the read-heavy views in POOLED_VIEWS run, with the request hooks and
+  their rendering, in a dedicated pool of ASGI_DB_THREADS threads, which
+  the other routes cannot exhaust
+* every other route runs the Flask app unchanged in a pool of
+  ASGI_WSGI_THREADS threads; request bodies are read by the loop first
+  (spooled to disk past SPOOL_BYTES) and responses are written by the loop
+
+Both paths go through the same Flask app, so sessions, flashes, the
+before/after_request hooks and the error handlers behave as under WSGI.
+uvicorn, the ASGI server, is in requirements.txt. benchmark_concurrency.py
+compares the two setups under load.
+"""
+import asyncio
+import io
+import sys
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+
+from werkzeug.exceptions import HTTPException
+
+from app_simple import app, start_background_workers
+
+# Request bodies larger than this are spooled to a temporary file
+SPOOL_BYTES = 1024 * 1024
+
+# Threads start on first use, so with FAST_STARTUP these are only populated after the fork
+db_executor = ThreadPoolExecutor(app.config['ASGI_DB_THREADS'], thread_name_prefix='asgi-db')
+wsgi_executor = ThreadPoolExecutor(app.config['ASGI_WSGI_THREADS'], thread_name_prefix='asgi-wsgi')
+
+_DONE = object()
+
+
+# Endpoints whose Flask views run in db_executor (GET and HEAD only)
+POOLED_ENDPOINTS = ('about', 'resources', 'show_assessment')
+POOLED_VIEWS = {endpoint: app.view_functions[endpoint] for endpoint in POOLED_ENDPOINTS}
+
+
+def build_environ(scope, body):
+    """The WSGI environ for an ASGI HTTP scope, reading the request body from body"""
+    server = scope.get('server') or ('localhost', 80)
+    client = scope.get('client') or ('', 0)
+    environ = {
+        'REQUEST_METHOD': scope['method'],
+        'SCRIPT_NAME': scope.get('root_path', '').encode('utf-8').decode('latin-1'),
+        'PATH_INFO': scope['path'].encode('utf-8').decode('latin-1'),
+        'QUERY_STRING': scope['query_string'].decode('latin-1'),
+        'SERVER_NAME': server[0],
+        'SERVER_PORT': str(server[1]),
+        'SERVER_PROTOCOL': f"HTTP/{scope['http_version']}",
+        'REMOTE_ADDR': client[0],
+        'REMOTE_PORT': str(client[1]),
+        'wsgi.version': (1, 0),
+        'wsgi.url_scheme': scope.get('scheme', 'http'),
+        'wsgi.input': body,
+        'wsgi.errors': sys.stderr,
+        'wsgi.multithread': True,
+        'wsgi.multiprocess': True,
+        'wsgi.run_once': False,
+    }
+    for name, value in scope['headers']:
+        name = name.decode('latin-1').upper().replace('-', '_')
+        value = value.decode('latin-1')
+        key = name if name in ('CONTENT_TYPE', 'CONTENT_LENGTH') else 'HTTP_' + name
+        environ[key] = f'{environ[key]},{value}' if key in environ else value
+    return environ
+
+
+async def read_body(receive):
+    """The request body as a file, or None when the client went away first"""
+    body = tempfile.SpooledTemporaryFile(max_size=SPOOL_BYTES)
+    while True:
+        message = await receive()
+        if message['type'] == 'http.disconnect':
+            body.close()
+            return None
+        body.write(message.get('body', b''))
+        if not message.get('more_body'):
+            body.seek(0)
+            return body
+
+
+def pooled_view(environ):
+    """The POOLED_VIEWS view for this request and its URL arguments, or (None, None)"""
+    if environ['REQUEST_METHOD'] not in ('GET', 'HEAD'):
+        return None, None
+    try:
+        endpoint, args = app.url_map.bind_to_environ(environ, server_name=app.config['SERVER_NAME']).match()
+    except HTTPException:
+        return None, None
+    return POOLED_VIEWS.get(endpoint), args
+
+
+def dispatch(view, args, environ):
+    """Run view the way Flask's wsgi_app runs a view; returns the response"""
+    ctx = app.request_context(environ)
+    error = None
+    try:
+        ctx.push()
+        try:
+            rv = app.preprocess_request()
+            if rv is None:
+                rv = view(**args)
+        except Exception as e:
+            rv = app.handle_user_exception(e)
+        return app.finalize_request(rv)
+    except Exception as e:
+        error = e
+        return app.handle_exception(e)
+    finally:
+        if 'werkzeug.debug.preserve_context' in environ:
+            environ['werkzeug.debug.preserve_context'](ctx)
+        if error is not None and app.should_ignore_error(error):
+            error = None
+        ctx.pop(error)
+
+
+async def respond(send, receive, environ, wsgi_app, executor=None):
+    """Run a WSGI app (in executor, if given) and send its response from the event loop"""
+    loop = asyncio.get_running_loop()
+    status = {}
+
+    def start_response(status_line, headers, exc_info=None):
+        status['code'] = int(status_line.split(' ', 1)[0])
+        status['headers'] = [(name.lower().encode('latin-1'), value.encode('latin-1')) for name, value in headers]
+
+    async def call(function, *args):
+        if executor is None:
+            return function(*args)
+        return await loop.run_in_executor(executor, function, *args)
+
+    # Streaming responses (the live assessment feed) stop at the next chunk after a disconnect
+    disconnected = asyncio.Event()
+
+    async def watch():
+        while (await receive())['type'] != 'http.disconnect':
+            pass
+        disconnected.set()
+
+    watcher = loop.create_task(watch())
+    result = await call(wsgi_app, environ, start_response)
+    started = False
+    try:
+        chunks = iter(result)
+        while not disconnected.is_set():
+            chunk = await call(next, chunks, _DONE)
+            if chunk is _DONE:
+                break
+            if not started:
+                await send({'type': 'http.response.start', 'status': status['code'], 'headers': status['headers']})
+                started = True
+            if chunk:
+                await send({'type': 'http.response.body', 'body': chunk, 'more_body': True})
+        if not disconnected.is_set():
+            if not started:
+                await send({'type': 'http.response.start', 'status': status['code'], 'headers': status['headers']})
+            await send({'type': 'http.response.body', 'body': b''})
+    finally:
+        watcher.cancel()
+        if hasattr(result, 'close'):
+            await call(result.close)
+
+
+async def lifespan(receive, send):
+    while True:
+        message = await receive()
+        if message['type'] == 'lifespan.startup':
+            # Already done after the fork under gunicorn; this covers a plain uvicorn
+            start_background_workers()
+            await send({'type': 'lifespan.startup.complete'})
+        elif message['type'] == 'lifespan.shutdown':
+            db_executor.shutdown(wait=False)
+            wsgi_executor.shutdown(wait=False)
+            await send({'type': 'lifespan.shutdown.complete'})
+            return
+
+
+async def application(scope, receive, send):
+    if scope['type'] == 'lifespan':
+        return await lifespan(receive, send)
+    if scope['type'] != 'http':
+        return
+
+    environ = build_environ(scope, io.BytesIO())
+    view, args = pooled_view(environ)
+    if view is not None:
+        response = await asyncio.get_running_loop().run_in_executor(db_executor, dispatch, view, args, environ)
+        # The response is rendered already; iterating it in the same pool keeps the loop free of app code
+        return await respond(send, receive, environ, response, db_executor)
+
+    body = await read_body(receive)
+    if body is None:
+        return
+    environ['wsgi.input'] = body
+    try:
+        await respond(send, receive, environ, app.wsgi_app, wsgi_executor)
+    finally:
+        body.close()
@@ -0,0 +1,144 @@
+"""
+Optimistic concurrency control for assessment edits.
+
+Every write to an assessment's scores goes through begin_write(), which opens
+a write transaction and checks-and-increments assessments.row_version in a
+single UPDATE. Forms carry the row_version they were rendered with; if
+someone else saved in the meantime the UPDATE matches no row, the
+transaction is rolled back and the caller shows a field-level merge instead
+of overwriting the other person's changes.
+"""
+import re
+import threading
+
+_FIELD_RE = re.compile(r'^(score|notes)_(\d+)$')
+
+
+class VersionConflict(Exception):
+    """Raised when an assessment changed since the form was loaded"""
+
+    def __init__(self, assessment_id, expected, current):
+        super().__init__(f'Assessment {assessment_id} is at version {current}, not {expected}')
+        self.assessment_id = assessment_id
+        self.expected = expected
+        self.current = current
+
+
+class ContentionStats:
+    """Counts of versioned writes, conflicts and autosaves given up on, per process"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.writes = 0
+        self.conflicts = 0
+        self.dropped = 0
+        self.by_assessment = {}
+
+    def record(self, assessment_id, conflict):
+        with self._lock:
+            self.writes += 1
+            if conflict:
+                self.conflicts += 1
+                self.by_assessment[assessment_id] = self.by_assessment.get(assessment_id, 0) + 1
+
+    def record_dropped(self):
+        """An autosave that kept failing and was given up on"""
+        with self._lock:
+            self.dropped += 1
+
+    def snapshot(self, top=10):
+        with self._lock:
+            hottest = sorted(self.by_assessment.items(), key=lambda item: item[1], reverse=True)[:top]
+            return {
+                'writes': self.writes,
+                'conflicts': self.conflicts,
+                'conflict_rate': round(self.conflicts / self.writes, 4) if self.writes else 0.0,
+                'dropped_autosaves': self.dropped,
+                'hottest_assessments': [{'assessment_id': a, 'conflicts': c} for a, c in hottest],
+            }
+
+
+contention_stats = ContentionStats()
+
+
+def begin_write(conn, assessment_id, expected_version):
+    """Start a write transaction and claim the next row_version
+
+    expected_version None skips the check (forms rendered before versioning
+    existed) but still bumps the version. Raises VersionConflict after
+    rolling back when the assessment has moved on.
+    """
+    if conn.in_transaction:
+        conn.commit()
+    conn.execute('BEGIN IMMEDIATE')
+    if expected_version is None:
+        conn.execute('UPDATE assessments SET row_version = COALESCE(row_version, 1) + 1 WHERE id = ?',
+                     (assessment_id,))
+        contention_stats.record(assessment_id, False)
+        return None
+
+    cursor = conn.execute('''
+        UPDATE assessments SET row_version = row_version + 1
+        WHERE id = ? AND row_version = ?
+    ''', (assessment_id, expected_version))
+    if cursor.rowcount == 0:
+        current = conn.execute('SELECT row_version FROM assessments WHERE id = ?', (assessment_id,)).fetchone()
+        conn.rollback()
+        contention_stats.record(assessment_id, True)
+        raise VersionConflict(assessment_id, expected_version, current[0] if current else None)
+    contention_stats.record(assessment_id, False)
+    return expected_version + 1
+
+
+def begin_draft_write(conn, assessment_id, expected_version):
+    """Start a write transaction that leaves row_version alone; return False if the write is stale
+
+    For autosave, whose changes are the editor's own draft. They are dropped,
+    after rolling back, once a full save has moved the assessment past
+    expected_version (the version the editor's page was rendered with), so a
+    form POST wins over autosaves still pending in any worker, or once the
+    project has been deleted. expected_version None only checks the project.
+    """
+    if conn.in_transaction:
+        conn.commit()
+    conn.execute('BEGIN IMMEDIATE')
+    current = conn.execute('''
+        SELECT a.row_version FROM assessments a JOIN projects p ON p.id = a.project_id
+        WHERE a.id = ? AND p.deleted_at IS NULL
+    ''', (assessment_id,)).fetchone()
+    if current is None or (expected_version is not None and current[0] != expected_version):
+        conn.rollback()
+        return False
+    return True
+
+
+def submitted_fields(form):
+    """Return {field_name: value} for the score_N/notes_N fields of a form"""
+    return {key: value for key, value in form.items() if _FIELD_RE.match(key)}
+
+
+def field_merge(conn, assessment_id, form):
+    """Compare submitted fields with the stored ones
+
+    Returns (conflicts, unchanged): conflicts lists the fields whose stored
+    value differs from what was submitted, with both values; unchanged maps
+    the remaining submitted fields to their values so they can be resubmitted.
+    """
+    stored = {}
+    for row in conn.execute('SELECT sdg_id, score, notes FROM sdg_scores WHERE assessment_id = ?',
+                            (assessment_id,)).fetchall():
+        stored[f"score_{row['sdg_id']}"] = '' if row['score'] is None else str(row['score'])
+        stored[f"notes_{row['sdg_id']}"] = row['notes'] or ''
+
+    conflicts = []
+    unchanged = {}
+    for key, value in submitted_fields(form).items():
+        theirs = stored.get(key, '')
+        if (value or '') == theirs:
+            unchanged[key] = value
+        else:
+            field, sdg_id = _FIELD_RE.match(key).groups()
+            conflicts.append({'name': key, 'field': field, 'sdg_id': int(sdg_id),
+                              'yours': value, 'theirs': theirs})
+    conflicts.sort(key=lambda conflict: (conflict['sdg_id'], conflict['field']))
+    return conflicts, unchanged
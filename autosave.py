@@ -0,0 +1,188 @@
+"""
+Debounced autosave for the assessment wizard.
+
+The wizard PATCHes only the score_N / notes_N fields that changed. Changes
+are merged per assessment in memory and written once the assessment has
+been quiet for a short window, as a single transaction, so typing in a notes
+box does not turn into a write per keystroke.
+
+Autosaves do not bump assessments.row_version: they are the editor's own
+draft, and bumping would make that editor's next form POST look like a
+conflict. They do carry the row_version the page was rendered with, and are
+only written while the assessment is still at it (begin_draft_write), so once
+a full form POST has saved, the autosaves still pending in any worker are
+discarded and the form wins. Pending autosaves in the POSTing worker are
+flushed under the same check just before the form is written.
+
+A write that fails (a locked database, say) is put back and retried with
+the next flush, up to MAX_RETRIES times; after that the changes are dropped
+and counted in assessment_versions.contention_stats.
+
+Given a score_audit.AuditLog, each write also records the fields it changed,
+with the values before and after, under the user whose PATCH was last merged.
+"""
+import atexit
+import re
+import threading
+import time
+
+from assessment_versions import begin_draft_write, contention_stats
+from score_audit import read_scores
+
+# Seconds an assessment must be idle before its pending changes are written
+FLUSH_WINDOW = 2.0
+
+# Pending changes are also written once they are this old, even while typing
+MAX_DELAY = 10.0
+
+# Failed writes of the same pending changes before they are dropped
+MAX_RETRIES = 5
+
+NUM_SDGS = 17
+
+_FIELD_RE = re.compile(r'^(score|notes)_(\d+)$')
+
+
+def parse_fields(data):
+    """Turn {'score_7': '3', 'notes_7': '...'} into {7: {'score': 3, 'notes': '...'}}
+
+    Raises ValueError for unknown fields or invalid scores.
+    """
+    changes = {}
+    for key, value in data.items():
+        match = _FIELD_RE.match(key)
+        if not match:
+            raise ValueError(f'Unknown field: {key}')
+        field, sdg_id = match.group(1), int(match.group(2))
+        if not 1 <= sdg_id <= NUM_SDGS:
+            raise ValueError(f'Unknown SDG: {sdg_id}')
+        if field == 'score':
+            if value in (None, ''):
+                value = None
+            else:
+                try:
+                    value = int(value)
+                except (TypeError, ValueError):
+                    raise ValueError(f'Invalid score for SDG {sdg_id}')
+        else:
+            value = '' if value is None else str(value)
+        changes.setdefault(sdg_id, {})[field] = value
+    return changes
+
+
+def write_changes(conn, assessment_id, changes):
+    """Upsert the changed fields of several scores; the caller commits"""
+    for sdg_id, fields in changes.items():
+        assignments = ', '.join(f'{field} = ?' for field in fields)
+        cursor = conn.execute(
+            f'UPDATE sdg_scores SET {assignments}, updated_at = CURRENT_TIMESTAMP '
+            'WHERE assessment_id = ? AND sdg_id = ?',
+            (*fields.values(), assessment_id, sdg_id)
+        )
+        if cursor.rowcount == 0:
+            conn.execute('''
+                INSERT INTO sdg_scores (assessment_id, sdg_id, score, notes, created_at, updated_at)
+                VALUES (?, ?, ?, ?, CURRENT_TIMESTAMP, CURRENT_TIMESTAMP)
+            ''', (assessment_id, sdg_id, fields.get('score'), fields.get('notes')))
+    conn.execute('UPDATE assessments SET updated_at = CURRENT_TIMESTAMP WHERE id = ?', (assessment_id,))
+
+
+class AutosaveBuffer:
+    """Per-assessment pending changes with a background flusher"""
+
+    def __init__(self, connect, window=FLUSH_WINDOW, max_delay=MAX_DELAY, audit=None):
+        self.connect = connect
+        self.audit = audit
+        self.window = window
+        self.max_delay = max_delay
+        self._lock = threading.Lock()
+        self._pending = {}  # assessment_id -> {'changes': {...}, 'row_version': v, 'first': t, 'last': t}
+        self._thread = None
+        self.discarded = 0
+
+    def add(self, assessment_id, changes, user_id=None, row_version=None):
+        """Merge changes made on a page rendered at row_version into the pending set for an assessment"""
+        now = time.monotonic()
+        with self._lock:
+            entry = self._pending.get(assessment_id)
+            if entry is None or entry['row_version'] != row_version:
+                # Changes from a page older than a full save would be discarded anyway
+                entry = self._pending[assessment_id] = {'changes': {}, 'row_version': row_version,
+                                                        'first': now, 'last': now}
+            for sdg_id, fields in changes.items():
+                entry['changes'].setdefault(sdg_id, {}).update(fields)
+            entry['last'] = now
+            entry['user_id'] = user_id
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='autosave', daemon=True)
+                self._thread.start()
+                atexit.register(self.flush_all)
+
+    def flush(self, assessment_id):
+        """Write an assessment's pending changes now (e.g. before a full form POST)"""
+        with self._lock:
+            entry = self._pending.pop(assessment_id, None)
+        if entry:
+            self._write(assessment_id, entry)
+
+    def flush_all(self):
+        with self._lock:
+            pending, self._pending = self._pending, {}
+        for assessment_id, entry in pending.items():
+            self._write(assessment_id, entry)
+
+    def _due(self):
+        now = time.monotonic()
+        with self._lock:
+            due = [assessment_id for assessment_id, entry in self._pending.items()
+                   if now - entry['last'] >= self.window or now - entry['first'] >= self.max_delay]
+            return [(assessment_id, self._pending.pop(assessment_id)) for assessment_id in due]
+
+    def _write(self, assessment_id, entry):
+        conn = self.connect()
+        try:
+            if not begin_draft_write(conn, assessment_id, entry['row_version']):
+                with self._lock:
+                    self.discarded += 1
+                return
+            before = read_scores(conn, assessment_id) if self.audit else None
+            try:
+                write_changes(conn, assessment_id, entry['changes'])
+                conn.commit()
+            except BaseException:
+                conn.rollback()
+                raise
+            if self.audit:
+                self.audit.record_changes(assessment_id, before, read_scores(conn, assessment_id),
+                                          entry.get('user_id'), 'autosave')
+        except Exception as e:
+            print(f"Autosave flush failed for assessment {assessment_id}: {e}")
+            self._requeue(assessment_id, entry)
+        finally:
+            conn.close()
+
+    def _requeue(self, assessment_id, failed):
+        # Put failed changes back underneath anything that arrived since from the same page version
+        attempts = failed.get('attempts', 0) + 1
+        if attempts > MAX_RETRIES:
+            print(f"Autosave for assessment {assessment_id} dropped after {MAX_RETRIES} retries")
+            contention_stats.record_dropped()
+            return
+        now = time.monotonic()
+        with self._lock:
+            entry = self._pending.setdefault(assessment_id, {'changes': {}, 'row_version': failed['row_version'],
+                                                             'first': now, 'last': now})
+            if entry['row_version'] != failed['row_version']:
+                return
+            entry.setdefault('user_id', failed.get('user_id'))
+            entry['attempts'] = attempts
+            for sdg_id, fields in failed['changes'].items():
+                merged = dict(fields)
+                merged.update(entry['changes'].get(sdg_id, {}))
+                entry['changes'][sdg_id] = merged
+
+    def _run(self):
+        while True:
+            time.sleep(self.window / 2)
+            for assessment_id, entry in self._due():
+                self._write(assessment_id, entry)
@@ -0,0 +1,195 @@
+"""
+Concurrency limits of gunicorn's sync workers against the ASGI entry point.
+
+Serves a scratch database, seeded like benchmark_memory.py, with
+
+    sync   gunicorn -w WORKERS app_simple:app (the current setup)
+    asgi   uvicorn asgi:application --workers WORKERS (see asgi.py)
+
+and for each --slow count keeps that many slow clients connected, each
+sending its request headers a byte per second, as a spike of visitors on
+bad mobile connections does, while --concurrency clients request about,
+resources and show_assessment in turn for --duration seconds. Prints, per
+server and slow count, throughput, latency percentiles and the requests
+that failed or took longer than --timeout. A sync worker is held by one
+connection until its request is complete, so once there are as many slow
+clients as workers the sync numbers collapse; the ASGI server reads
+requests on its event loop and should not notice them.
+
+Needs gunicorn, and uvicorn for the asgi server (skipped without it).
+
+    python benchmark_concurrency.py
+    python benchmark_concurrency.py --workers 4 --slow 0 --slow 4 --slow 16 --concurrency 32 --duration 30
+"""
+import argparse
+import asyncio
+import importlib.util
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+from benchmark_memory import seed
+from init_db import make_scratch_db
+
+REPO = os.path.dirname(os.path.abspath(__file__))
+
+SERVERS = {
+    'sync': lambda workers, port: ['-m', 'gunicorn', '-w', str(workers), '-b', f'127.0.0.1:{port}',
+                                   '--log-level', 'warning', 'app_simple:app'],
+    'asgi': lambda workers, port: ['-m', 'uvicorn', 'asgi:application', '--workers', str(workers),
+                                   '--host', '127.0.0.1', '--port', str(port), '--log-level', 'warning'],
+}
+
+# Module each server needs
+SERVER_MODULES = {'sync': 'gunicorn', 'asgi': 'uvicorn'}
+
+# Background threads would only add noise
+QUIET = dict(MAIL_OUTBOX_INTERVAL='0', PROJECT_PURGE_INTERVAL='0', ACTION_REMINDER_INTERVAL='0',
+             BACKUP_INTERVAL='0', MAINTENANCE_INTERVAL='0', REPLICA_PATH='', SHARD_COUNT='0')
+
+# Seconds between the header bytes of a slow client
+SLOW_BYTE_INTERVAL = 1.0
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def start_server(name, workers, directory, env):
+    """Start a server in directory; returns (process, port) once it answers"""
+    port = free_port()
+    process = subprocess.Popen([sys.executable, *SERVERS[name](workers, port)], cwd=directory, env=env)
+    deadline = time.monotonic() + 60
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f'{name} server exited with {process.returncode}')
+        try:
+            with socket.create_connection(('127.0.0.1', port), timeout=1) as s:
+                s.sendall(b'GET /about HTTP/1.1\r\nHost: 127.0.0.1\r\nConnection: close\r\n\r\n')
+                if s.recv(1):
+                    return process, port
+        except OSError:
+            time.sleep(0.2)
+    process.kill()
+    raise RuntimeError(f'{name} server did not start')
+
+
+async def fetch(port, path, cookie):
+    """Status of a GET request (Connection: close)"""
+    reader, writer = await asyncio.open_connection('127.0.0.1', port)
+    try:
+        writer.write(f'GET {path} HTTP/1.1\r\nHost: 127.0.0.1\r\nCookie: session={cookie}\r\n'
+                     'Connection: close\r\n\r\n'.encode())
+        status_line = await reader.readline()
+        await reader.read()
+        return int(status_line.split()[1])
+    finally:
+        writer.close()
+
+
+async def slow_client(port, stop):
+    """Keep one connection busy sending request headers, reconnecting when the server gives up on it"""
+    while not stop.is_set():
+        try:
+            reader, writer = await asyncio.open_connection('127.0.0.1', port)
+            writer.write(b'GET /about HTTP/1.1\r\nHost: 127.0.0.1\r\nX-Slow: ')
+            while not stop.is_set() and not reader.at_eof():
+                writer.write(b'x')
+                await writer.drain()
+                try:
+                    await asyncio.wait_for(stop.wait(), SLOW_BYTE_INTERVAL)
+                except asyncio.TimeoutError:
+                    pass
+            writer.close()
+        except OSError:
+            await asyncio.sleep(0.1)
+
+
+async def load(port, paths, cookie, duration, concurrency, slow, timeout):
+    """([(status or None, seconds)], elapsed) for clients cycling through paths, with slow clients connected"""
+    stop = asyncio.Event()
+    slow_tasks = [asyncio.create_task(slow_client(port, stop)) for _ in range(slow)]
+    await asyncio.sleep(1)  # let them take their connections
+
+    results = []
+    deadline = time.perf_counter() + duration
+
+    async def client(offset):
+        i = offset
+        while time.perf_counter() < deadline:
+            started = time.perf_counter()
+            try:
+                status = await asyncio.wait_for(fetch(port, paths[i % len(paths)], cookie), timeout)
+            except (asyncio.TimeoutError, OSError, IndexError, ValueError):
+                status = None
+            results.append((status, time.perf_counter() - started))
+            i += 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*(client(offset) for offset in range(concurrency)))
+    elapsed = time.perf_counter() - started
+    stop.set()
+    await asyncio.gather(*slow_tasks)
+    return results, elapsed
+
+
+def report(name, slow, results, elapsed):
+    ok = sorted(seconds for status, seconds in results if status == 200)
+    failed = len(results) - len(ok)
+    if ok:
+        p50 = statistics.median(ok)
+        p95 = ok[min(len(ok) - 1, int(len(ok) * 0.95))]
+        print(f'{name:<6}{slow:>6}{len(ok) / elapsed:>10.1f}{p50 * 1000:>10.1f}{p95 * 1000:>10.1f}'
+              f'{ok[-1] * 1000:>10.1f}{failed:>8}')
+    else:
+        print(f"{name:<6}{slow:>6}{'-':>10}{'-':>10}{'-':>10}{'-':>10}{failed:>8}")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Compare the sync gunicorn setup with the ASGI entry point under load')
+    parser.add_argument('--workers', type=int, default=2)
+    parser.add_argument('--slow', type=int, action='append', help='Slow clients to keep connected (default: 0, workers, 4x workers)')
+    parser.add_argument('--concurrency', type=int, default=16)
+    parser.add_argument('--duration', type=float, default=10.0, help='Seconds of load per slow count')
+    parser.add_argument('--timeout', type=float, default=10.0)
+    parser.add_argument('--server', action='append', choices=sorted(SERVERS), help='Server to run (default: both)')
+    args = parser.parse_args()
+    slow_counts = args.slow or [0, args.workers, 4 * args.workers]
+
+    os.environ.update(QUIET)
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(filter(None, [REPO, os.environ.get('PYTHONPATH')])))
+
+    with tempfile.TemporaryDirectory() as directory:
+        make_scratch_db(directory)
+        # The app's relative paths (database, caches) then point into the scratch directory, as for the servers
+        os.chdir(directory)
+        import app_simple
+        app_simple.add_missing_columns()
+        ids = seed(app_simple.app.config['DATABASE'])
+        cookie = app_simple.app.session_interface.get_signing_serializer(app_simple.app).dumps({'user_id': ids['user_id']})
+        paths = ['/about', '/resources', f"/assessments/{ids['assessment_id']}"]
+
+        print(f'{args.workers} workers, {args.concurrency} clients requesting {", ".join(paths)} '
+              f'for {args.duration:g}s, timeout {args.timeout:g}s')
+        print(f"{'server':<6}{'slow':>6}{'req/s':>10}{'p50 ms':>10}{'p95 ms':>10}{'max ms':>10}{'failed':>8}")
+        for name in args.server or sorted(SERVERS, reverse=True):
+            if importlib.util.find_spec(SERVER_MODULES[name]) is None:
+                print(f'{name:<6} skipped: {SERVER_MODULES[name]} is not installed')
+                continue
+            process, port = start_server(name, args.workers, directory, env)
+            try:
+                # One warmup pass so every worker has compiled its templates
+                asyncio.run(load(port, paths, cookie, 1, args.workers, 0, args.timeout))
+                for slow in slow_counts:
+                    results, elapsed = asyncio.run(load(port, paths, cookie, args.duration, args.concurrency,
+                                                        slow, args.timeout))
+                    report(name, slow, results, elapsed)
+            finally:
+                process.terminate()
+                process.wait()
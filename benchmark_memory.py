@@ -0,0 +1,144 @@
+"""
+Per-request memory of the main routes, checked against budgets.
+
+Builds a scratch database with one user, project and completed assessment,
+turns MEMORY_DIAGNOSTICS on and requests each route --repeat times after one
+warmup request (which compiles its templates and fills the caches). Prints,
+per route, the largest and the average traced peak of a request and the
+memory each request left allocated on average. Fails when a route's largest
+peak is over its budget in PEAK_BUDGETS_KB, or when a route keeps more than
+NET_BUDGET_KB per request, which is memory that builds up in the worker.
+
+    python benchmark_memory.py
+    python benchmark_memory.py --repeat 50 --route assessment_step2 --route show_assessment
+"""
+import argparse
+import gc
+import os
+import sys
+import tempfile
+
+from init_db import make_scratch_db
+
+# endpoint: path, with the seeded project and assessment ids filled in
+ROUTES = {
+    'index': '/',
+    'about': '/about',
+    'resources': '/resources',
+    'projects': '/projects',
+    'show_project': '/projects/{project_id}',
+    'assessment_step1': '/projects/{project_id}/assessments/step1',
+    'assessment_step2': '/projects/{project_id}/assessments/{assessment_id}/step2',
+    'assessment_step3': '/projects/{project_id}/assessments/{assessment_id}/step3',
+    'assessment_step4': '/projects/{project_id}/assessments/{assessment_id}/step4',
+    'assessment_step5': '/projects/{project_id}/assessments/{assessment_id}/step5',
+    'show_assessment': '/assessments/{assessment_id}',
+    'edit_assessment': '/assessments/{assessment_id}/edit',
+}
+
+# Largest traced peak allowed for one request, in KiB; the wizard steps build
+# their SDG tables per request and render the biggest pages
+PEAK_BUDGETS_KB = {
+    'index': 256,
+    'about': 256,
+    'resources': 256,
+    'projects': 512,
+    'show_project': 512,
+    'assessment_step1': 1024,
+    'assessment_step2': 1024,
+    'assessment_step3': 1024,
+    'assessment_step4': 1024,
+    'assessment_step5': 1024,
+    'show_assessment': 1024,
+    'edit_assessment': 1024,
+}
+
+# Memory a request may leave allocated, on average, in KiB
+NET_BUDGET_KB = 4
+
+
+def seed(database):
+    """One user with a project and a completed, fully scored assessment; return their ids"""
+    import db_types
+    conn = db_types.connect(database)
+    user_id = conn.execute('''
+        INSERT INTO users (email, password_hash, name, organization)
+        VALUES ('memory@example.org', 'x', 'Memory Benchmark', 'Benchmark')
+    ''').lastrowid
+    project_id = conn.execute('''
+        INSERT INTO projects (name, description, project_type, location, size_sqm, user_id)
+        VALUES ('Benchmark school', 'Seeded by benchmark_memory.py', 'Educational', 'Lisbon', 2400, ?)
+    ''', (user_id,)).lastrowid
+    assessment_id = conn.execute('''
+        INSERT INTO assessments (project_id, user_id, status, completed_at, overall_score)
+        VALUES (?, ?, 'completed', CURRENT_TIMESTAMP, 3.4)
+    ''', (project_id, user_id)).lastrowid
+    conn.executemany('INSERT INTO sdg_scores (assessment_id, sdg_id, score, notes) VALUES (?, ?, ?, ?)',
+                     [(assessment_id, sdg_id, 1 + sdg_id % 5, f'Notes for SDG {sdg_id}') for sdg_id in range(1, 18)])
+    conn.commit()
+    conn.close()
+    return {'user_id': user_id, 'project_id': project_id, 'assessment_id': assessment_id}
+
+
+def measure(app, route_memory, paths, user_id, repeat):
+    """{endpoint: stats} for repeat requests to each path, after a warmup request each"""
+    client = app.test_client()
+    with client.session_transaction() as session:
+        session['user_id'] = user_id
+    for path in paths.values():
+        client.get(path)
+    route_memory.rebase()
+    statuses = {}
+    for endpoint, path in paths.items():
+        for _ in range(repeat):
+            statuses[endpoint] = client.get(path).status_code
+            # Only count what survives a collection; cycles are freed by the next one anyway
+            gc.collect()
+    stats = route_memory.route_stats()
+    return {endpoint: dict(stats.get(endpoint, {}), status=statuses[endpoint]) for endpoint in paths}
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Check per-request memory of the main routes against budgets')
+    parser.add_argument('--repeat', type=int, default=20)
+    parser.add_argument('--route', action='append', choices=sorted(ROUTES), help='Route to measure (default: all)')
+    args = parser.parse_args()
+
+    # Only the requests are measured; keep the background threads out of it
+    os.environ.update(MEMORY_DIAGNOSTICS='1', MAIL_OUTBOX_INTERVAL='0', PROJECT_PURGE_INTERVAL='0',
+                      ACTION_REMINDER_INTERVAL='0', BACKUP_INTERVAL='0', MAINTENANCE_INTERVAL='0',
+                      REPLICA_PATH='', SHARD_COUNT='0')
+
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory() as directory:
+        # The app's relative paths (instance/ for the shared cache, template
+        # cache and similar-project snapshot) resolve here, not in the checkout
+        os.chdir(directory)
+        try:
+            database = make_scratch_db(directory)
+            import app_simple
+            app_simple.app.config['DATABASE'] = database
+            app_simple.add_missing_columns()
+            ids = seed(database)
+            paths = {endpoint: ROUTES[endpoint].format(**ids) for endpoint in args.route or ROUTES}
+            results = measure(app_simple.app, app_simple.route_memory, paths, ids['user_id'], args.repeat)
+        finally:
+            os.chdir(cwd)
+
+    failed = 0
+    print(f"{'route':<20}{'status':>7}{'max peak':>12}{'avg peak':>12}{'avg net':>11}{'budget':>10}")
+    for endpoint, stats in results.items():
+        budget = PEAK_BUDGETS_KB[endpoint]
+        problems = []
+        if stats['status'] != 200:
+            problems.append(f"status {stats['status']}")
+        if stats['max_peak_bytes'] > budget * 1024:
+            problems.append('peak over budget')
+        if stats['avg_net_bytes'] > NET_BUDGET_KB * 1024:
+            problems.append(f'keeps more than {NET_BUDGET_KB} KiB per request')
+        failed += bool(problems)
+        print(f"{endpoint:<20}{stats['status']:>7}{stats['max_peak_bytes'] / 1024:>9.1f}KiB"
+              f"{stats['avg_peak_bytes'] / 1024:>9.1f}KiB{stats['avg_net_bytes'] / 1024:>8.1f}KiB{budget:>7}KiB"
+              + (f"  FAIL: {', '.join(problems)}" if problems else ''))
+    print(f'{len(results)} routes, {failed} failed')
+    sys.exit(1 if failed else 0)
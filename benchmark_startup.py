@@ -0,0 +1,110 @@
+"""
+Time-to-first-response of new workers, with and without fast startup.
+
+Each mode starts --workers workers against the database in instance/ and
+times, per worker, how long it took to become ready and to answer the first
+request for each path, measured from the moment the worker was started:
+
+    cold      a fresh process per worker, no bytecode cache (the old behaviour)
+    bytecode  a fresh process per worker, templates loaded from the bytecode
+              cache (a worker restarted by gunicorn without preloading)
+    preload   FAST_STARTUP=1: the app is prepared once and the workers are
+              forked from it, as gunicorn does with gunicorn.conf.py
+
+    python benchmark_startup.py
+    python benchmark_startup.py --workers 8 --user-id 1 --path /projects --path /projects/1
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+from startup import WARMUP_PATHS
+
+
+def measure(started, paths, user_id):
+    """Time the first request for each path in this process; started is time.time() at launch"""
+    from app_simple import app
+    ready = time.time() - started
+    client = app.test_client()
+    if user_id:
+        with client.session_transaction() as session:
+            session['user_id'] = user_id
+    responses = {}
+    for path in paths:
+        request_started = time.perf_counter()
+        status = client.get(path).status_code
+        responses[path] = (status, time.perf_counter() - request_started)
+    first = next(iter(responses.values()))[1] if responses else 0
+    return {'ready': ready, 'first_response': ready + first, 'responses': responses}
+
+
+def spawn_worker(env, paths, user_id):
+    """Start a new interpreter that imports the app and measures itself"""
+    args = [sys.executable, __file__, '--measure', str(time.time()), '--user-id', str(user_id or 0)]
+    for path in paths:
+        args += ['--path', path]
+    output = subprocess.run(args, env=env, capture_output=True, text=True, check=True).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def fork_worker(paths, user_id):
+    """Fork this (already prepared) process and measure the child"""
+    read_fd, write_fd = os.pipe()
+    started = time.time()
+    pid = os.fork()
+    if pid == 0:
+        os.close(read_fd)
+        with os.fdopen(write_fd, 'w') as pipe:
+            pipe.write(json.dumps(measure(started, paths, user_id)))
+        os._exit(0)
+    os.close(write_fd)
+    with os.fdopen(read_fd) as pipe:
+        result = json.loads(pipe.read())
+    os.waitpid(pid, 0)
+    return result
+
+
+def report(mode, results):
+    print(f'\n{mode}')
+    for i, result in enumerate(results):
+        slowest = max(result['responses'].items(), key=lambda item: item[1][1])
+        print(f"  worker {i}: ready {result['ready'] * 1000:7.1f} ms, "
+              f"first response {result['first_response'] * 1000:7.1f} ms, "
+              f"slowest first hit {slowest[0]} {slowest[1][1] * 1000:6.1f} ms")
+    ttfr = [result['first_response'] for result in results]
+    all_paths = [sum(seconds for _, seconds in result['responses'].values()) + result['ready'] for result in results]
+    print(f"  mean time to first response {statistics.mean(ttfr) * 1000:.1f} ms, "
+          f"to every path answered once {statistics.mean(all_paths) * 1000:.1f} ms")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Compare time-to-first-response of new workers')
+    parser.add_argument('--workers', type=int, default=4)
+    parser.add_argument('--path', action='append', help='Path to request (default: the warmup pages)')
+    parser.add_argument('--user-id', type=int, help='Log the test client in as this user')
+    parser.add_argument('--measure', type=float, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    paths = args.path or list(WARMUP_PATHS)
+
+    if args.measure is not None:
+        print(json.dumps(measure(args.measure, paths, args.user_id)))
+        sys.exit(0)
+
+    with tempfile.TemporaryDirectory() as cache_dir:
+        env = dict(os.environ, FAST_STARTUP='0', TEMPLATE_CACHE_DIR='')
+        report('cold', [spawn_worker(env, paths, args.user_id) for _ in range(args.workers)])
+
+        env['TEMPLATE_CACHE_DIR'] = cache_dir
+        spawn_worker(env, paths, args.user_id)  # fills the bytecode cache
+        report('bytecode', [spawn_worker(env, paths, args.user_id) for _ in range(args.workers)])
+
+        os.environ.update(FAST_STARTUP='1', TEMPLATE_CACHE_DIR=cache_dir)
+        started = time.time()
+        import app_simple  # noqa: F401  (prepares the app in this process, like the gunicorn master)
+        print(f'\npreload: master prepared in {(time.time() - started) * 1000:.0f} ms')
+        report('preload', [fork_worker(paths, args.user_id) for _ in range(args.workers)])
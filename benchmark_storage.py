@@ -0,0 +1,114 @@
+"""
+Per-operation cost of the storage engines.
+
+Seeds a scratch database with users, projects, assessments and scores, then
+times each repository operation on every engine and prints the median and
+95th percentile per call. "open + close" is the cost of one unit of work's
+connection: a fresh sqlite3 connection versus a checkout from the pool.
+
+    python benchmark_storage.py
+    python benchmark_storage.py --users 500 --repeat 2000
+"""
+import argparse
+import random
+import statistics
+import tempfile
+import time
+
+from init_db import make_scratch_db
+from storage import ENGINES, SqliteStorage, open_storage
+
+SDG_COUNT = 17
+
+
+def seed(database, users, projects_per_user, assessments_per_project):
+    """Fill the scratch database through the sqlite engine; return the ids to query"""
+    ids = {'users': [], 'projects': [], 'assessments': []}
+    with SqliteStorage.open(database) as storage, storage.transaction():
+        for u in range(users):
+            user_id = storage.users.create(f'user{u}@example.org', 'x', f'User {u}', f'Org {u % 20}')
+            ids['users'].append((user_id, f'user{u}@example.org'))
+            for p in range(projects_per_user):
+                project_id = storage.projects.create(user_id, f'Project {u}-{p}', project_type='Residential')
+                ids['projects'].append((project_id, user_id))
+                for _ in range(assessments_per_project):
+                    assessment_id = storage.assessments.create(project_id)
+                    storage.scores.save_many(assessment_id, {sdg: (random.randint(1, 5), 'Seed')
+                                                             for sdg in range(1, SDG_COUNT + 1)})
+                    ids['assessments'].append(assessment_id)
+    return ids
+
+
+def operations(ids):
+    """{name: fn(storage)} for each operation, each call on a random row"""
+    def pick(key):
+        return random.choice(ids[key])
+
+    def new_project(storage):
+        user_id, _ = pick('users')
+        storage.projects.create(user_id, 'Benchmark', 'Created by benchmark_storage.py')
+
+    def save_scores(storage):
+        storage.scores.save_many(pick('assessments'), {sdg: (random.randint(1, 5), 'Updated')
+                                                       for sdg in range(1, SDG_COUNT + 1)})
+
+    return {
+        'users.get_by_email': lambda s: s.users.get_by_email(pick('users')[1]),
+        'projects.get': lambda s: s.projects.get(*pick('projects')),
+        'projects.list_for_user': lambda s: s.projects.list_for_user(pick('users')[0]),
+        'assessments.list_for_project': lambda s: s.assessments.list_for_project(pick('projects')[0]),
+        'scores.for_assessment': lambda s: s.scores.for_assessment(pick('assessments')),
+        'projects.create': new_project,
+        'scores.save_many (17 SDGs)': save_scores,
+    }
+
+
+def time_calls(fn, repeat):
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - started)
+    timings.sort()
+    return statistics.median(timings), timings[int(len(timings) * 0.95) - 1]
+
+
+def run(database, ids, engine, repeat):
+    results = {}
+    # Warm up: the first open builds the engine (and reflects tables) for sqlalchemy
+    open_storage(engine, database).close()
+    results['open + close'] = time_calls(lambda: open_storage(engine, database).close(), repeat)
+
+    with open_storage(engine, database) as storage:
+        for name, operation in operations(ids).items():
+            results[name] = time_calls(lambda: operation(storage), repeat)
+    return results
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Compare per-operation cost of the storage engines')
+    parser.add_argument('--users', type=int, default=200)
+    parser.add_argument('--projects', type=int, default=3, help='Projects per user')
+    parser.add_argument('--assessments', type=int, default=2, help='Assessments per project')
+    parser.add_argument('--repeat', type=int, default=1000, help='Calls timed per operation')
+    args = parser.parse_args()
+
+    random.seed(42)
+    with tempfile.TemporaryDirectory() as directory:
+        database = make_scratch_db(directory)
+        ids = seed(database, args.users, args.projects, args.assessments)
+        print(f"Seeded {len(ids['users'])} users, {len(ids['projects'])} projects, "
+              f"{len(ids['assessments'])} assessments; {args.repeat} calls per operation\n")
+
+        results = {engine: run(database, ids, engine, args.repeat) for engine in ENGINES}
+
+    header = f"{'operation':<30}" + ''.join(f'{engine + " p50":>18}{"p95":>12}' for engine in ENGINES)
+    print(header + f"{'ratio':>8}")
+    print('-' * (len(header) + 8))
+    for name in results[ENGINES[0]]:
+        row = f'{name:<30}'
+        for engine in ENGINES:
+            p50, p95 = results[engine][name]
+            row += f'{p50 * 1e6:>15.1f} us{p95 * 1e6:>9.1f} us'
+        ratio = results[ENGINES[1]][name][0] / results[ENGINES[0]][name][0]
+        print(row + f'{ratio:>7.2f}x')
@@ -0,0 +1,425 @@
+"""
+Query-plan regression checks for the app's SQL.
+
+Collects every SQL statement the app runs: string literals passed to
+execute()/executemany() in the app modules (module-level constants and
+concatenations of them included), plus the statements in REGISTERED, which
+stand in for the ones built at runtime with f-strings. Each statement is
+checked with EXPLAIN QUERY PLAN against a seeded, ANALYZEd scratch database
+(as db_maintenance.py leaves a production one):
+
+* a full SCAN of a table outside SMALL_TABLES fails, unless the statement
+  is in one of the FULL_READS functions
+* a statement that no longer compiles against the schema fails
+
+Every statement is then timed at each --scale with representative values
+for its parameters: each one is matched to the column it is compared with,
+inserted into or named after, and bound to a value of that column from the
+middle of the seeded rows (SAMPLE_LIMIT for LIMIT, NULL when no column is
+found). A lookup through an index stays flat as the data grows while a scan
+grows with it, so a statement whose time grows more than MAX_GROWTH times
+between the smallest and the largest scale fails too. Exits non-zero on
+failure.
+
+The scratch schema is init_db plus app_simple.add_missing_columns, so a new
+column has to be added there for its statements to pass.
+tests/test_query_plans.py runs the same checks at the default scales.
+
+    python check_query_plans.py
+    python check_query_plans.py --scale 200 --scale 5000 --show-plans
+"""
+import argparse
+import ast
+import contextlib
+import io
+import os
+import random
+import re
+import sqlite3
+import sys
+import tempfile
+import time
+from datetime import date, timedelta
+
+from db_types import utcnow
+from init_db import make_scratch_db
+
+# Modules whose SQL is checked
+MODULES = (
+    'app_simple.py', 'action_plans.py', 'assessment_versions.py', 'autosave.py', 'db_backup.py',
+    'db_replica.py', 'evidence.py', 'evidence_tagging.py', 'live_updates.py', 'mail_outbox.py',
+    'peer_benchmark.py', 'project_purge.py', 'score_audit.py', 'sdg_suggestions.py', 'sharding.py',
+    'similar_projects.py', 'storage.py',
+)
+
+# Reference data that stays a few dozen rows; scanning these is fine
+SMALL_TABLES = {'sdg_goals', 'sdg_criteria', 'maintenance_runs', 'sqlite_master', 'sqlite_schema', 'sqlite_sequence'}
+
+# Functions that read whole tables by design, and why; their scans and growth are not failures
+FULL_READS = {
+    'action_plans.due_for_reminder': 'daily sweep over every open action that has come due',
+    'app_simple.organization_summary': 'admin report over every organisation',
+    'peer_benchmark.latest_scores': 'loads every completed assessment once per worker',
+    'similar_projects.rebuild': 'snapshot built from every completed assessment',
+    'sharding.shard_map': 'loads the whole organisation map, cached for SHARD_MAP_TTL',
+    'sharding.move_organization': 'rebalance CLI',
+    'sharding.organization_weights': 'rebalance CLI',
+}
+
+# Statements assembled at runtime, in the shape they take for one or two values
+REGISTERED = {
+    'project_purge._delete_in_batches (sdg_scores)':
+        'DELETE FROM sdg_scores WHERE rowid IN (SELECT rowid FROM sdg_scores '
+        'WHERE assessment_id IN (SELECT id FROM assessments WHERE project_id = ?) LIMIT ?)',
+    'project_purge._delete_in_batches (sdg_actions)':
+        'DELETE FROM sdg_actions WHERE rowid IN (SELECT rowid FROM sdg_actions '
+        'WHERE assessment_id IN (SELECT id FROM assessments WHERE project_id = ?) LIMIT ?)',
+    'project_purge._delete_in_batches (assessment_changes)':
+        'DELETE FROM assessment_changes WHERE rowid IN (SELECT rowid FROM assessment_changes '
+        'WHERE assessment_id IN (SELECT id FROM assessments WHERE project_id = ?) LIMIT ?)',
+    'project_purge._delete_in_batches (assessments)':
+        'DELETE FROM assessments WHERE rowid IN (SELECT rowid FROM assessments WHERE project_id = ? LIMIT ?)',
+    'project_purge.purge_project (evidence)':
+        'SELECT id FROM evidence WHERE assessment_id IN (SELECT id FROM assessments WHERE project_id = ?)',
+    'autosave.write_changes':
+        'UPDATE sdg_scores SET score = ?, notes = ?, updated_at = CURRENT_TIMESTAMP '
+        'WHERE assessment_id = ? AND sdg_id = ?',
+    'action_plans.build_digests':
+        'SELECT id, email, name FROM users WHERE id IN (?,?)',
+    'similar_projects.refresh':
+        'SELECT a.project_id, p.project_type, p.location, s.sdg_id, s.score FROM assessments a '
+        'JOIN projects p ON p.id = a.project_id LEFT JOIN sdg_scores s ON s.assessment_id = a.id '
+        "WHERE a.status = 'completed' AND p.deleted_at IS NULL AND a.id = (SELECT MAX(a2.id) FROM assessments a2 "
+        "WHERE a2.project_id = a.project_id AND a2.status = 'completed') AND a.project_id IN (?,?)",
+    'app_simple.similar_projects':
+        'SELECT id, name, project_type, location, user_id FROM projects WHERE id IN (?,?) AND deleted_at IS NULL',
+}
+
+# Projects seeded when no --scale is given
+SCALES = (100, 2000)
+
+# Settings that keep the app's background threads from starting; only its schema is needed
+QUIET = dict(MAIL_OUTBOX_INTERVAL='0', PROJECT_PURGE_INTERVAL='0', ACTION_REMINDER_INTERVAL='0',
+             BACKUP_INTERVAL='0', MAINTENANCE_INTERVAL='0', REPLICA_PATH='')
+
+# Bound to LIMIT ?, about a page of rows or a purge batch
+SAMPLE_LIMIT = 100
+
+# Scans and growth are judged on the largest scale; timings below this are noise
+MAX_GROWTH = 4.0
+MIN_SECONDS = 0.0005
+
+SQL_START = re.compile(r'\s*(SELECT|INSERT|UPDATE|DELETE|WITH|REPLACE)\b', re.IGNORECASE)
+SCAN = re.compile(r'^SCAN (?:TABLE )?(\w+)')
+PLACEHOLDER = re.compile(r'\?|(?<![:\w]):(\w+)')
+# The column compared with the placeholder that follows, also inside IN (...) or a call like COALESCE(...)
+COMPARED = re.compile(r'(?:(\w+)\.)?(\w+)\s*(?:[=<>!]=?|<>|\bLIKE|\bIN)\s*(?:\w*\s*\(\s*)?$', re.IGNORECASE)
+LIST_NEXT = re.compile(r'^\s*,\s*$')
+LIMIT = re.compile(r'\b(LIMIT|OFFSET)\s*$', re.IGNORECASE)
+INSERT_COLUMNS = re.compile(r'\bINTO\s+(\w+)\s*\(([^)]*)\)\s*VALUES\s*\(', re.IGNORECASE)
+TABLES = re.compile(r'\b(?:FROM|JOIN|UPDATE|INTO)\s+(?:\w+\.)?(\w+)(?:\s+(?:AS\s+)?(\w+))?', re.IGNORECASE)
+# Words that can follow a table name without being its alias
+KEYWORDS = {'WHERE', 'SET', 'ON', 'USING', 'JOIN', 'LEFT', 'INNER', 'CROSS', 'NATURAL', 'VALUES', 'SELECT',
+            'DEFAULT', 'ORDER', 'GROUP', 'HAVING', 'LIMIT', 'UNION', 'EXCEPT', 'INTERSECT', 'RETURNING',
+            'INDEXED', 'NOT', 'AND', 'OR'}
+
+
+class Statement:
+    def __init__(self, name, function, sql):
+        self.name = name
+        self.function = function
+        self.sql = ' '.join(sql.split())
+        self.plan = []
+        self.error = None
+        self.scans = []
+        self.timings = {}
+        self.parameters = None
+
+
+def _fold(node, constants):
+    """The string value of node when it is a literal, a module constant or a + of those"""
+    if isinstance(node, ast.Constant) and isinstance(node.value, str):
+        return node.value
+    if isinstance(node, ast.Name):
+        return constants.get(node.id)
+    if isinstance(node, ast.BinOp) and isinstance(node.op, ast.Add):
+        left, right = _fold(node.left, constants), _fold(node.right, constants)
+        if left is not None and right is not None:
+            return left + right
+    return None
+
+
+def extract(path):
+    """Statements passed as literals to execute()/executemany() in path"""
+    tree = ast.parse(open(path, encoding='utf-8').read(), path)
+    constants = {}
+    for node in tree.body:
+        if isinstance(node, ast.Assign) and len(node.targets) == 1 and isinstance(node.targets[0], ast.Name):
+            value = _fold(node.value, constants)
+            if value is not None:
+                constants[node.targets[0].id] = value
+
+    module = os.path.splitext(os.path.basename(path))[0]
+    statements = []
+
+    def visit(node, function):
+        if isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef)):
+            function = node.name
+        if (isinstance(node, ast.Call) and isinstance(node.func, ast.Attribute)
+                and node.func.attr in ('execute', 'executemany') and node.args):
+            sql = _fold(node.args[0], constants)
+            if sql is not None and SQL_START.match(sql):
+                statements.append(Statement(f'{module}.{function}:{node.lineno}', f'{module}.{function}', sql))
+        for child in ast.iter_child_nodes(node):
+            visit(child, function)
+
+    visit(tree, '<module>')
+    return statements
+
+
+def collect():
+    statements = []
+    root = os.path.dirname(os.path.abspath(__file__))
+    for module in MODULES:
+        statements.extend(extract(os.path.join(root, module)))
+    for name, sql in REGISTERED.items():
+        statements.append(Statement(name, name.split(' ')[0], sql))
+    return statements
+
+
+def _columns(sql):
+    """(table or alias, column) for each placeholder in sql; (None, None) where there is none"""
+    insert = INSERT_COLUMNS.search(sql)
+    inserted = [column.strip() for column in insert.group(2).split(',')] if insert else []
+    columns, previous, position = [], None, 0
+    for match in PLACEHOLDER.finditer(sql):
+        before = sql[position:match.start()]
+        position = match.end()
+        compared = COMPARED.search(before)
+        if match.group(1):
+            column = (None, match.group(1))
+        elif LIMIT.search(before):
+            column = (LIMIT.search(before).group(1).upper(), None)
+        elif compared:
+            column = compared.groups()
+        elif insert and match.start() >= insert.end() and inserted:
+            column = (insert.group(1), inserted.pop(0))
+        elif previous and LIST_NEXT.match(before):
+            column = previous
+        else:
+            column = (None, None)
+        columns.append(column)
+        previous = column
+    return columns
+
+
+def _sample(conn, table, column, samples):
+    """A value of table.column from the middle of its rows, memoised in samples"""
+    if (table, column) not in samples:
+        count = conn.execute(f'SELECT count(*) FROM {table} WHERE {column} IS NOT NULL').fetchone()[0]
+        row = conn.execute(f'SELECT {column} FROM {table} WHERE {column} IS NOT NULL LIMIT 1 OFFSET ?',
+                           (count // 2,)).fetchone()
+        samples[(table, column)] = row[0] if row else None
+    return samples[(table, column)]
+
+
+def _value(conn, sql, qualifier, column, samples):
+    if qualifier == 'LIMIT':
+        return SAMPLE_LIMIT
+    if qualifier == 'OFFSET':
+        return 0
+    if column is None:
+        return None
+    aliases = {}
+    for table, alias in TABLES.findall(sql):
+        aliases.setdefault(table, table)
+        if alias and alias.upper() not in KEYWORDS:
+            aliases.setdefault(alias, table)
+    candidates = [aliases[qualifier]] if qualifier in aliases else list(dict.fromkeys(aliases.values()))
+    for table in candidates:
+        try:
+            names = [row[1] for row in conn.execute(f'PRAGMA table_info({table})')]
+        except sqlite3.Error:
+            continue
+        if column in names:
+            return _sample(conn, table, column, samples)
+    return None
+
+
+def _parameters(conn, sql, samples):
+    """Representative values for sql's parameters: a sequence for ? placeholders, a mapping for :named ones"""
+    without_strings = re.sub(r"'(?:[^']|'')*'", "''", sql)
+    values = [(column, _value(conn, without_strings, qualifier, column, samples))
+              for qualifier, column in _columns(without_strings)]
+    if re.search(r'(?<![:\w]):\w', without_strings):
+        return dict(values)
+    return [value for _, value in values]
+
+
+def build_database(directory, projects):
+    """Scratch database with the app's full schema, seeded with projects projects, then ANALYZEd"""
+    path = make_scratch_db(directory)
+    import app_simple
+    from sharding import ShardRouter
+    with contextlib.redirect_stdout(io.StringIO()):
+        app_simple.add_missing_columns(lambda: app_simple.db_types.connect(path))
+    ShardRouter(path, os.path.join(directory, 'shards'), 0, directory).ensure_shards()
+
+    conn = sqlite3.connect(path)
+    random.seed(projects)
+    users = max(1, projects // 5)
+    today = date.today()
+    now = utcnow()
+    conn.executemany('INSERT INTO users (email, password_hash, name, organization) VALUES (?, ?, ?, ?)',
+                     [(f'user{u}@example.org', 'x', f'User {u}', f'Org {u % 50}') for u in range(users)])
+    user_ids = [row[0] for row in conn.execute('SELECT id FROM users')]
+    conn.executemany('''
+        INSERT INTO projects (name, project_type, location, size_sqm, status, user_id, deleted_at)
+        VALUES (?, ?, ?, ?, ?, ?, ?)
+    ''', [(f'Project {p}', random.choice(('Residential', 'Commercial', 'Educational')),
+           random.choice(('Lisbon', 'Porto', 'Faro')), random.randint(100, 20000), 'draft',
+           random.choice(user_ids), today.isoformat() if p % 50 == 0 else None) for p in range(projects)])
+    owners = conn.execute('SELECT id, user_id FROM projects').fetchall()
+    conn.executemany('''
+        INSERT INTO assessments (project_id, user_id, status, completed_at, overall_score)
+        VALUES (?, ?, ?, ?, ?)
+    ''', [(project_id, user_id, *random.choice([('completed', today.isoformat(), random.uniform(1, 5)),
+                                                ('draft', None, None)]))
+          for project_id, user_id in owners for _ in range(2)])
+    assessment_ids = [row[0] for row in conn.execute('SELECT id FROM assessments')]
+    conn.executemany('INSERT INTO sdg_scores (assessment_id, sdg_id, score, notes) VALUES (?, ?, ?, ?)',
+                     [(a, sdg, random.randint(1, 5), 'Seed') for a in assessment_ids for sdg in range(1, 18)])
+    # Actions that have come due were reminded on the day
+    conn.executemany('''
+        INSERT INTO sdg_actions (assessment_id, sdg_id, description, status, target_date, reminded_on)
+        VALUES (?, ?, ?, ?, ?, ?)
+    ''', [(a, random.randint(1, 17), 'Seed action', random.choice(('planned', 'in_progress', 'completed')),
+           due.isoformat(), due.isoformat() if due <= today else None)
+          for a in assessment_ids for due in [today + timedelta(days=random.randint(-30, 60))]])
+    conn.executemany('''
+        INSERT INTO score_audit (assessment_id, sdg_id, field, old_value, new_value, user_id, source, changed_at)
+        SELECT assessment_id, sdg_id, 'score', score, score, ?, 'edit', ? FROM sdg_scores WHERE assessment_id = ?
+    ''', [(user_id, now, a) for a, user_id in conn.execute('SELECT id, user_id FROM assessments')])
+    conn.executemany('INSERT OR IGNORE INTO evidence_blobs (sha256, size, content_type) VALUES (?, ?, ?)',
+                     [(f'{a:064x}', 1000, 'application/pdf') for a in assessment_ids[::4]])
+    conn.executemany('INSERT INTO evidence (assessment_id, sdg_id, sha256, filename) VALUES (?, ?, ?, ?)',
+                     [(a, 1, f'{a:064x}', 'seed.pdf') for a in assessment_ids[::4]])
+    conn.executemany('INSERT INTO evidence_tags (sha256, sdg_id, hits, offsets) VALUES (?, ?, ?, ?)',
+                     [(f'{a:064x}', random.randint(1, 17), 3, '[0, 10, 20]') for a in assessment_ids[::4]])
+    # Mostly sent mail, with a backlog of queued or in-flight messages that does not grow with the data
+    conn.executemany('''
+        INSERT INTO mail_outbox (recipient, subject, status, next_attempt_at, claim_token, claimed_at, sent_at)
+        VALUES (?, ?, ?, ?, ?, ?, ?)
+    ''', [(f'user{u}@example.org', 'Seed', status, now, token, now if token else None, now if status == 'sent' else None)
+          for u in range(users * 5)
+          for status, token in [('sent', f'{u:032x}') if u % (users // 2 + 1) else
+                                random.choice([('pending', None), ('sending', f'{u:032x}')])]])
+    conn.commit()
+    conn.execute('ANALYZE')
+    conn.close()
+    return path
+
+
+def explain(conn, statement):
+    try:
+        rows = conn.execute('EXPLAIN QUERY PLAN ' + statement.sql, statement.parameters).fetchall()
+    except sqlite3.Error as e:
+        statement.error = str(e)
+        return
+    statement.plan = [row[3] for row in rows]
+    for detail in statement.plan:
+        match = SCAN.match(detail)
+        if match:
+            table = _table_for(conn, statement.sql, match.group(1))
+            if table not in SMALL_TABLES:
+                statement.scans.append(table)
+
+
+def _table_for(conn, sql, name):
+    """The table behind name in a plan line, which may be an alias"""
+    if name in SMALL_TABLES or conn.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?",
+                                            (name,)).fetchone():
+        return name
+    match = re.search(rf'\b(?:FROM|JOIN)\s+(?:\w+\.)?(\w+)\s+(?:AS\s+)?{name}\b', sql, re.IGNORECASE)
+    return match.group(1) if match else name
+
+
+def time_statement(conn, statement, repeat):
+    """Best time of repeat runs with the statement's parameters, rolled back; None if it cannot run"""
+    best = None
+    for _ in range(repeat):
+        conn.execute('SAVEPOINT timing')
+        try:
+            started = time.perf_counter()
+            conn.execute(statement.sql, statement.parameters).fetchall()
+            elapsed = time.perf_counter() - started
+        except sqlite3.Error:
+            return None
+        finally:
+            conn.execute('ROLLBACK TO timing')
+            conn.execute('RELEASE timing')
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def failures(statement, scales):
+    problems = []
+    if statement.error:
+        problems.append(f'does not compile: {statement.error}')
+    if statement.function in FULL_READS:
+        return problems
+    for table in statement.scans:
+        problems.append(f'full scan of {table}')
+    timed = [statement.timings[scale] for scale in scales if statement.timings.get(scale) is not None]
+    if len(timed) == len(scales) > 1 and not statement.scans:
+        smallest, largest = timed[0], timed[-1]
+        if largest > MIN_SECONDS and largest > max(smallest, MIN_SECONDS / MAX_GROWTH) * MAX_GROWTH:
+            problems.append(f'time grew {largest / max(smallest, 1e-9):.1f}x from {scales[0]} to {scales[-1]} projects')
+    return problems
+
+
+def check(directory, scales=SCALES, repeat=5):
+    """Every statement, explained on the largest scale and timed on each, with databases built in directory"""
+    statements = collect()
+    for scale in scales:
+        path = build_database(os.path.join(directory, str(scale)), scale)
+        conn = sqlite3.connect(path, isolation_level=None)
+        samples = {}
+        for statement in statements:
+            statement.parameters = _parameters(conn, statement.sql, samples)
+            if scale == scales[-1]:
+                explain(conn, statement)
+            statement.timings[scale] = time_statement(conn, statement, repeat)
+        conn.close()
+    return statements
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Check the query plans of the app\'s SQL')
+    parser.add_argument('--scale', type=int, action='append', help='Projects to seed (default: 100 and 2000)')
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--show-plans', action='store_true')
+    args = parser.parse_args()
+    scales = sorted(args.scale or SCALES)
+
+    os.environ.update(QUIET)
+    with tempfile.TemporaryDirectory() as directory:
+        statements = check(directory, scales, args.repeat)
+
+    failed = 0
+    print(f"{'statement':<58}" + ''.join(f'{scale:>10}' for scale in scales))
+    for statement in statements:
+        problems = failures(statement, scales)
+        failed += bool(problems)
+        times = ''.join(f'{statement.timings[scale] * 1000:>8.3f}ms' if statement.timings.get(scale) is not None
+                        else f"{'-':>10}" for scale in scales)
+        print(f"{'FAIL' if problems else 'ok  '} {statement.name:<53}{times}")
+        for problem in problems:
+            print(f'       {problem}')
+        if args.show_plans or problems:
+            if problems:
+                print(f'       {statement.sql[:160]}')
+            for detail in statement.plan:
+                print(f'       | {detail}')
+    print(f'{len(statements)} statements, {failed} failed')
+    sys.exit(1 if failed else 0)
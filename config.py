@@ -18,6 +18,81 @@ class Config:
     MAIL_PASSWORD = os.environ.get('MAIL_PASSWORD')
     MAIL_DEFAULT_SENDER = os.environ.get('MAIL_DEFAULT_SENDER', 'noreply@sdgassessment.org')
     
+    # Outbox sender: seconds between runs (0 leaves it to 'python mail_outbox.py')
+    # and maximum messages per second
+    MAIL_OUTBOX_INTERVAL = int(os.environ.get('MAIL_OUTBOX_INTERVAL', '10'))
+    MAIL_SEND_RATE = float(os.environ.get('MAIL_SEND_RATE', '5'))
+    CONTACT_EMAIL = os.environ.get('CONTACT_EMAIL', 'contact@sdgassessment.org')
+    
+    # Seconds between in-process action reminder runs; 0 leaves reminders to cron
+    ACTION_REMINDER_INTERVAL = int(os.environ.get('ACTION_REMINDER_INTERVAL', '0'))
+    
+    # Deleted projects can be restored for this many seconds before they are purged;
+    # the purger runs every PROJECT_PURGE_INTERVAL seconds (0 leaves it to cron)
+    PROJECT_UNDO_SECONDS = int(os.environ.get('PROJECT_UNDO_SECONDS', str(24 * 3600)))
+    PROJECT_PURGE_INTERVAL = int(os.environ.get('PROJECT_PURGE_INTERVAL', '300'))
+    
+    # Online backups: seconds between in-process snapshots (0 leaves it to
+    # 'python db_backup.py snapshot' from cron), snapshots kept, and how gently
+    # to copy (pages per step, seconds between steps)
+    BACKUP_DIR = os.environ.get('BACKUP_DIR', os.path.join('instance', 'backups'))
+    BACKUP_INTERVAL = int(os.environ.get('BACKUP_INTERVAL', '0'))
+    BACKUP_KEEP = int(os.environ.get('BACKUP_KEEP', '14'))
+    BACKUP_PAGES_PER_STEP = int(os.environ.get('BACKUP_PAGES_PER_STEP', '256'))
+    BACKUP_STEP_SLEEP = float(os.environ.get('BACKUP_STEP_SLEEP', '0.05'))
+    
+    # Read-only replica for reports and dashboards (empty path disables it):
+    # refreshed every REPLICA_REFRESH_INTERVAL seconds, and not used once it
+    # is older than REPLICA_MAX_STALENESS seconds
+    REPLICA_PATH = os.environ.get('REPLICA_PATH', '')
+    REPLICA_REFRESH_INTERVAL = int(os.environ.get('REPLICA_REFRESH_INTERVAL', '60'))
+    REPLICA_MAX_STALENESS = int(os.environ.get('REPLICA_MAX_STALENESS', '300'))
+    
+    # Per-organisation shards (0 keeps everything in DATABASE); organisations
+    # are placed on shards with 'python sharding.py rebalance'. With shards the
+    # peer benchmark is loaded from all of them, and similar projects are off
+    SHARD_COUNT = int(os.environ.get('SHARD_COUNT', '0'))
+    SHARD_DIR = os.environ.get('SHARD_DIR', os.path.join('instance', 'shards'))
+    SHARD_MAP_TTL = int(os.environ.get('SHARD_MAP_TTL', '30'))
+    
+    # Engine behind the storage layer (see storage.py): 'sqlite' for raw
+    # sqlite3 connections, 'sqlalchemy' for a pooled SQLAlchemy Core engine
+    STORAGE_ENGINE = os.environ.get('STORAGE_ENGINE', 'sqlite')
+    
+    # Compiled templates shared by all workers; FAST_STARTUP=1 also compiles
+    # them, preloads shared data and warms the main pages before gunicorn
+    # forks (see startup.py and gunicorn.conf.py)
+    TEMPLATE_CACHE_DIR = os.environ.get('TEMPLATE_CACHE_DIR', os.path.join('instance', 'jinja_cache'))
+    FAST_STARTUP = os.environ.get('FAST_STARTUP', '0') == '1'
+    
+    # Database maintenance (see db_maintenance.py): seconds between in-process
+    # runs (0 leaves it to 'python db_maintenance.py run' from cron) and the
+    # low-traffic window runs may start in, as 'HH:MM-HH:MM' local time
+    MAINTENANCE_INTERVAL = int(os.environ.get('MAINTENANCE_INTERVAL', '0'))
+    MAINTENANCE_WINDOW = os.environ.get('MAINTENANCE_WINDOW', '02:00-05:00')
+    
+    # Profiles of single requests taken on demand by admins (see
+    # request_profiler.py), and how many of them to keep
+    PROFILE_DIR = os.environ.get('PROFILE_DIR', os.path.join('instance', 'profiles'))
+    PROFILE_KEEP = int(os.environ.get('PROFILE_KEEP', '50'))
+    
+    # Trace allocations per route (see memory_diagnostics.py); slows the
+    # worker down, so only while investigating memory growth
+    MEMORY_DIAGNOSTICS = os.environ.get('MEMORY_DIAGNOSTICS', '0') == '1'
+    
+    # Cache shared by the workers on this host (see shared_cache.py): its
+    # file, how many entries it keeps, and the size and lifetime in seconds
+    # of each worker's in-memory tier in front of it
+    SHARED_CACHE_PATH = os.environ.get('SHARED_CACHE_PATH', os.path.join('instance', 'shared_cache.db'))
+    SHARED_CACHE_MAX_ENTRIES = int(os.environ.get('SHARED_CACHE_MAX_ENTRIES', '10000'))
+    SHARED_CACHE_L1_SIZE = int(os.environ.get('SHARED_CACHE_L1_SIZE', '1024'))
+    SHARED_CACHE_L1_TTL = float(os.environ.get('SHARED_CACHE_L1_TTL', '2'))
+    
+    # Thread pools of the ASGI entry point (see asgi.py): one for the views it
+    # serves itself, one for the Flask routes it runs unchanged
+    ASGI_DB_THREADS = int(os.environ.get('ASGI_DB_THREADS', '8'))
+    ASGI_WSGI_THREADS = int(os.environ.get('ASGI_WSGI_THREADS', '16'))
+    
     # Security settings
     SECURITY_PASSWORD_SALT = os.environ.get('SECURITY_PASSWORD_SALT', 'make-this-secret')
 
@@ -56,4 +131,4 @@ config: Dict[str, Any] = {
     'testing': TestingConfig,
     'production': ProductionConfig,
     'default': DevelopmentConfig
-}
\ No newline at end of file
+}
\ No newline at end of file
@@ -0,0 +1,283 @@
+"""
+Online backups of the SQLite database.
+
+Snapshots are taken with the SQLite backup API, a few pages per step with a
+short pause in between, so gunicorn workers can keep writing while a backup
+runs. Each snapshot is integrity-checked, gzip-compressed and written next
+to a JSON manifest with its SHA-256 checksums and timing/throughput figures.
+Only the newest BACKUP_KEEP snapshots are kept.
+
+    python db_backup.py snapshot
+    python db_backup.py list
+    python db_backup.py verify <snapshot>
+    python db_backup.py restore <snapshot> [--target path/to/db]
+
+Restore verifies the checksums and integrity first and then copies the
+snapshot into the target with the backup API, so open connections see the
+restored data instead of a file swapped out underneath them.
+"""
+import argparse
+import glob
+import gzip
+import hashlib
+import json
+import os
+import shutil
+import sqlite3
+import tempfile
+import threading
+import time
+from datetime import datetime
+
+# Pages copied per backup step, and the pause between steps
+PAGES_PER_STEP = 256
+STEP_SLEEP = 0.05
+
+# A write from another connection restarts an incremental backup from page
+# one; after this many restarts the rest is copied in a single step instead
+MAX_RESTARTS = 3
+
+KEEP = 14
+
+CHUNK_SIZE = 1024 * 1024
+
+
+class BackupError(Exception):
+    """Raised when a snapshot fails verification"""
+
+
+class _TooManyRestarts(Exception):
+    pass
+
+
+def online_copy(source, target, pages=PAGES_PER_STEP, pause=STEP_SLEEP, max_restarts=MAX_RESTARTS):
+    """Copy database connection source into target incrementally
+
+    Returns {'pages', 'steps', 'restarts', 'single_step', 'seconds'}. Under a
+    steady stream of writes the incremental copy keeps starting over, so
+    after max_restarts it finishes with one step, which holds the read lock
+    for the length of one full copy.
+    """
+    stats = {'pages': 0, 'steps': 0, 'restarts': 0, 'single_step': False}
+    last_remaining = [None]
+
+    def progress(status, remaining, total):
+        stats['pages'] = total
+        stats['steps'] += 1
+        if last_remaining[0] is not None and remaining > last_remaining[0]:
+            stats['restarts'] += 1
+            if stats['restarts'] > max_restarts:
+                raise _TooManyRestarts()
+        last_remaining[0] = remaining
+        if remaining and pause:
+            time.sleep(pause)
+
+    started = time.monotonic()
+    try:
+        source.backup(target, pages=pages, progress=progress)
+    except _TooManyRestarts:
+        stats['single_step'] = True
+        source.backup(target)
+    stats['seconds'] = time.monotonic() - started
+    return stats
+
+
+def quick_check(path):
+    conn = sqlite3.connect(path)
+    try:
+        result = conn.execute('PRAGMA quick_check').fetchone()[0]
+    finally:
+        conn.close()
+    if result != 'ok':
+        raise BackupError(f'{path} failed quick_check: {result}')
+
+
+def _sha256(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(CHUNK_SIZE), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _manifest_path(snapshot):
+    return snapshot + '.json'
+
+
+def read_manifest(snapshot):
+    with open(_manifest_path(snapshot)) as f:
+        return json.load(f)
+
+
+def snapshot(db_path, backup_dir, keep=KEEP, pages=PAGES_PER_STEP, pause=STEP_SLEEP):
+    """Write a compressed, checksummed snapshot of db_path; return its manifest"""
+    os.makedirs(backup_dir, exist_ok=True)
+    name = os.path.splitext(os.path.basename(db_path))[0]
+    stamp = datetime.now().strftime('%Y%m%d-%H%M%S')
+    path = os.path.join(backup_dir, f'{name}-{stamp}.db.gz')
+
+    fd, raw_path = tempfile.mkstemp(suffix='.db', dir=backup_dir)
+    os.close(fd)
+    try:
+        source = sqlite3.connect(db_path)
+        target = sqlite3.connect(raw_path)
+        try:
+            copy = online_copy(source, target, pages, pause)
+        finally:
+            target.close()
+            source.close()
+        quick_check(raw_path)
+
+        started = time.monotonic()
+        with open(raw_path, 'rb') as src, gzip.open(path + '.tmp', 'wb', compresslevel=6) as dst:
+            shutil.copyfileobj(src, dst, CHUNK_SIZE)
+        os.replace(path + '.tmp', path)
+        compress_seconds = time.monotonic() - started
+
+        raw_size = os.path.getsize(raw_path)
+        manifest = {
+            'file': os.path.basename(path),
+            'database': os.path.abspath(db_path),
+            'created_at': datetime.now().isoformat(timespec='seconds'),
+            'raw_bytes': raw_size,
+            'raw_sha256': _sha256(raw_path),
+            'compressed_bytes': os.path.getsize(path),
+            'sha256': _sha256(path),
+            'pages': copy['pages'],
+            'steps': copy['steps'],
+            'restarts': copy['restarts'],
+            'single_step': copy['single_step'],
+            'copy_seconds': round(copy['seconds'], 3),
+            'compress_seconds': round(compress_seconds, 3),
+            'copy_mb_per_second': round(raw_size / 1e6 / copy['seconds'], 2) if copy['seconds'] else None,
+        }
+        with open(_manifest_path(path), 'w') as f:
+            json.dump(manifest, f, indent=2)
+    finally:
+        if os.path.exists(raw_path):
+            os.remove(raw_path)
+
+    rotate(backup_dir, name, keep)
+    return manifest
+
+
+def list_snapshots(backup_dir, name=None):
+    """Snapshot paths in backup_dir, oldest first"""
+    pattern = f'{name}-*.db.gz' if name else '*.db.gz'
+    return sorted(glob.glob(os.path.join(backup_dir, pattern)))
+
+
+def rotate(backup_dir, name, keep=KEEP):
+    """Delete all but the newest keep snapshots of a database"""
+    snapshots = list_snapshots(backup_dir, name)
+    for path in snapshots[:-keep] if keep else []:
+        for victim in (path, _manifest_path(path)):
+            if os.path.exists(victim):
+                os.remove(victim)
+
+
+def verify(snapshot_path, workdir=None):
+    """Check a snapshot's checksums and integrity; return the decompressed temp path
+
+    The caller owns (and must remove) the returned file.
+    """
+    manifest = read_manifest(snapshot_path)
+    if _sha256(snapshot_path) != manifest['sha256']:
+        raise BackupError(f'{snapshot_path}: compressed checksum mismatch')
+
+    fd, raw_path = tempfile.mkstemp(suffix='.db', dir=workdir or os.path.dirname(snapshot_path))
+    os.close(fd)
+    try:
+        with gzip.open(snapshot_path, 'rb') as src, open(raw_path, 'wb') as dst:
+            shutil.copyfileobj(src, dst, CHUNK_SIZE)
+        if _sha256(raw_path) != manifest['raw_sha256']:
+            raise BackupError(f'{snapshot_path}: database checksum mismatch')
+        quick_check(raw_path)
+    except Exception:
+        os.remove(raw_path)
+        raise
+    return raw_path
+
+
+def restore(snapshot_path, target_path, pages=PAGES_PER_STEP):
+    """Verify a snapshot and copy it over target_path; return copy stats"""
+    raw_path = verify(snapshot_path)
+    try:
+        source = sqlite3.connect(raw_path)
+        target = sqlite3.connect(target_path, timeout=30)
+        try:
+            stats = online_copy(source, target, pages, pause=0)
+        finally:
+            target.close()
+            source.close()
+    finally:
+        os.remove(raw_path)
+    quick_check(target_path)
+    # The similar-project snapshot describes the data that was replaced; workers rebuild it
+    from similar_projects import discard_snapshot, snapshot_prefix
+    discard_snapshot(snapshot_prefix(target_path))
+    return stats
+
+
+class BackupScheduler:
+    """Background thread that takes a snapshot every interval seconds"""
+
+    def __init__(self, db_path, backup_dir, interval, keep=KEEP):
+        self.db_path = db_path
+        self.backup_dir = backup_dir
+        self.interval = interval
+        self.keep = keep
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name='db-backup', daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            try:
+                manifest = snapshot(self.db_path, self.backup_dir, self.keep)
+                print(f"Backup {manifest['file']} written in {manifest['copy_seconds']}s")
+            except Exception as e:
+                print(f"Backup failed: {e}")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Back up and restore the SQLite database')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    subparsers.add_parser('snapshot', help='Take a snapshot now')
+    subparsers.add_parser('list', help='List snapshots with their metrics')
+    verify_parser = subparsers.add_parser('verify', help='Check a snapshot without restoring it')
+    verify_parser.add_argument('snapshot')
+    restore_parser = subparsers.add_parser('restore', help='Verify a snapshot and restore it')
+    restore_parser.add_argument('snapshot')
+    restore_parser.add_argument('--target', help='Database to restore into (default: the one it was taken from)')
+    args = parser.parse_args()
+
+    from app_simple import app, router, all_shards
+    backup_dir = app.config['BACKUP_DIR']
+
+    if args.command == 'snapshot':
+        # One snapshot per shard file when sharding is enabled
+        for shard in all_shards():
+            db_path = router.path(shard) if router else app.config['DATABASE']
+            manifest = snapshot(db_path, backup_dir, app.config['BACKUP_KEEP'],
+                                app.config['BACKUP_PAGES_PER_STEP'], app.config['BACKUP_STEP_SLEEP'])
+            print(json.dumps(manifest, indent=2))
+    elif args.command == 'list':
+        for path in list_snapshots(backup_dir):
+            manifest = read_manifest(path)
+            print(f"{manifest['file']}  {manifest['compressed_bytes']:>12,} bytes  "
+                  f"copy {manifest['copy_seconds']}s ({manifest['copy_mb_per_second']} MB/s)")
+    elif args.command == 'verify':
+        os.remove(verify(args.snapshot))
+        print(f"{args.snapshot}: OK")
+    elif args.command == 'restore':
+        target = args.target or read_manifest(args.snapshot)['database']
+        stats = restore(args.snapshot, target)
+        print(f"Restored {args.snapshot} into {target} ({stats['pages']} pages in {stats['seconds']:.2f}s)")
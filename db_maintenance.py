@@ -0,0 +1,271 @@
+"""
+Routine maintenance of the SQLite database.
+
+Each run does four tasks and records how long each took, and how much space
+it gave back, in the maintenance_runs table:
+
+    analyze      ANALYZE (bounded by analysis_limit) and PRAGMA optimize, so
+                 the planner has statistics for the indexes init_db creates
+    vacuum       PRAGMA incremental_vacuum a few pages per transaction until
+                 the free list is empty or the time budget runs out; purged
+                 projects leave free pages behind and the file never shrinks
+                 without it
+    quick_check  PRAGMA quick_check
+    checkpoint   PRAGMA wal_checkpoint(TRUNCATE), when the database is in WAL mode
+
+Incremental vacuum needs auto_vacuum=INCREMENTAL, which new databases get
+from init_db. An existing file is converted once, with a full VACUUM that
+locks it for the duration, so do it while the app is stopped:
+
+    python db_maintenance.py run [--task analyze --task vacuum ...]
+    python db_maintenance.py history
+    python db_maintenance.py enable-incremental-vacuum
+
+The in-process scheduler only starts a run inside MAINTENANCE_WINDOW, and
+workers share the last-run time through the database, so one worker per
+database does the work.
+"""
+import argparse
+import os
+import sqlite3
+import threading
+import time
+from datetime import datetime, timedelta
+
+from db_types import utcnow
+
+TASKS = ('analyze', 'vacuum', 'quick_check', 'checkpoint')
+
+# Rows sampled per index by ANALYZE; keeps it fast on big tables
+ANALYSIS_LIMIT = 1000
+
+# Free pages released per incremental_vacuum transaction, the pause between
+# them so writers get the lock, and the most time one run may spend vacuuming
+VACUUM_PAGES_PER_STEP = 256
+VACUUM_STEP_SLEEP = 0.05
+VACUUM_TIME_BUDGET = 60
+
+# How often the scheduler looks at the clock
+CHECK_SECONDS = 60
+
+
+def _connect(db_path):
+    # Autocommit, so PRAGMAs and each vacuum step are their own transaction
+    conn = sqlite3.connect(db_path, timeout=30, isolation_level=None)
+    conn.row_factory = sqlite3.Row
+    return conn
+
+
+def _pragma(conn, name):
+    return conn.execute(f'PRAGMA {name}').fetchone()[0]
+
+
+def _free_bytes(conn):
+    return _pragma(conn, 'freelist_count') * _pragma(conn, 'page_size')
+
+
+def analyze(conn):
+    conn.execute(f'PRAGMA analysis_limit = {ANALYSIS_LIMIT}')
+    conn.execute('ANALYZE')
+    conn.execute('PRAGMA optimize')
+    indexes = conn.execute('SELECT COUNT(DISTINCT idx) FROM sqlite_stat1 WHERE idx IS NOT NULL').fetchone()[0]
+    return 'ok', f'statistics for {indexes} indexes', 0
+
+
+def vacuum(conn, pages=VACUUM_PAGES_PER_STEP, pause=VACUUM_STEP_SLEEP, budget=VACUUM_TIME_BUDGET):
+    if _pragma(conn, 'auto_vacuum') != 2:
+        return 'skipped', (f'auto_vacuum is not INCREMENTAL ({_free_bytes(conn):,} bytes free); '
+                           f'run "python db_maintenance.py enable-incremental-vacuum" once'), 0
+
+    before = _free_bytes(conn)
+    started = time.monotonic()
+    steps = 0
+    while _pragma(conn, 'freelist_count') and time.monotonic() - started < budget:
+        # execute() only steps the pragma once, freeing a single page; a script runs it to completion
+        conn.executescript(f'PRAGMA incremental_vacuum({pages})')
+        steps += 1
+        time.sleep(pause)
+    left = _free_bytes(conn)
+    detail = f'{steps} steps' + (f', {left:,} bytes still free (time budget reached)' if left else '')
+    return 'ok', detail, before - left
+
+
+def quick_check(conn):
+    result = [row[0] for row in conn.execute('PRAGMA quick_check').fetchall()]
+    if result == ['ok']:
+        return 'ok', 'ok', 0
+    return 'failed', '; '.join(result[:10]), 0
+
+
+def checkpoint(conn):
+    if _pragma(conn, 'journal_mode') != 'wal':
+        return 'skipped', 'not in WAL mode', 0
+    wal_path = conn.execute('PRAGMA database_list').fetchone()['file'] + '-wal'
+    before = os.path.getsize(wal_path) if os.path.exists(wal_path) else 0
+    busy, log_pages, checkpointed = conn.execute('PRAGMA wal_checkpoint(TRUNCATE)').fetchone()
+    after = os.path.getsize(wal_path) if os.path.exists(wal_path) else 0
+    if busy:
+        return 'skipped', f'readers kept the WAL busy ({checkpointed}/{log_pages} pages checkpointed)', before - after
+    return 'ok', f'{checkpointed} pages checkpointed', before - after
+
+
+TASK_FUNCTIONS = {'analyze': analyze, 'vacuum': vacuum, 'quick_check': quick_check, 'checkpoint': checkpoint}
+
+
+def ensure_table(conn):
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS maintenance_runs (
+            id INTEGER PRIMARY KEY,
+            task TEXT NOT NULL,
+            status TEXT NOT NULL,
+            detail TEXT,
+            duration_seconds REAL,
+            bytes_reclaimed INTEGER DEFAULT 0,
+            file_bytes INTEGER,
+            started_at TIMESTAMP NOT NULL
+        )
+    ''')
+
+
+def run_maintenance(db_path, tasks=TASKS):
+    """Run the given tasks on db_path, record them, and return the records"""
+    conn = _connect(db_path)
+    records = []
+    try:
+        ensure_table(conn)
+        for task in tasks:
+            started_at = utcnow()
+            started = time.monotonic()
+            try:
+                status, detail, reclaimed = TASK_FUNCTIONS[task](conn)
+            except sqlite3.Error as e:
+                status, detail, reclaimed = 'failed', str(e), 0
+            record = {
+                'task': task,
+                'status': status,
+                'detail': detail,
+                'duration_seconds': round(time.monotonic() - started, 3),
+                'bytes_reclaimed': reclaimed,
+                'file_bytes': os.path.getsize(db_path),
+                'started_at': started_at,
+            }
+            conn.execute('''
+                INSERT INTO maintenance_runs (task, status, detail, duration_seconds, bytes_reclaimed,
+                                              file_bytes, started_at)
+                VALUES (:task, :status, :detail, :duration_seconds, :bytes_reclaimed, :file_bytes, :started_at)
+            ''', record)
+            records.append(record)
+    finally:
+        conn.close()
+    return records
+
+
+def history(db_path, limit=50):
+    """The most recent task records, newest first"""
+    conn = _connect(db_path)
+    try:
+        ensure_table(conn)
+        return [dict(row) for row in conn.execute(
+            'SELECT * FROM maintenance_runs ORDER BY id DESC LIMIT ?', (limit,)).fetchall()]
+    finally:
+        conn.close()
+
+
+def enable_incremental_vacuum(db_path):
+    """Switch an existing database to auto_vacuum=INCREMENTAL (rewrites the whole file)"""
+    conn = _connect(db_path)
+    try:
+        conn.execute('PRAGMA auto_vacuum = INCREMENTAL')
+        started = time.monotonic()
+        before = os.path.getsize(db_path)
+        conn.execute('VACUUM')
+        return before - os.path.getsize(db_path), time.monotonic() - started
+    finally:
+        conn.close()
+
+
+def in_window(window, now=None):
+    """Whether now falls inside 'HH:MM-HH:MM' (which may wrap past midnight); '' means always"""
+    if not window:
+        return True
+    start, end = (datetime.strptime(part.strip(), '%H:%M').time() for part in window.split('-'))
+    current = (now or datetime.now()).time()
+    if start <= end:
+        return start <= current < end
+    return current >= start or current < end
+
+
+def claim_run(db_path, interval):
+    """Record a run start unless one started less than interval seconds ago; return True if claimed
+
+    BEGIN IMMEDIATE makes the check and the insert atomic across workers.
+    """
+    conn = _connect(db_path)
+    try:
+        ensure_table(conn)
+        conn.execute('BEGIN IMMEDIATE')
+        cutoff = utcnow() - timedelta(seconds=interval)
+        recent = conn.execute("SELECT 1 FROM maintenance_runs WHERE task = 'run' AND started_at > ?",
+                              (cutoff,)).fetchone()
+        if not recent:
+            conn.execute("INSERT INTO maintenance_runs (task, status, started_at) VALUES ('run', 'started', ?)",
+                         (utcnow(),))
+        conn.execute('COMMIT')
+        return recent is None
+    finally:
+        conn.close()
+
+
+class MaintenanceScheduler:
+    """Background thread that runs maintenance once per interval, inside the window"""
+
+    def __init__(self, db_path, interval, window=''):
+        self.db_path = db_path
+        self.interval = interval
+        self.window = window
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name='db-maintenance', daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def _run(self):
+        while not self._stop.wait(CHECK_SECONDS):
+            try:
+                if in_window(self.window) and claim_run(self.db_path, self.interval):
+                    for record in run_maintenance(self.db_path):
+                        print(f"Maintenance {record['task']}: {record['status']} in {record['duration_seconds']}s, "
+                              f"{record['bytes_reclaimed']:,} bytes reclaimed ({record['detail']})")
+            except Exception as e:
+                print(f"Maintenance failed: {e}")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Maintain the SQLite database')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    run_parser = subparsers.add_parser('run', help='Run maintenance now')
+    run_parser.add_argument('--task', action='append', choices=TASKS, help='Task to run (default: all)')
+    subparsers.add_parser('history', help='Show recent maintenance records')
+    subparsers.add_parser('enable-incremental-vacuum', help='Convert the database so vacuum can run in steps')
+    args = parser.parse_args()
+
+    from app_simple import app, router, all_shards
+    for shard in all_shards():
+        db_path = router.path(shard) if router else app.config['DATABASE']
+        print(f'{shard} ({db_path}):')
+        if args.command == 'run':
+            for record in run_maintenance(db_path, args.task or TASKS):
+                print(f"  {record['task']:<12} {record['status']:<8} {record['duration_seconds']:>8.3f}s "
+                      f"{record['bytes_reclaimed']:>12,} bytes  {record['detail']}")
+        elif args.command == 'history':
+            for record in history(db_path):
+                print(f"  {record['started_at']}  {record['task']:<12} {record['status']:<8} "
+                      f"{record['duration_seconds'] or 0:>8.3f}s {record['bytes_reclaimed'] or 0:>12,} bytes")
+        elif args.command == 'enable-incremental-vacuum':
+            reclaimed, seconds = enable_incremental_vacuum(db_path)
+            print(f'  auto_vacuum=INCREMENTAL; VACUUM took {seconds:.2f}s and reclaimed {reclaimed:,} bytes')
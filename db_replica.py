@@ -0,0 +1,129 @@
+"""
+Read-only replica of the database for reports and dashboards.
+
+The replica is a copy of the primary made with the incremental backup API
+(see db_backup.online_copy) into a temporary file, which then atomically
+replaces the previous copy. Because a replica file is never modified in
+place, readers open it with immutable=1 and skip SQLite's locking entirely.
+
+Readers only get a replica connection when it is fresher than
+REPLICA_MAX_STALENESS and newer than the current user's last write, so
+people always see their own changes; otherwise they fall back to the
+primary. Every worker runs a refresher, but a refresh is skipped when the
+shared file is already recent enough, so workers mostly take turns.
+
+Run directly to refresh the replica once (e.g. from cron):
+
+    python db_replica.py
+"""
+import os
+import sqlite3
+import threading
+import time
+import urllib.request
+
+import db_types
+from db_backup import online_copy
+
+
+class Replica:
+    """A periodically refreshed, read-only copy of the primary database"""
+
+    def __init__(self, primary_path, replica_path, max_staleness=300):
+        self.primary_path = primary_path
+        self.replica_path = replica_path
+        self.max_staleness = max_staleness
+        self._lock = threading.Lock()
+        self.stats = {'replica': 0, 'stale': 0, 'behind_user': 0, 'refreshes': 0,
+                      'last_refresh_seconds': None}
+
+    def refreshed_at(self):
+        """Unix time the current replica's copy started, or None if there is none"""
+        try:
+            return os.path.getmtime(self.replica_path)
+        except OSError:
+            return None
+
+    def refresh(self, min_interval=0):
+        """Copy the primary into a new replica file; return False if it was recent enough"""
+        refreshed_at = self.refreshed_at()
+        if refreshed_at is not None and time.time() - refreshed_at < min_interval:
+            return False
+
+        tmp_path = f'{self.replica_path}.{os.getpid()}.tmp'
+        started = time.time()
+        source = sqlite3.connect(self.primary_path)
+        target = sqlite3.connect(tmp_path)
+        try:
+            copy = online_copy(source, target)
+        finally:
+            target.close()
+            source.close()
+        # Date the file by when the copy started: everything committed before
+        # then is in it, which is what connect(min_refreshed_at) relies on
+        os.utime(tmp_path, (started, started))
+        os.replace(tmp_path, self.replica_path)
+
+        with self._lock:
+            self.stats['refreshes'] += 1
+            self.stats['last_refresh_seconds'] = round(copy['seconds'], 3)
+        return True
+
+    def connect(self, min_refreshed_at=0):
+        """Open the replica read-only, or return None when it is too stale to use"""
+        refreshed_at = self.refreshed_at()
+        if refreshed_at is None or time.time() - refreshed_at > self.max_staleness:
+            reason = 'stale'
+        elif refreshed_at < min_refreshed_at:
+            reason = 'behind_user'
+        else:
+            reason = 'replica'
+        with self._lock:
+            self.stats[reason] += 1
+        if reason != 'replica':
+            return None
+
+        uri = 'file:' + urllib.request.pathname2url(os.path.abspath(self.replica_path)) + '?mode=ro&immutable=1'
+        return db_types.connect(uri, uri=True)
+
+    def snapshot(self):
+        refreshed_at = self.refreshed_at()
+        with self._lock:
+            stats = dict(self.stats)
+        stats['age_seconds'] = round(time.time() - refreshed_at, 1) if refreshed_at else None
+        return stats
+
+
+class ReplicaRefresher:
+    """Background thread that keeps the replica at most interval seconds old"""
+
+    def __init__(self, replica, interval=60):
+        self.replica = replica
+        self.interval = interval
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name='db-replica', daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                self.replica.refresh(min_interval=self.interval)
+            except Exception as e:
+                print(f"Replica refresh failed: {e}")
+            self._stop.wait(self.interval / 2)
+
+
+if __name__ == '__main__':
+    from app_simple import app
+    if not app.config['REPLICA_PATH']:
+        raise SystemExit('REPLICA_PATH is not set')
+    replica = Replica(app.config['DATABASE'], app.config['REPLICA_PATH'])
+    replica.refresh()
+    print(f"Refreshed {app.config['REPLICA_PATH']} in {replica.stats['last_refresh_seconds']}s")
@@ -0,0 +1,103 @@
+"""
+Typed values for SQLite columns.
+
+Connections opened with connect() return TIMESTAMP/DATETIME columns as
+datetime and DATE columns as date. sqlite3 converts each value once, while
+the row is fetched, so templates no longer parse the same timestamp strings
+on every render.
+
+Timestamps are UTC and stored as 'YYYY-MM-DD HH:MM:SS', the format of
+CURRENT_TIMESTAMP and datetime('now'), so column defaults, SQL expressions
+and values written from Python sort and compare as one clock. Python code
+takes the time from utcnow() and passes the datetime itself as a parameter;
+the adapter writes it in that format (dropping microseconds, and converting
+aware datetimes to UTC). Dates are stored as 'YYYY-MM-DD'. The adapters are
+registered explicitly rather than relying on sqlite3's defaults, which are
+deprecated.
+
+Rows written before this used the server's local time, some of them with
+microseconds. `python db_types.py DATABASE` trims the microseconds; the
+clock cannot be told apart row by row, so on a server not running in UTC
+those older values stay off by its UTC offset. The ones that matter
+(deleted_at, mail_outbox retry times) are short-lived.
+
+Values that do not parse (hand-edited rows, older formats) come back as the
+original string, and columns read through expressions such as MAX(...) have
+no declared type, so code that displays timestamps still accepts strings.
+"""
+import sqlite3
+import sys
+from datetime import date, datetime, timezone
+
+DETECT_TYPES = sqlite3.PARSE_DECLTYPES
+
+
+def utcnow():
+    """The current UTC time as a naive datetime, to the second"""
+    return datetime.now(timezone.utc).replace(tzinfo=None, microsecond=0)
+
+
+def parse_timestamp(text):
+    """datetime for an ISO-8601 timestamp or date string, or the string itself"""
+    try:
+        return datetime.fromisoformat(text)
+    except ValueError:
+        return text
+
+
+def parse_date(text):
+    """date for an ISO-8601 date (or timestamp) string, or the string itself"""
+    try:
+        return date.fromisoformat(text)
+    except ValueError:
+        value = parse_timestamp(text)
+        return value.date() if isinstance(value, datetime) else text
+
+
+def adapt_datetime(value):
+    if value.tzinfo is not None:
+        value = value.astimezone(timezone.utc).replace(tzinfo=None)
+    return value.isoformat(' ', 'seconds')
+
+
+def adapt_date(value):
+    return value.isoformat()
+
+
+sqlite3.register_adapter(datetime, adapt_datetime)
+sqlite3.register_adapter(date, adapt_date)
+sqlite3.register_converter('TIMESTAMP', lambda value: parse_timestamp(value.decode()))
+sqlite3.register_converter('DATETIME', lambda value: parse_timestamp(value.decode()))
+sqlite3.register_converter('DATE', lambda value: parse_date(value.decode()))
+
+
+def connect(database, **kwargs):
+    """Open a connection with typed columns and sqlite3.Row rows"""
+    conn = sqlite3.connect(database, detect_types=DETECT_TYPES, **kwargs)
+    conn.row_factory = sqlite3.Row
+    return conn
+
+
+def trim_microseconds(conn):
+    """Rewrite stored timestamps that have fractional seconds; returns how many"""
+    trimmed = 0
+    tables = [row[0] for row in conn.execute(
+        "SELECT name FROM sqlite_master WHERE type = 'table' AND name NOT LIKE 'sqlite_%'")]
+    for table in tables:
+        for column in conn.execute(f'PRAGMA table_info("{table}")').fetchall():
+            if column[2].upper() in ('TIMESTAMP', 'DATETIME'):
+                trimmed += conn.execute(
+                    f'UPDATE "{table}" SET "{column[1]}" = substr("{column[1]}", 1, 19) '
+                    f'WHERE "{column[1]}" LIKE \'____-__-__ __:__:__.%\'').rowcount
+    conn.commit()
+    return trimmed
+
+
+if __name__ == '__main__':
+    if len(sys.argv) != 2:
+        sys.exit('usage: python db_types.py DATABASE')
+    conn = sqlite3.connect(sys.argv[1])
+    try:
+        print(f"Trimmed {trim_microseconds(conn)} timestamp(s)")
+    finally:
+        conn.close()
@@ -0,0 +1,217 @@
+"""
+Evidence attachments for assessment scores.
+
+Uploads are copied to disk in fixed-size chunks while being hashed, so a file
+is never held in memory as a whole. Files are stored once per SHA-256 under
+UPLOAD_FOLDER/<aa>/<bb>/<digest>, no matter how many scores or projects
+attach them; files are placed and deleted under the database write lock, so
+a concurrent attach and detach of the same file cannot lose it. Previews are
+generated by a small background worker pool (image thumbnails need Pillow).
+"""
+import hashlib
+import os
+import sqlite3
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+
+CHUNK_SIZE = 64 * 1024
+
+NUM_SDGS = 17
+
+PREVIEW_SIZE = (320, 320)
+TEXT_PREVIEW_BYTES = 2048
+
+TEXT_TYPES = ('text/plain', 'text/csv', 'text/markdown')
+IMAGE_TYPES = ('image/png', 'image/jpeg', 'image/gif', 'image/webp')
+
+# Previews and tagging of new uploads run here, off the request thread
+background_pool = ThreadPoolExecutor(max_workers=2, thread_name_prefix='evidence')
+
+
+def blob_path(upload_folder, digest):
+    """Path of the stored file for a SHA-256 digest"""
+    return os.path.join(upload_folder, digest[:2], digest[2:4], digest)
+
+
+def preview_path(upload_folder, digest, kind):
+    """Path of the generated preview ('png' for images, 'txt' for text)"""
+    return os.path.join(upload_folder, 'previews', f'{digest}.{kind}')
+
+
+def spool_stream(stream, upload_folder, max_size=None):
+    """Copy a stream to a temporary file in upload_folder while hashing it; return (tmp_path, digest, size)"""
+    os.makedirs(upload_folder, exist_ok=True)
+    digest = hashlib.sha256()
+    size = 0
+    fd, tmp_path = tempfile.mkstemp(prefix='upload-', dir=upload_folder)
+    try:
+        with os.fdopen(fd, 'wb') as tmp:
+            while True:
+                chunk = stream.read(CHUNK_SIZE)
+                if not chunk:
+                    break
+                size += len(chunk)
+                if max_size and size > max_size:
+                    raise ValueError('File is too large')
+                digest.update(chunk)
+                tmp.write(chunk)
+        return tmp_path, digest.hexdigest(), size
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+def _begin(conn):
+    # Stored files are only added or removed while holding the database write lock
+    if conn.in_transaction:
+        conn.commit()
+    conn.execute('BEGIN IMMEDIATE')
+
+
+def attach(conn, assessment_id, sdg_id, user_id, file_storage, upload_folder, max_size=None):
+    """Store an uploaded file and link it to a score
+
+    Returns (evidence_id, digest, created); created is False for a duplicate file.
+    """
+    if not 1 <= sdg_id <= NUM_SDGS:
+        raise ValueError(f'Unknown SDG: {sdg_id}')
+    tmp_path, digest, size = spool_stream(file_storage.stream, upload_folder, max_size)
+    content_type = file_storage.mimetype or 'application/octet-stream'
+
+    placed = False
+    try:
+        # Placing the file and linking it is atomic with detach's check whether it is still used
+        _begin(conn)
+        path = blob_path(upload_folder, digest)
+        if not os.path.exists(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            os.replace(tmp_path, path)
+            placed = True
+        created = conn.execute('''
+            INSERT OR IGNORE INTO evidence_blobs (sha256, size, content_type)
+            VALUES (?, ?, ?)
+        ''', (digest, size, content_type)).rowcount == 1
+        cursor = conn.execute('''
+            INSERT INTO evidence (assessment_id, sdg_id, sha256, filename, user_id)
+            VALUES (?, ?, ?, ?, ?)
+        ''', (assessment_id, sdg_id, digest, os.path.basename(file_storage.filename or 'upload'), user_id))
+        conn.commit()
+    except BaseException:
+        conn.rollback()
+        if placed:
+            # Still under the write lock: no row can have come to reference it
+            os.remove(path)
+        raise
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+    if created:
+        schedule_preview(conn_path(conn), upload_folder, digest, content_type)
+    return cursor.lastrowid, digest, created
+
+
+def detach(conn, evidence_id, upload_folder):
+    """Remove an attachment, deleting the stored file once nothing references it"""
+    _begin(conn)
+    row = conn.execute('SELECT sha256 FROM evidence WHERE id = ?', (evidence_id,)).fetchone()
+    if not row:
+        conn.rollback()
+        return
+    digest = row['sha256']
+    conn.execute('DELETE FROM evidence WHERE id = ?', (evidence_id,))
+    still_used = conn.execute('SELECT 1 FROM evidence WHERE sha256 = ? LIMIT 1', (digest,)).fetchone()
+    if not still_used:
+        conn.execute('DELETE FROM evidence_tags WHERE sha256 = ?', (digest,))
+        conn.execute('DELETE FROM evidence_blobs WHERE sha256 = ?', (digest,))
+    conn.commit()
+
+    if not still_used:
+        remove_unused_files(conn, upload_folder, digest)
+
+
+def remove_unused_files(conn, upload_folder, digest):
+    """Delete a blob's file and previews, unless an attach has stored it again since
+
+    Runs after detach's commit rather than before it, so a failed commit
+    never leaves rows pointing at a deleted file.
+    """
+    _begin(conn)
+    try:
+        if conn.execute('SELECT 1 FROM evidence_blobs WHERE sha256 = ?', (digest,)).fetchone():
+            return
+        for path in (blob_path(upload_folder, digest),
+                     preview_path(upload_folder, digest, 'png'),
+                     preview_path(upload_folder, digest, 'txt')):
+            if os.path.exists(path):
+                os.remove(path)
+    finally:
+        conn.commit()
+
+
+def list_for_assessment(conn, assessment_id):
+    """Return {sdg_id: [evidence rows]} for an assessment"""
+    rows = conn.execute('''
+        SELECT e.id, e.sdg_id, e.filename, e.created_at, b.size, b.content_type, b.preview_status,
+               b.tag_status
+        FROM evidence e
+        JOIN evidence_blobs b ON b.sha256 = e.sha256
+        WHERE e.assessment_id = ?
+        ORDER BY e.created_at
+    ''', (assessment_id,)).fetchall()
+    grouped = {}
+    for row in rows:
+        grouped.setdefault(row['sdg_id'], []).append(row)
+    return grouped
+
+
+def conn_path(conn):
+    """File name of the main database of a connection"""
+    return conn.execute('PRAGMA database_list').fetchone()[2]
+
+
+def schedule_preview(db_path, upload_folder, digest, content_type):
+    """Queue preview generation on the background pool"""
+    return background_pool.submit(generate_preview, db_path, upload_folder, digest, content_type)
+
+
+def generate_preview(db_path, upload_folder, digest, content_type):
+    """Write a thumbnail or text excerpt for a stored file and record the outcome"""
+    source = blob_path(upload_folder, digest)
+    status = 'none'
+    try:
+        if content_type in TEXT_TYPES:
+            with open(source, 'rb') as f:
+                excerpt = f.read(TEXT_PREVIEW_BYTES)
+            _write_preview(preview_path(upload_folder, digest, 'txt'), excerpt)
+            status = 'txt'
+        elif content_type in IMAGE_TYPES:
+            try:
+                from PIL import Image
+            except ImportError:
+                Image = None
+            if Image is not None:
+                target = preview_path(upload_folder, digest, 'png')
+                os.makedirs(os.path.dirname(target), exist_ok=True)
+                with Image.open(source) as image:
+                    image.thumbnail(PREVIEW_SIZE)
+                    image.save(target, 'PNG')
+                status = 'png'
+    except Exception as e:
+        print(f"Preview generation failed for {digest}: {e}")
+        status = 'failed'
+
+    conn = sqlite3.connect(db_path)
+    try:
+        conn.execute('UPDATE evidence_blobs SET preview_status = ? WHERE sha256 = ?', (status, digest))
+        conn.commit()
+    finally:
+        conn.close()
+    return status
+
+
+def _write_preview(path, data):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'wb') as f:
+        f.write(data)
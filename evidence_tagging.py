@@ -0,0 +1,309 @@
+"""
+Tag evidence files with the SDGs they mention.
+
+A single Aho-Corasick automaton is built from the SDG names, titles, targets
+and applications used by the wizard. Documents are scanned in one streaming
+pass (text is decoded incrementally, PDFs page by page) and per-SDG hit counts
+and character offsets are stored per file digest, so a file shared by several
+assessments is only tagged once.
+
+Overlapping phrases are resolved leftmost-longest: "climate action" counts
+once for SDG 13, not again as "climate" (which also names SDG 1).
+
+Run directly to tag every pending file using a process pool:
+
+    python evidence_tagging.py [--workers N] [--retag]
+"""
+import argparse
+import codecs
+import json
+import os
+import sqlite3
+import sys
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+import evidence
+from config import Config
+from sdg_content import SDG_GOALS, SDG_TITLES, SDG_TARGETS, SDG_APPLICATIONS
+
+# Offsets kept per SDG and file; hit counts are always exact
+MAX_OFFSETS = 50
+
+READ_CHUNK = 64 * 1024
+
+# Words too generic to count as evidence for any particular goal
+GENERIC_WORDS = frozenset('''
+    about access achieve action adequate all among and building buildings by
+    design ensure equitable for from improve including increase into levels
+    measures other practices promote provide reduce safe solutions substantially
+    sustainable sustainably systems take their through universal using with
+'''.split())
+
+TEXT_TYPES = evidence.TEXT_TYPES
+PDF_TYPES = ('application/pdf',)
+
+
+def _normalise(text):
+    return ' '.join(''.join(c if c.isalnum() else ' ' for c in text.lower()).split())
+
+
+def sdg_vocabulary():
+    """Return {phrase: {sdg numbers}} built from the wizard's SDG texts"""
+    vocabulary = {}
+
+    def add(phrase, number):
+        phrase = _normalise(phrase)
+        if phrase:
+            vocabulary.setdefault(phrase, set()).add(number)
+
+    for number, name, _, _ in SDG_GOALS:
+        add(name, number)
+    for number, title in SDG_TITLES.items():
+        add(title, number)
+    for number, applications in SDG_APPLICATIONS.items():
+        for application in applications:
+            add(application, number)
+            for word in _normalise(application).split():
+                if len(word) >= 5 and word not in GENERIC_WORDS:
+                    add(word, number)
+    for number, targets in SDG_TARGETS.items():
+        for target in targets:
+            for word in _normalise(target['text']).split():
+                if len(word) >= 5 and word not in GENERIC_WORDS:
+                    add(word, number)
+    return vocabulary
+
+
+class Automaton:
+    """Aho-Corasick automaton over whole-word phrases"""
+
+    def __init__(self, vocabulary):
+        self.goto = [{}]
+        self.fail = [0]
+        self.output = [()]
+        # Patterns are padded with spaces so matches fall on word boundaries
+        patterns = [(' ' + phrase + ' ', tuple(sorted(sdgs))) for phrase, sdgs in vocabulary.items()]
+        self.max_length = max((len(p) for p, _ in patterns), default=0)
+
+        for pattern, sdgs in patterns:
+            state = 0
+            for char in pattern:
+                if char not in self.goto[state]:
+                    self.goto.append({})
+                    self.fail.append(0)
+                    self.output.append(())
+                    self.goto[state][char] = len(self.goto) - 1
+                state = self.goto[state][char]
+            self.output[state] = self.output[state] + ((len(pattern), sdgs),)
+
+        queue = deque(self.goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for char, child in self.goto[state].items():
+                queue.append(child)
+                fallback = self.fail[state]
+                while fallback and char not in self.goto[fallback]:
+                    fallback = self.fail[fallback]
+                self.fail[child] = self.goto[fallback].get(char, 0)
+                self.output[child] = self.output[child] + self.output[self.fail[child]]
+
+    def scanner(self):
+        return Scanner(self)
+
+
+class Scanner:
+    """Streaming matcher: feed text chunks in order, then call finish()"""
+
+    def __init__(self, automaton):
+        self.automaton = automaton
+        self.state = 0
+        self.offset = 0
+        self.previous = ' '
+        # Original offsets of the most recent normalised characters
+        self.positions = deque(maxlen=max(automaton.max_length, 1))
+        # Index of the next normalised character
+        self.index = 0
+        # Matches that a longer one starting at the same place may still replace:
+        # start index -> (end index, sdgs, original offset)
+        self.pending = {}
+        self.accepted_end = -1
+        self.hits = {}
+        self.offsets = {}
+        self._step(' ', 0)
+
+    def feed(self, text):
+        for char in text:
+            normalised = char.lower() if char.isalnum() else ' '
+            if not (normalised == ' ' and self.previous == ' '):
+                self._step(normalised, self.offset)
+                self.previous = normalised
+            self.offset += 1
+
+    def finish(self):
+        """Flush the trailing word boundary and return {sdg: (hits, offsets)}"""
+        if self.previous != ' ':
+            self._step(' ', self.offset)
+        self._settle(self.index)
+        return {sdg: (self.hits[sdg], self.offsets[sdg]) for sdg in self.hits}
+
+    def _step(self, char, position):
+        goto, fail = self.automaton.goto, self.automaton.fail
+        state = self.state
+        while state and char not in goto[state]:
+            state = fail[state]
+        state = goto[state].get(char, 0)
+        self.state = state
+        self.positions.append(position)
+        index = self.index
+        self.index += 1
+
+        for length, sdgs in self.automaton.output[state]:
+            # The span between the pattern's padding spaces, which neighbouring words share
+            start, end = index - length + 2, index - 1
+            if start not in self.pending or self.pending[start][0] < end:
+                # Skip the pattern's leading space to get the offset of its first word
+                self.pending[start] = (end, sdgs, self.positions[-length + 1])
+        if self.pending:
+            # No match still to come can start before this
+            self._settle(index - self.automaton.max_length + 2)
+
+    def _settle(self, before):
+        """Count the longest pending match at each start before index, skipping overlaps"""
+        for start in sorted(s for s in self.pending if s < before):
+            end, sdgs, offset = self.pending.pop(start)
+            if start <= self.accepted_end:
+                continue
+            self.accepted_end = end
+            for sdg in sdgs:
+                self.hits[sdg] = self.hits.get(sdg, 0) + 1
+                offsets = self.offsets.setdefault(sdg, [])
+                if len(offsets) < MAX_OFFSETS:
+                    offsets.append(offset)
+
+
+_automaton = None
+
+
+def get_automaton():
+    """Build the automaton once per process"""
+    global _automaton
+    if _automaton is None:
+        _automaton = Automaton(sdg_vocabulary())
+    return _automaton
+
+
+def extract_text_chunks(path, content_type):
+    """Yield the text of a file in chunks; raise ValueError for unsupported types"""
+    if content_type in TEXT_TYPES:
+        decoder = codecs.getincrementaldecoder('utf-8')(errors='replace')
+        with open(path, 'rb') as f:
+            while True:
+                data = f.read(READ_CHUNK)
+                if not data:
+                    break
+                yield decoder.decode(data)
+            yield decoder.decode(b'', final=True)
+    elif content_type in PDF_TYPES:
+        try:
+            from pypdf import PdfReader
+        except ImportError:
+            raise ValueError('PDF tagging requires the pypdf package')
+        reader = PdfReader(path)
+        for page in reader.pages:
+            yield (page.extract_text() or '') + '\n'
+    else:
+        raise ValueError(f'Unsupported content type: {content_type}')
+
+
+def scan_file(path, content_type):
+    """Return {sdg: (hits, offsets)} for a file in one streaming pass"""
+    scanner = get_automaton().scanner()
+    for chunk in extract_text_chunks(path, content_type):
+        scanner.feed(chunk)
+    return scanner.finish()
+
+
+def _scan_job(job):
+    """Process-pool entry point; returns (digest, status, tags)"""
+    digest, path, content_type = job
+    try:
+        return digest, 'done', scan_file(path, content_type)
+    except ValueError:
+        return digest, 'unsupported', {}
+    except Exception as e:
+        print(f"Tagging failed for {digest}: {e}", file=sys.stderr)
+        return digest, 'failed', {}
+
+
+def save_tags(conn, digest, status, tags):
+    """Replace the stored tags of a file"""
+    conn.execute('DELETE FROM evidence_tags WHERE sha256 = ?', (digest,))
+    conn.executemany(
+        'INSERT INTO evidence_tags (sha256, sdg_id, hits, offsets) VALUES (?, ?, ?, ?)',
+        [(digest, sdg, hits, json.dumps(offsets)) for sdg, (hits, offsets) in tags.items()]
+    )
+    conn.execute('UPDATE evidence_blobs SET tag_status = ? WHERE sha256 = ?', (status, digest))
+    conn.commit()
+
+
+def tag_blob(db_path, upload_folder, digest, content_type):
+    """Tag one stored file in the current process (used right after an upload)"""
+    _, status, tags = _scan_job((digest, evidence.blob_path(upload_folder, digest), content_type))
+    conn = sqlite3.connect(db_path)
+    try:
+        save_tags(conn, digest, status, tags)
+    finally:
+        conn.close()
+    return status
+
+
+def schedule(db_path, upload_folder, digest, content_type):
+    """Queue tagging of a newly stored file on the evidence background pool"""
+    return evidence.background_pool.submit(tag_blob, db_path, upload_folder, digest, content_type)
+
+
+def tag_pending(db_path, upload_folder, workers=None, retag=False):
+    """Tag every pending file using a process pool; return {status: count}"""
+    conn = sqlite3.connect(db_path)
+    query = 'SELECT sha256, content_type FROM evidence_blobs'
+    if not retag:
+        query += " WHERE tag_status = 'pending'"
+    jobs = [(digest, evidence.blob_path(upload_folder, digest), content_type)
+            for digest, content_type in conn.execute(query).fetchall()]
+
+    counts = {}
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        # Results are written from this process only, so SQLite sees a single writer
+        for digest, status, tags in pool.map(_scan_job, jobs, chunksize=8):
+            save_tags(conn, digest, status, tags)
+            counts[status] = counts.get(status, 0) + 1
+    conn.close()
+    return counts
+
+
+def tags_for_assessment(conn, assessment_id):
+    """Return {evidence_id: [(sdg_id, hits), ...]} sorted by hits"""
+    rows = conn.execute('''
+        SELECT e.id AS evidence_id, t.sdg_id, t.hits
+        FROM evidence e
+        JOIN evidence_tags t ON t.sha256 = e.sha256
+        WHERE e.assessment_id = ?
+        ORDER BY e.id, t.hits DESC
+    ''', (assessment_id,)).fetchall()
+    tags = {}
+    for row in rows:
+        tags.setdefault(row['evidence_id'], []).append((row['sdg_id'], row['hits']))
+    return tags
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Tag evidence files with the SDGs they mention')
+    parser.add_argument('--database', default=os.path.join('instance', 'sdg_assessment.db'))
+    parser.add_argument('--uploads', default=Config.UPLOAD_FOLDER)
+    parser.add_argument('--workers', type=int, default=None)
+    parser.add_argument('--retag', action='store_true', help='Tag every file again, not just pending ones')
+    args = parser.parse_args()
+
+    counts = tag_pending(args.database, args.uploads, args.workers, args.retag)
+    print("Tagging complete:", ', '.join(f'{status}={count}' for status, count in sorted(counts.items())) or 'nothing to do')
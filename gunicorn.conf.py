@@ -0,0 +1,24 @@
+"""
+Gunicorn settings, read automatically when gunicorn starts in this directory:
+
+    FAST_STARTUP=1 gunicorn -w 4 app_simple:app
+
+With FAST_STARTUP=1 the app is imported once in the master, where startup.py
+compiles the templates, preloads shared data and warms the main pages, and
+the workers are forked from it already warm. Either way, background threads
+are started in each worker after the fork, never by importing the app.
+
+The ASGI entry point runs under the same settings with uvicorn's worker:
+
+    FAST_STARTUP=1 gunicorn -k uvicorn.workers.UvicornWorker -w 4 asgi:application
+"""
+import os
+
+fast_startup = os.environ.get('FAST_STARTUP', '0') == '1'
+
+preload_app = fast_startup
+
+
+def post_fork(server, worker):
+    from app_simple import after_fork
+    after_fork()
@@ -1,17 +1,25 @@
 """
 Database initialization script for the SDG Assessment Tool.
 """
+import contextlib
+import io
 import os
 import sys
 from datetime import datetime
 import sqlite3
 
-def init_db():
+from sdg_content import SDG_GOALS
+
+def init_db(path=os.path.join('instance', 'sdg_assessment.db')):
     """Initialize the database with SDG data."""
     # Connect to SQLite database (will create if it doesn't exist)
-    conn = sqlite3.connect('instance/sdg_assessment.db')
+    conn = sqlite3.connect(path)
     cursor = conn.cursor()
     
+    # Let db_maintenance.py give space back in small steps; only takes effect
+    # before the first table is created
+    cursor.execute("PRAGMA auto_vacuum = INCREMENTAL")
+    
     # Create tables
     cursor.execute('''
     CREATE TABLE IF NOT EXISTS sdg_goals (
@@ -41,25 +49,7 @@ def init_db():
     
     if sdg_count == 0:
         print("Adding SDG goals...")
-        sdgs = [
-            (1, "No Poverty", "End poverty in all its forms everywhere", "#E5243B"),
-            (2, "Zero Hunger", "End hunger, achieve food security and improved nutrition and promote sustainable agriculture", "#DDA63A"),
-            (3, "Good Health and Well-being", "Ensure healthy lives and promote well-being for all at all ages", "#4C9F38"),
-            (4, "Quality Education", "Ensure inclusive and equitable quality education and promote lifelong learning opportunities for all", "#C5192D"),
-            (5, "Gender Equality", "Achieve gender equality and empower all women and girls", "#FF3A21"),
-            (6, "Clean Water and Sanitation", "Ensure availability and sustainable management of water and sanitation for all", "#26BDE2"),
-            (7, "Affordable and Clean Energy", "Ensure access to affordable, reliable, sustainable and modern energy for all", "#FCC30B"),
-            (8, "Decent Work and Economic Growth", "Promote sustained, inclusive and sustainable economic growth, full and productive employment and decent work for all", "#A21942"),
-            (9, "Industry, Innovation and Infrastructure", "Build resilient infrastructure, promote inclusive and sustainable industrialization and foster innovation", "#FD6925"),
-            (10, "Reduced Inequality", "Reduce inequality within and among countries", "#DD1367"),
-            (11, "Sustainable Cities and Communities", "Make cities and human settlements inclusive, safe, resilient and sustainable", "#FD9D24"),
-            (12, "Responsible Consumption and Production", "Ensure sustainable consumption and production patterns", "#BF8B2E"),
-            (13, "Climate Action", "Take urgent action to combat climate change and its impacts", "#3F7E44"),
-            (14, "Life Below Water", "Conserve and sustainably use the oceans, seas and marine resources for sustainable development", "#0A97D9"),
-            (15, "Life on Land", "Protect, restore and promote sustainable use of terrestrial ecosystems, sustainably manage forests, combat desertification, and halt and reverse land degradation and halt biodiversity loss", "#56C02B"),
-            (16, "Peace, Justice and Strong Institutions", "Promote peaceful and inclusive societies for sustainable development, provide access to justice for all and build effective, accountable and inclusive institutions at all levels", "#00689D"),
-            (17, "Partnerships for the Goals", "Strengthen the means of implementation and revitalize the global partnership for sustainable development", "#19486A")
-        ]
+        sdgs = SDG_GOALS
         
         cursor.executemany("INSERT INTO sdg_goals (number, name, description, color_code) VALUES (?, ?, ?, ?)", sdgs)
         conn.commit()
@@ -108,19 +98,21 @@ def init_db():
         created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
         updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
         user_id INTEGER NOT NULL,
+        deleted_at TIMESTAMP,
         FOREIGN KEY (user_id) REFERENCES users (id)
     )
     ''')
     
-    # Create assessments table with enhanced fields
+    # Create assessments table with enhanced fields; ids are never reused, as score_audit is keyed by them
     cursor.execute('''
     CREATE TABLE IF NOT EXISTS assessments (
-        id INTEGER PRIMARY KEY,
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
         project_id INTEGER NOT NULL,
         version INTEGER DEFAULT 1,
         status TEXT DEFAULT 'draft',
         completed_at TIMESTAMP,
         overall_score REAL,
+        row_version INTEGER DEFAULT 1,
         created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
         updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
         FOREIGN KEY (project_id) REFERENCES projects (id)
@@ -162,6 +154,7 @@ def init_db():
         status TEXT DEFAULT 'planned',
         target_date DATE,
         completion_date DATE,
+        reminded_on DATE,
         created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
         updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
         FOREIGN KEY (assessment_id) REFERENCES assessments (id),
@@ -169,16 +162,153 @@ def init_db():
     )
     ''')
     
+    # Create evidence tables: files are stored once per SHA-256 and linked to scores
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS evidence_blobs (
+        sha256 TEXT PRIMARY KEY,
+        size INTEGER NOT NULL,
+        content_type TEXT,
+        preview_status TEXT DEFAULT 'pending',
+        tag_status TEXT DEFAULT 'pending',
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )
+    ''')
+    
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS evidence (
+        id INTEGER PRIMARY KEY,
+        assessment_id INTEGER NOT NULL,
+        sdg_id INTEGER NOT NULL,
+        sha256 TEXT NOT NULL,
+        filename TEXT NOT NULL,
+        user_id INTEGER,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        FOREIGN KEY (assessment_id) REFERENCES assessments (id),
+        FOREIGN KEY (sdg_id) REFERENCES sdg_goals (id),
+        FOREIGN KEY (sha256) REFERENCES evidence_blobs (sha256)
+    )
+    ''')
+    
+    # SDG keyword hits found in each stored evidence file
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS evidence_tags (
+        sha256 TEXT NOT NULL,
+        sdg_id INTEGER NOT NULL,
+        hits INTEGER NOT NULL,
+        offsets TEXT,
+        PRIMARY KEY (sha256, sdg_id),
+        FOREIGN KEY (sha256) REFERENCES evidence_blobs (sha256)
+    )
+    ''')
+    
+    # Outgoing email queue, drained by the background sender in mail_outbox.py
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS mail_outbox (
+        id INTEGER PRIMARY KEY,
+        recipient TEXT NOT NULL,
+        subject TEXT NOT NULL,
+        body TEXT,
+        html TEXT,
+        status TEXT DEFAULT 'pending',
+        attempts INTEGER DEFAULT 0,
+        last_error TEXT,
+        next_attempt_at TIMESTAMP,
+        claim_token TEXT,
+        claimed_at TIMESTAMP,
+        sent_at TIMESTAMP,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )
+    ''')
+    
+    # Recent score/notes changes, polled by live_updates.py to feed SSE viewers
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS assessment_changes (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        assessment_id INTEGER NOT NULL,
+        sdg_id INTEGER NOT NULL,
+        score INTEGER,
+        notes TEXT,
+        changed_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )
+    ''')
+    cursor.execute('''
+    CREATE TRIGGER IF NOT EXISTS trg_sdg_scores_insert_change AFTER INSERT ON sdg_scores
+    BEGIN
+        INSERT INTO assessment_changes (assessment_id, sdg_id, score, notes)
+        VALUES (NEW.assessment_id, NEW.sdg_id, NEW.score, NEW.notes);
+    END
+    ''')
+    cursor.execute('''
+    CREATE TRIGGER IF NOT EXISTS trg_sdg_scores_update_change AFTER UPDATE OF score, notes ON sdg_scores
+    WHEN OLD.score IS NOT NEW.score OR OLD.notes IS NOT NEW.notes
+    BEGIN
+        INSERT INTO assessment_changes (assessment_id, sdg_id, score, notes)
+        VALUES (NEW.assessment_id, NEW.sdg_id, NEW.score, NEW.notes);
+    END
+    ''')
+    
+    # One row per maintenance task run by db_maintenance.py
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS maintenance_runs (
+        id INTEGER PRIMARY KEY,
+        task TEXT NOT NULL,
+        status TEXT NOT NULL,
+        detail TEXT,
+        duration_seconds REAL,
+        bytes_reclaimed INTEGER DEFAULT 0,
+        file_bytes INTEGER,
+        started_at TIMESTAMP NOT NULL
+    )
+    ''')
+    
+    # Append-only audit trail of score and notes changes, written by score_audit.py
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS score_audit (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        assessment_id INTEGER NOT NULL,
+        sdg_id INTEGER NOT NULL,
+        field TEXT NOT NULL,
+        old_value,
+        new_value,
+        user_id INTEGER,
+        source TEXT,
+        changed_at TIMESTAMP NOT NULL
+    )
+    ''')
+    cursor.execute('''
+    CREATE TRIGGER IF NOT EXISTS trg_score_audit_no_update BEFORE UPDATE ON score_audit
+    BEGIN
+        SELECT RAISE(ABORT, 'score_audit is append-only');
+    END
+    ''')
+    cursor.execute('''
+    CREATE TRIGGER IF NOT EXISTS trg_score_audit_no_delete BEFORE DELETE ON score_audit
+    BEGIN
+        SELECT RAISE(ABORT, 'score_audit is append-only');
+    END
+    ''')
+    
+    # Projects whose similar-project vector changed, read by every worker's index
+    from similar_projects import ensure_table as ensure_vector_changes
+    ensure_vector_changes(conn)
+    
     # Create indexes for better performance
     print("Creating indexes...")
     
     # Projects indexes
     cursor.execute("CREATE INDEX IF NOT EXISTS idx_projects_user_id ON projects (user_id)")
     cursor.execute("CREATE INDEX IF NOT EXISTS idx_projects_status ON projects (status)")
+    # Soft-deleted projects only, for the purger and the restore list
+    cursor.execute('''
+    CREATE INDEX IF NOT EXISTS idx_projects_deleted_at ON projects (deleted_at)
+    WHERE deleted_at IS NOT NULL
+    ''')
     
     # Assessments indexes
     cursor.execute("CREATE INDEX IF NOT EXISTS idx_assessments_project_id ON assessments (project_id)")
     cursor.execute("CREATE INDEX IF NOT EXISTS idx_assessments_status ON assessments (status)")
+    # Assessments finalized since a watermark, for the similar-project index refresh
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_assessments_status_completed ON assessments (status, completed_at)")
     
     # SDG scores indexes
     cursor.execute("CREATE INDEX IF NOT EXISTS idx_sdg_scores_assessment_id ON sdg_scores (assessment_id)")
@@ -188,13 +318,48 @@ def init_db():
     cursor.execute("CREATE INDEX IF NOT EXISTS idx_sdg_actions_assessment_id ON sdg_actions (assessment_id)")
     cursor.execute("CREATE INDEX IF NOT EXISTS idx_sdg_actions_sdg_id ON sdg_actions (sdg_id)")
     cursor.execute("CREATE INDEX IF NOT EXISTS idx_sdg_actions_status ON sdg_actions (status)")
+    # Partial index over open actions only, used by the overdue dashboard and reminders
+    cursor.execute('''
+    CREATE INDEX IF NOT EXISTS idx_sdg_actions_open_due ON sdg_actions (status, target_date)
+    WHERE completion_date IS NULL
+    ''')
+    
+    # Evidence indexes
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_evidence_assessment_id ON evidence (assessment_id, sdg_id)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_evidence_sha256 ON evidence (sha256)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_evidence_blobs_tag_status ON evidence_blobs (tag_status)")
+    
+    # Mail outbox indexes
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_mail_outbox_due ON mail_outbox (status, next_attempt_at)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_mail_outbox_claim ON mail_outbox (claim_token)")
+    
+    # Change log index, for replaying missed changes to a reconnecting viewer
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_assessment_changes_assessment ON assessment_changes (assessment_id, id)")
+    # and for the scheduled prune of old changes
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_assessment_changes_changed_at ON assessment_changes (changed_at)")
+    
+    # Score audit indexes, for the history of an assessment or of a user
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_score_audit_assessment ON score_audit (assessment_id, id)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_score_audit_user ON score_audit (user_id, id)")
     
     conn.commit()
     conn.close()
     
     print("Database initialization complete.")
 
+def make_scratch_db(directory):
+    """Create a database with the app's schema in directory and return its path
+
+    For the tests, checks and benchmarks; init_db()'s progress output is
+    discarded.
+    """
+    path = os.path.join(directory, 'instance', 'sdg_assessment.db')
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with contextlib.redirect_stdout(io.StringIO()):
+        init_db(path)
+    return path
+
 if __name__ == '__main__':
     # Make sure instance directory exists
     os.makedirs('instance', exist_ok=True)
-    init_db()
\ No newline at end of file
+    init_db()
\ No newline at end of file
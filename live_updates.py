@@ -0,0 +1,137 @@
+"""
+Live score and notes updates for assessment viewers, over Server-Sent Events.
+
+Triggers on sdg_scores append every committed change to assessment_changes.
+One poller thread per worker reads new rows from that table (a primary-key
+range scan) and hands them to an in-process pub/sub, which fans them out to
+every open stream in that worker. N viewers therefore cost one cheap poll
+per worker instead of N full page renders. The log is trimmed to
+RETENTION_SECONDS by prune(), which the project purger runs on its schedule
+whether or not anyone is watching.
+
+Each open stream holds a worker thread, so serve this with threaded or
+gevent gunicorn workers rather than the default sync ones.
+"""
+import json
+import queue
+import threading
+import time
+
+POLL_INTERVAL = 1.0
+KEEPALIVE_SECONDS = 15
+
+# Change-log rows older than this are deleted by prune()
+RETENTION_SECONDS = 3600
+
+SUBSCRIBER_QUEUE_SIZE = 100
+
+
+def change_event(row):
+    """Format a change-log row as an SSE message"""
+    data = json.dumps({'sdg_id': row['sdg_id'], 'score': row['score'], 'notes': row['notes'],
+                       'changed_at': str(row['changed_at'])})
+    return f"id: {row['id']}\nevent: score\ndata: {data}\n\n"
+
+
+def prune(conn, retention=RETENTION_SECONDS):
+    """Delete change-log rows older than retention seconds; returns how many"""
+    removed = conn.execute("DELETE FROM assessment_changes WHERE changed_at < datetime('now', ?)",
+                           (f'-{retention} seconds',)).rowcount
+    conn.commit()
+    return removed
+
+
+class ChangeFeed:
+    """In-process pub/sub fed by polling the assessment_changes table"""
+
+    def __init__(self, connect, interval=POLL_INTERVAL):
+        self.connect = connect
+        self.interval = interval
+        self._lock = threading.Lock()
+        self._subscribers = {}  # assessment_id -> set of queues
+        self._last_id = None
+        self._thread = None
+
+    def subscribe(self, conn, assessment_id):
+        """Register a viewer; changes committed from now on reach its queue"""
+        subscriber = queue.Queue(maxsize=SUBSCRIBER_QUEUE_SIZE)
+        with self._lock:
+            self._subscribers.setdefault(assessment_id, set()).add(subscriber)
+            if self._thread is None:
+                # Start from the current end of the log, read before we return
+                self._last_id = conn.execute('SELECT MAX(id) FROM assessment_changes').fetchone()[0] or 0
+                self._thread = threading.Thread(target=self._run, name='change-feed', daemon=True)
+                self._thread.start()
+        return subscriber
+
+    def unsubscribe(self, assessment_id, subscriber):
+        with self._lock:
+            subscribers = self._subscribers.get(assessment_id)
+            if subscribers:
+                subscribers.discard(subscriber)
+                if not subscribers:
+                    del self._subscribers[assessment_id]
+
+    def backlog(self, conn, assessment_id, after_id):
+        """Changes a reconnecting client missed (from its Last-Event-ID)
+
+        Read after subscribe() so nothing falls between the two.
+        """
+        return conn.execute('''
+            SELECT * FROM assessment_changes
+            WHERE assessment_id = ? AND id > ?
+            ORDER BY id
+        ''', (assessment_id, after_id)).fetchall()
+
+    def poll(self, conn):
+        """Read new change-log rows once and publish them; return how many were read"""
+        rows = conn.execute('SELECT * FROM assessment_changes WHERE id > ? ORDER BY id LIMIT 500',
+                            (self._last_id,)).fetchall()
+        for row in rows:
+            with self._lock:
+                subscribers = list(self._subscribers.get(row['assessment_id'], ()))
+            event = change_event(row)
+            for subscriber in subscribers:
+                try:
+                    subscriber.put_nowait(event)
+                except queue.Full:
+                    # A stalled client; it can catch up with Last-Event-ID on reconnect
+                    pass
+            self._last_id = row['id']
+        return len(rows)
+
+    def _run(self):
+        conn = self.connect()
+        try:
+            while True:
+                with self._lock:
+                    if not self._subscribers:
+                        # Nobody is watching; the next subscribe() starts a fresh poller
+                        self._thread = None
+                        return
+                try:
+                    if not self.poll(conn):
+                        time.sleep(self.interval)
+                except Exception as e:
+                    print(f"Change feed poll failed: {e}")
+                    time.sleep(self.interval)
+        finally:
+            conn.close()
+
+    def stream(self, assessment_id, subscriber, backlog=()):
+        """Generator of SSE messages for one subscribed viewer
+
+        The backlog may overlap with queued changes; clients ignore event ids
+        they have already seen.
+        """
+        try:
+            yield f"retry: {int(self.interval * 3000)}\n\n"
+            for row in backlog:
+                yield change_event(row)
+            while True:
+                try:
+                    yield subscriber.get(timeout=KEEPALIVE_SECONDS)
+                except queue.Empty:
+                    yield ': keepalive\n\n'
+        finally:
+            self.unsubscribe(assessment_id, subscriber)
@@ -0,0 +1,190 @@
+"""
+Outbound email through an outbox table.
+
+Request handlers only INSERT into mail_outbox. A background sender claims
+pending rows in batches, sends each batch over one SMTP connection with a
+simple rate limit, and retries failures with exponential backoff. Claims
+are made with a single UPDATE, so several workers can run senders safely.
+
+Run directly to drain the outbox (e.g. from cron or a process manager):
+
+    python mail_outbox.py [--once]
+
+To try it locally, point MAIL_SERVER/MAIL_PORT at a debugging SMTP server
+(smtpd left the standard library in Python 3.12; aiosmtpd replaces it):
+
+    python -m aiosmtpd -n -l localhost:1025
+    MAIL_SERVER=localhost MAIL_PORT=1025 MAIL_USE_TLS=false python mail_outbox.py --once
+
+The tests use SmtpSink in tests/conftest.py instead, which needs no package.
+"""
+import argparse
+import smtplib
+import threading
+import time
+import uuid
+from datetime import timedelta
+
+from flask_mail import Message
+
+from db_types import utcnow
+
+BATCH_SIZE = 50
+MAX_ATTEMPTS = 5
+
+# First retry after this many seconds, doubling on every further attempt
+RETRY_BASE_SECONDS = 30
+
+# Claims older than this are assumed to belong to a crashed sender
+CLAIM_TIMEOUT_SECONDS = 600
+
+
+def enqueue(conn, recipient, subject, body, html=None, commit=True):
+    """Queue an email; return the outbox id"""
+    cursor = conn.execute('''
+        INSERT INTO mail_outbox (recipient, subject, body, html, next_attempt_at)
+        VALUES (?, ?, ?, ?, ?)
+    ''', (recipient, subject, body, html, utcnow()))
+    if commit:
+        conn.commit()
+    return cursor.lastrowid
+
+
+def claim_batch(conn, limit=BATCH_SIZE, now=None):
+    """Mark up to limit due messages as ours and return them"""
+    now = now or utcnow()
+    token = uuid.uuid4().hex
+    stale = now - timedelta(seconds=CLAIM_TIMEOUT_SECONDS)
+    # No ORDER BY: it turns the two index lookups into a scan of every message ever sent
+    conn.execute('''
+        UPDATE mail_outbox
+        SET status = 'sending', claim_token = ?, claimed_at = ?
+        WHERE id IN (
+            SELECT id FROM mail_outbox
+            WHERE (status = 'pending' AND next_attempt_at <= ?)
+               OR (status = 'sending' AND claimed_at < ?)
+            LIMIT ?
+        )
+    ''', (token, now, now, stale, limit))
+    conn.commit()
+    return conn.execute('SELECT * FROM mail_outbox WHERE claim_token = ? ORDER BY id', (token,)).fetchall()
+
+
+def mark_sent(conn, message_id):
+    conn.execute('''
+        UPDATE mail_outbox SET status = 'sent', sent_at = ?, claim_token = NULL WHERE id = ?
+    ''', (utcnow(), message_id))
+
+
+def mark_failed(conn, row, error, now=None):
+    """Schedule a retry, or give up after MAX_ATTEMPTS"""
+    now = now or utcnow()
+    attempts = row['attempts'] + 1
+    status = 'failed' if attempts >= MAX_ATTEMPTS else 'pending'
+    retry_at = now + timedelta(seconds=RETRY_BASE_SECONDS * 2 ** (attempts - 1))
+    conn.execute('''
+        UPDATE mail_outbox
+        SET status = ?, attempts = ?, last_error = ?, next_attempt_at = ?, claim_token = NULL
+        WHERE id = ?
+    ''', (status, attempts, str(error)[:500], retry_at, row['id']))
+
+
+def send_batch(app, mail, conn, limit=BATCH_SIZE, rate_per_second=None):
+    """Send one batch over a single SMTP connection; return (sent, failed)"""
+    rows = claim_batch(conn, limit)
+    if not rows:
+        return 0, 0
+
+    sent = failed = 0
+    interval = 1.0 / rate_per_second if rate_per_second else 0
+    with app.app_context():
+        try:
+            with mail.connect() as smtp:
+                for row in rows:
+                    started = time.monotonic()
+                    try:
+                        smtp.send(Message(subject=row['subject'], recipients=[row['recipient']],
+                                          body=row['body'], html=row['html']))
+                        mark_sent(conn, row['id'])
+                        sent += 1
+                    except (smtplib.SMTPRecipientsRefused, smtplib.SMTPDataError, AssertionError) as e:
+                        # The message itself was rejected; the connection is still usable
+                        mark_failed(conn, row, e)
+                        failed += 1
+                    conn.commit()
+                    wait = interval - (time.monotonic() - started)
+                    if wait > 0:
+                        time.sleep(wait)
+        except (smtplib.SMTPException, OSError) as e:
+            # Connection-level failure: everything still claimed goes back for a retry
+            for row in conn.execute("SELECT * FROM mail_outbox WHERE claim_token = ? AND status = 'sending'",
+                                    (rows[0]['claim_token'],)).fetchall():
+                mark_failed(conn, row, e)
+                failed += 1
+            conn.commit()
+    return sent, failed
+
+
+def drain(app, mail, conn, rate_per_second=None):
+    """Send batches until nothing is due; return (sent, failed)"""
+    total_sent = total_failed = 0
+    while True:
+        sent, failed = send_batch(app, mail, conn, rate_per_second=rate_per_second)
+        total_sent += sent
+        total_failed += failed
+        if not sent and not failed:
+            return total_sent, total_failed
+
+
+class OutboxSender:
+    """Background thread that drains the outbox every interval seconds"""
+
+    def __init__(self, app, mail, connect, interval=10, rate_per_second=None):
+        self.app = app
+        self.mail = mail
+        self.connect = connect
+        self.interval = interval
+        self.rate_per_second = rate_per_second
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name='mail-outbox', daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def _run(self):
+        while not self._stop.is_set():
+            conn = self.connect()
+            try:
+                drain(self.app, self.mail, conn, self.rate_per_second)
+            except Exception as e:
+                print(f"Mail outbox run failed: {e}")
+            finally:
+                conn.close()
+            self._stop.wait(self.interval)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Send queued emails from the outbox')
+    parser.add_argument('--once', action='store_true', help='Drain the outbox once and exit')
+    args = parser.parse_args()
+
+    from functools import partial
+    from app_simple import app, mail, get_db_connection, all_shards
+    rate = app.config['MAIL_SEND_RATE']
+    if args.once:
+        for shard in all_shards():
+            conn = get_db_connection(shard=shard)
+            sent, failed = drain(app, mail, conn, rate)
+            conn.close()
+            print(f"{shard}: sent {sent} email(s), {failed} failed")
+    else:
+        senders = [OutboxSender(app, mail, partial(get_db_connection, shard=shard),
+                                app.config['MAIL_OUTBOX_INTERVAL'] or 10, rate) for shard in all_shards()]
+        for sender in senders[1:]:
+            sender.start()
+        senders[0]._run()
@@ -0,0 +1,125 @@
+"""
+Memory diagnostics: allocations per route.
+
+With MEMORY_DIAGNOSTICS=1 the app starts tracemalloc and records, around
+every request, the most traced memory the request had allocated at once
+(peak) and how much more was allocated when the next request started than
+when it did (net), which is what the request left behind in the worker. The
+totals per endpoint, the allocation sites that grew the most since the
+baseline snapshot, and the worker's RSS are served at /admin/metrics/memory;
+?rebase=1 clears them and takes a new baseline.
+
+tracemalloc makes allocation-heavy code noticeably slower and its counters
+are per process, so turn this on for one worker while investigating, with
+sync workers, so that each request's numbers are its own. When it is off
+nothing is installed.
+"""
+import os
+import threading
+import tracemalloc
+
+# Frames kept per allocation. Each extra frame makes allocations inside deep
+# Jinja call stacks much slower, and one is enough to attribute by line
+FRAMES = 1
+
+# Allocation sites listed by snapshot()
+TOP_SITES = 20
+
+# tracemalloc's own bookkeeping and the import machinery are not interesting
+IGNORED = (
+    tracemalloc.Filter(False, tracemalloc.__file__),
+    tracemalloc.Filter(False, '<frozen importlib._bootstrap>'),
+    tracemalloc.Filter(False, '<frozen importlib._bootstrap_external>'),
+    tracemalloc.Filter(False, '<unknown>'),
+)
+
+
+def rss_bytes():
+    """Resident set size of this process, or None where /proc is not available"""
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError):
+        return None
+
+
+class RouteMemory:
+    """Per-endpoint peak and net allocations, measured with tracemalloc"""
+
+    def __init__(self, frames=FRAMES):
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(frames)
+        self._lock = threading.Lock()
+        self.rebase()
+
+    def install(self, app):
+        from flask import g, request
+
+        @app.before_request
+        def start_memory_measurement():
+            g.memory_start = self.begin()
+
+        @app.teardown_request
+        def finish_memory_measurement(error):
+            started = g.pop('memory_start', None)
+            if started is not None:
+                self.end(request.endpoint or '<unmatched>', started)
+
+    def _stats(self, endpoint):
+        return self.routes.setdefault(endpoint, {'requests': 0, 'peak_bytes_total': 0, 'max_peak_bytes': 0,
+                                                 'net_measured': 0, 'net_bytes': 0})
+
+    def begin(self):
+        """Start measuring a request; returns what end() needs"""
+        self.settle()
+        tracemalloc.reset_peak()
+        return tracemalloc.get_traced_memory()[0]
+
+    def end(self, endpoint, started):
+        peak = tracemalloc.get_traced_memory()[1]
+        with self._lock:
+            stats = self._stats(endpoint)
+            stats['requests'] += 1
+            stats['peak_bytes_total'] += peak - started
+            stats['max_peak_bytes'] = max(stats['max_peak_bytes'], peak - started)
+            self._previous = (endpoint, started)
+
+    def settle(self):
+        """Charge the memory still allocated since the last request started to it"""
+        current = tracemalloc.get_traced_memory()[0]
+        with self._lock:
+            if self._previous is not None:
+                endpoint, started = self._previous
+                stats = self._stats(endpoint)
+                stats['net_measured'] += 1
+                stats['net_bytes'] += current - started
+                self._previous = None
+
+    def rebase(self):
+        """Forget the route totals and measure growth from now on"""
+        with self._lock:
+            self.routes = {}
+            self._previous = None
+        self.baseline = tracemalloc.take_snapshot().filter_traces(IGNORED)
+
+    def route_stats(self):
+        """{endpoint: stats} with per-request averages, largest peak first"""
+        with self._lock:
+            routes = {endpoint: dict(stats) for endpoint, stats in self.routes.items()}
+        for stats in routes.values():
+            stats['avg_net_bytes'] = stats['net_bytes'] // stats['net_measured'] if stats['net_measured'] else None
+            stats['avg_peak_bytes'] = stats.pop('peak_bytes_total') // stats['requests']
+        return dict(sorted(routes.items(), key=lambda item: -item[1]['max_peak_bytes']))
+
+    def snapshot(self, top=TOP_SITES):
+        current, peak = tracemalloc.get_traced_memory()
+        growth = tracemalloc.take_snapshot().filter_traces(IGNORED).compare_to(self.baseline, 'lineno')
+        return {
+            'rss_bytes': rss_bytes(),
+            'traced_bytes': current,
+            'traced_peak_bytes': peak,
+            'routes': self.route_stats(),
+            'top_growth': [{'where': f'{stat.traceback[0].filename}:{stat.traceback[0].lineno}',
+                            'size_diff': stat.size_diff, 'count_diff': stat.count_diff, 'size': stat.size}
+                           for stat in growth[:top]],
+        }
@@ -0,0 +1,185 @@
+"""
+Peer benchmarking for finalized assessments.
+
+Scores are grouped by segment (project type + size band) and by SDG. Each
+group is a sorted list holding the latest finalized score of every project in
+that segment, so a percentile lookup is two bisects instead of a scan over
+sdg_scores.
+
+With sharding on, every project must still be ranked against all its peers,
+not only those of the organisations on its own shard, so the app uses one
+ShardedPeerBenchmark loaded from every shard through ShardRouter.fan_out.
+"""
+import bisect
+import threading
+import time
+
+# Upper bounds (in sqm) of the size bands used to group "similar" projects
+SIZE_BANDS = [250, 1000, 5000, 20000, 100000]
+
+# Other workers may finalize assessments too, so reload the index now and then
+REFRESH_SECONDS = 300
+
+
+def size_band(size_sqm):
+    """Return the index of the size band for a project size"""
+    if size_sqm in (None, ''):
+        return None
+    try:
+        return bisect.bisect_right(SIZE_BANDS, float(size_sqm))
+    except (TypeError, ValueError):
+        return None
+
+
+def segment_key(project_type, size_sqm):
+    """Return the segment a project is benchmarked against"""
+    return ((project_type or '').strip().lower(), size_band(size_sqm))
+
+
+def _numeric(score):
+    # Steps 2-5 store raw form values, so empty strings can end up in sdg_scores
+    return isinstance(score, (int, float)) and not isinstance(score, bool)
+
+
+def latest_scores(conn):
+    """(project_id, project_type, size_sqm, sdg_id, score) rows of every project's latest completed assessment"""
+    return conn.execute('''
+        SELECT p.id AS project_id, p.project_type, p.size_sqm, s.sdg_id, s.score
+        FROM assessments a
+        JOIN projects p ON p.id = a.project_id
+        JOIN sdg_scores s ON s.assessment_id = a.id
+        WHERE a.status = 'completed'
+          AND p.deleted_at IS NULL
+          AND a.id = (SELECT MAX(a2.id) FROM assessments a2
+                      WHERE a2.project_id = a.project_id AND a2.status = 'completed')
+    ''').fetchall()
+
+
+class PeerBenchmark:
+    """Per-segment, per-SDG sorted score arrays with O(log n) percentile queries"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._sorted = {}   # (segment, sdg_id) -> sorted list of scores
+        self._entries = {}  # project_id -> (segment, {sdg_id: score})
+        self._loaded_at = None
+
+    def ensure_loaded(self, conn):
+        """Build the index from the database on first use or when it is stale"""
+        if self._loaded_at is None or time.time() - self._loaded_at > REFRESH_SECONDS:
+            self.load(conn)
+
+    def load(self, conn):
+        """Rebuild the index from the latest completed assessment of every project"""
+        self._replace((row['project_id'], row) for row in latest_scores(conn))
+
+    def _replace(self, keyed_rows):
+        # keyed_rows: (entry key, latest_scores() row) pairs
+        entries = {}
+        for key, row in keyed_rows:
+            if not _numeric(row['score']):
+                continue
+            segment = segment_key(row['project_type'], row['size_sqm'])
+            entry = entries.setdefault(key, (segment, {}))
+            entry[1][row['sdg_id']] = row['score']
+
+        sorted_scores = {}
+        for segment, scores in entries.values():
+            for sdg_id, score in scores.items():
+                sorted_scores.setdefault((segment, sdg_id), []).append(score)
+        for values in sorted_scores.values():
+            values.sort()
+
+        with self._lock:
+            self._entries = entries
+            self._sorted = sorted_scores
+            self._loaded_at = time.time()
+
+    def update(self, project_id, project_type, size_sqm, scores):
+        """Replace a project's entry with the scores of its newly finalized assessment"""
+        segment = segment_key(project_type, size_sqm)
+        scores = {sdg_id: score for sdg_id, score in scores.items() if _numeric(score)}
+        with self._lock:
+            self._discard(project_id)
+            self._entries[project_id] = (segment, scores)
+            for sdg_id, score in scores.items():
+                bisect.insort(self._sorted.setdefault((segment, sdg_id), []), score)
+
+    def remove(self, project_id):
+        """Drop a project from the index"""
+        with self._lock:
+            self._discard(project_id)
+
+    def _discard(self, project_id):
+        entry = self._entries.pop(project_id, None)
+        if not entry:
+            return
+        segment, scores = entry
+        for sdg_id, score in scores.items():
+            values = self._sorted.get((segment, sdg_id))
+            if values:
+                index = bisect.bisect_left(values, score)
+                if index < len(values) and values[index] == score:
+                    del values[index]
+
+    def percentile(self, project_type, size_sqm, sdg_id, score):
+        """Return (percentile, peer_count) of a score within its segment, or None"""
+        if not _numeric(score):
+            return None
+        with self._lock:
+            values = self._sorted.get((segment_key(project_type, size_sqm), sdg_id))
+            if not values or len(values) < 2:
+                return None
+            below = bisect.bisect_left(values, score)
+            equal = bisect.bisect_right(values, score) - below
+            count = len(values)
+        # Mid-rank percentile so ties land in the middle of their group
+        return round(100.0 * (below + 0.5 * equal) / count, 1), count
+
+    def percentiles(self, project, scores):
+        """Return {sdg_id: {'percentile': ..., 'peers': ...}} for an assessment's scores"""
+        result = {}
+        for sdg_id, score in scores.items():
+            ranked = self.percentile(project['project_type'], project['size_sqm'], sdg_id, score)
+            if ranked:
+                result[sdg_id] = {'percentile': ranked[0], 'peers': ranked[1]}
+        return result
+
+
+class ShardedPeerBenchmark(PeerBenchmark):
+    """One benchmark over the projects of every shard
+
+    Shard files number their projects independently, so entries are keyed by
+    (shard, project_id); for_shard() gives each shard the plain PeerBenchmark
+    API over its own ids, for use with sharding.ShardLocal.
+    """
+
+    def __init__(self, fan_out):
+        super().__init__()
+        self.fan_out = fan_out
+
+    def load(self, conn=None):
+        """Rebuild the index from every shard; conn is not needed"""
+        rows = self.fan_out(lambda shard_conn, shard: latest_scores(shard_conn))
+        self._replace(((shard, row['project_id']), row) for shard, shard_rows in rows.items() for row in shard_rows)
+
+    def for_shard(self, shard):
+        return ShardView(self, shard)
+
+
+class ShardView:
+    """A shard's view of a ShardedPeerBenchmark, addressed by that shard's project ids"""
+
+    def __init__(self, benchmark, shard):
+        self.benchmark = benchmark
+        self.shard = shard
+
+    def update(self, project_id, project_type, size_sqm, scores):
+        self.benchmark.update((self.shard, project_id), project_type, size_sqm, scores)
+
+    def remove(self, project_id):
+        self.benchmark.remove((self.shard, project_id))
+
+    def __getattr__(self, name):
+        # ensure_loaded, load, percentile(s) do not involve project ids
+        return getattr(self.benchmark, name)
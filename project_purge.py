@@ -0,0 +1,153 @@
+"""
+Soft delete for projects, with a background purge.
+
+Deleting a project only stamps projects.deleted_at, which every project
+query filters on, so the request holds the write lock for one UPDATE. The
+owner can restore it until the undo window has passed. After that the
+purger removes the project's rows a small batch per transaction, so other
+writers get the lock in between instead of waiting for the whole cascade.
+
+The purger also runs the app's housekeeping, such as pruning change logs,
+on the same schedule, so it happens whether or not anyone is using the
+features that read them. Run directly to do both (e.g. from cron):
+
+    python project_purge.py
+"""
+import threading
+import time
+from datetime import timedelta
+
+import evidence
+from db_types import utcnow
+
+# Rows deleted per transaction
+BATCH_SIZE = 500
+
+# Pause between batches so waiting writers can take the lock
+BATCH_PAUSE_SECONDS = 0.05
+
+
+def soft_delete(conn, project_id, user_id):
+    """Mark a project deleted; return False if it is not the user's live project"""
+    cursor = conn.execute('''
+        UPDATE projects SET deleted_at = ?
+        WHERE id = ? AND user_id = ? AND deleted_at IS NULL
+    ''', (utcnow(), project_id, user_id))
+    conn.commit()
+    return cursor.rowcount > 0
+
+
+def restore(conn, project_id, user_id, undo_seconds):
+    """Undo a soft delete still inside the undo window; return True on success"""
+    cutoff = utcnow() - timedelta(seconds=undo_seconds)
+    cursor = conn.execute('''
+        UPDATE projects SET deleted_at = NULL
+        WHERE id = ? AND user_id = ? AND deleted_at >= ?
+    ''', (project_id, user_id, cutoff))
+    conn.commit()
+    return cursor.rowcount > 0
+
+
+def deleted_projects(conn, user_id, undo_seconds):
+    """The user's soft-deleted projects that can still be restored"""
+    cutoff = utcnow() - timedelta(seconds=undo_seconds)
+    return conn.execute('''
+        SELECT * FROM projects
+        WHERE user_id = ? AND deleted_at >= ?
+        ORDER BY deleted_at DESC
+    ''', (user_id, cutoff)).fetchall()
+
+
+def _delete_in_batches(conn, table, where, params, batch_size, pause):
+    """DELETE matching rows batch_size at a time, committing after each batch"""
+    total = 0
+    while True:
+        cursor = conn.execute(
+            f'DELETE FROM {table} WHERE rowid IN (SELECT rowid FROM {table} WHERE {where} LIMIT ?)',
+            (*params, batch_size)
+        )
+        conn.commit()
+        total += cursor.rowcount
+        if cursor.rowcount < batch_size:
+            return total
+        time.sleep(pause)
+
+
+def purge_project(conn, project_id, upload_folder, batch_size=BATCH_SIZE, pause=BATCH_PAUSE_SECONDS):
+    """Remove a soft-deleted project and everything under it; return rows deleted"""
+    in_project = 'assessment_id IN (SELECT id FROM assessments WHERE project_id = ?)'
+    total = 0
+    for table in ('sdg_actions', 'sdg_scores', 'assessment_changes'):
+        total += _delete_in_batches(conn, table, in_project, (project_id,), batch_size, pause)
+
+    # Evidence goes through detach() so unreferenced files are removed too
+    for row in conn.execute(f'SELECT id FROM evidence WHERE {in_project}', (project_id,)).fetchall():
+        evidence.detach(conn, row['id'], upload_folder)
+        total += 1
+
+    total += _delete_in_batches(conn, 'assessments', 'project_id = ?', (project_id,), batch_size, pause)
+    cursor = conn.execute('DELETE FROM projects WHERE id = ? AND deleted_at IS NOT NULL', (project_id,))
+    conn.commit()
+    return total + cursor.rowcount
+
+
+def purge_expired(conn, undo_seconds, upload_folder, batch_size=BATCH_SIZE, pause=BATCH_PAUSE_SECONDS):
+    """Purge every project deleted longer ago than the undo window; return how many"""
+    cutoff = utcnow() - timedelta(seconds=undo_seconds)
+    expired = conn.execute('SELECT id FROM projects WHERE deleted_at < ? ORDER BY deleted_at',
+                           (cutoff,)).fetchall()
+    for row in expired:
+        rows = purge_project(conn, row['id'], upload_folder, batch_size, pause)
+        print(f"Purged project {row['id']} ({rows} rows)")
+    return len(expired)
+
+
+class ProjectPurger:
+    """Background thread that purges expired projects every interval seconds
+
+    housekeeping is a sequence of other clean-ups to run each time, each
+    called with the connection.
+    """
+
+    def __init__(self, connect, undo_seconds, upload_folder, interval=300, housekeeping=()):
+        self.connect = connect
+        self.undo_seconds = undo_seconds
+        self.upload_folder = upload_folder
+        self.interval = interval
+        self.housekeeping = housekeeping
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name='project-purge', daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def _run(self):
+        while not self._stop.is_set():
+            conn = self.connect()
+            try:
+                purge_expired(conn, self.undo_seconds, self.upload_folder)
+            except Exception as e:
+                print(f"Project purge failed: {e}")
+            for task in self.housekeeping:
+                try:
+                    task(conn)
+                except Exception as e:
+                    print(f"Housekeeping {task.__name__} failed: {e}")
+            conn.close()
+            self._stop.wait(self.interval)
+
+
+if __name__ == '__main__':
+    from app_simple import app, get_db_connection, all_shards, upload_folder, HOUSEKEEPING
+    for shard in all_shards():
+        conn = get_db_connection(shard=shard)
+        purged = purge_expired(conn, app.config['PROJECT_UNDO_SECONDS'], upload_folder(shard))
+        for task in HOUSEKEEPING:
+            task(conn)
+        conn.close()
+        print(f"{shard}: purged {purged} project(s)")
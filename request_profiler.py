@@ -0,0 +1,200 @@
+"""
+On-demand profiling of single requests.
+
+An admin enters the path of a slow page on /admin/profiles and gets a link
+carrying a signed _profile parameter (the token can also be sent in an
+X-Profile-Token header). That request is sampled while it runs and its
+stacks are written to PROFILE_DIR in the collapsed format
+('outer;inner;innermost count' per line) that flamegraph.pl and speedscope
+read. /admin/profiles lists the stored profiles and draws each one as a
+flame graph in the browser.
+
+Tokens are signed with SECRET_KEY, name the admin and the path they were
+made for, and expire after TOKEN_MAX_AGE seconds; they only take effect for
+that admin's session, so a leaked link profiles nothing.
+
+Requests without a token cost one lookup in before_request; the sampler
+thread only exists while a profiled request runs.
+"""
+import json
+import os
+import re
+import sys
+import threading
+import time
+from collections import Counter
+from datetime import datetime
+
+from itsdangerous import URLSafeTimedSerializer, BadSignature, SignatureExpired
+
+TOKEN_PARAM = '_profile'
+TOKEN_HEADER = 'X-Profile-Token'
+TOKEN_MAX_AGE = 15 * 60
+
+# Seconds between samples; the interpreter's switch interval is lowered to
+# match while a profile runs, or the sampler would only get the GIL every 5ms
+SAMPLE_INTERVAL = 0.001
+
+# Stacks narrower than this fraction of the samples are left out of the flame graph
+MIN_FLAME_WIDTH = 0.002
+
+PROFILE_NAME = re.compile(r'^[\w.-]+$')
+
+# The switch interval is process-wide: it is lowered for the samplers that are
+# running and the original value is restored when the last of them stops
+_switch_lock = threading.Lock()
+_switch_intervals = []
+_switch_interval = None
+
+
+def _serializer(app):
+    return URLSafeTimedSerializer(app.config['SECRET_KEY'], salt='request-profile')
+
+
+def make_token(app, user_id, path):
+    """A token that profiles path for user_id's session"""
+    return _serializer(app).dumps({'uid': user_id, 'path': path})
+
+
+def check_token(app, token, user_id, path, max_age=TOKEN_MAX_AGE):
+    try:
+        data = _serializer(app).loads(token, max_age=max_age)
+    except (BadSignature, SignatureExpired):
+        return False
+    return data.get('uid') == user_id and data.get('path') == path
+
+
+def _lower_switch_interval(interval):
+    global _switch_interval
+    with _switch_lock:
+        if not _switch_intervals:
+            _switch_interval = sys.getswitchinterval()
+        _switch_intervals.append(interval)
+        sys.setswitchinterval(min(_switch_intervals + [_switch_interval]))
+
+
+def _restore_switch_interval(interval):
+    with _switch_lock:
+        _switch_intervals.remove(interval)
+        sys.setswitchinterval(min(_switch_intervals + [_switch_interval]))
+
+
+def _frame_name(code):
+    return f'{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})'
+
+
+class StackSampler:
+    """Samples one thread's Python stack from a background thread"""
+
+    def __init__(self, interval=SAMPLE_INTERVAL):
+        self.interval = interval
+        self.stacks = Counter()
+        self.started = None
+        self.duration = 0.0
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        target = threading.get_ident()
+        _lower_switch_interval(self.interval)
+        self.started = time.perf_counter()
+        self._thread = threading.Thread(target=self._run, args=(target,), name='request-profiler', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+        self.duration = time.perf_counter() - self.started
+        _restore_switch_interval(self.interval)
+        return self.stacks
+
+    def _run(self, target):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(target)
+            stack = []
+            while frame is not None:
+                stack.append(_frame_name(frame.f_code))
+                frame = frame.f_back
+            if stack:
+                self.stacks[';'.join(reversed(stack))] += 1
+
+
+def save_profile(directory, sampler, meta, keep):
+    """Write sampler's stacks and meta to directory, drop the oldest beyond keep; return the name"""
+    os.makedirs(directory, exist_ok=True)
+    endpoint = re.sub(r'[^\w.-]', '_', meta.get('endpoint') or 'unknown')
+    name = f"{datetime.now().strftime('%Y%m%d-%H%M%S-%f')}-{endpoint}"
+    with open(os.path.join(directory, name + '.collapsed'), 'w') as f:
+        for stack, count in sampler.stacks.most_common():
+            f.write(f'{stack} {count}\n')
+    meta = dict(meta, name=name, samples=sum(sampler.stacks.values()),
+                duration_ms=round(sampler.duration * 1000, 1), created_at=datetime.now().isoformat(' ', 'seconds'))
+    with open(os.path.join(directory, name + '.json'), 'w') as f:
+        json.dump(meta, f)
+
+    for old in list_profiles(directory)[keep:]:
+        for suffix in ('.collapsed', '.json'):
+            try:
+                os.remove(os.path.join(directory, old['name'] + suffix))
+            except FileNotFoundError:
+                pass
+    return name
+
+
+def list_profiles(directory):
+    """Metadata of the stored profiles, newest first"""
+    if not os.path.isdir(directory):
+        return []
+    profiles = []
+    for filename in sorted(os.listdir(directory), reverse=True):
+        if filename.endswith('.json'):
+            with open(os.path.join(directory, filename)) as f:
+                profiles.append(json.load(f))
+    return profiles
+
+
+def load_profile(directory, name):
+    """(meta, Counter of stacks) for a stored profile, or None"""
+    if not PROFILE_NAME.match(name) or not os.path.exists(os.path.join(directory, name + '.json')):
+        return None
+    with open(os.path.join(directory, name + '.json')) as f:
+        meta = json.load(f)
+    stacks = Counter()
+    with open(os.path.join(directory, name + '.collapsed')) as f:
+        for line in f:
+            stack, _, count = line.rstrip('\n').rpartition(' ')
+            stacks[stack] += int(count)
+    return meta, stacks
+
+
+def flame_rows(stacks, min_width=MIN_FLAME_WIDTH):
+    """Boxes of a flame graph as dicts with depth, left and width (fractions), name and samples"""
+    root = {'children': {}, 'samples': 0}
+    for stack, count in stacks.items():
+        node = root
+        node['samples'] += count
+        for name in stack.split(';'):
+            node = node['children'].setdefault(name, {'children': {}, 'samples': 0})
+            node['samples'] += count
+
+    total = root['samples'] or 1
+    rows = []
+
+    def visit(node, depth, left):
+        for name, child in sorted(node['children'].items()):
+            width = child['samples'] / total
+            if width >= min_width:
+                rows.append({'depth': depth, 'left': left, 'width': width, 'name': name, 'samples': child['samples']})
+                visit(child, depth + 1, left)
+            left += width
+
+    visit(root, 0, 0.0)
+    return rows
+
+
+def top_frames(stacks, limit=20):
+    """(frame, samples) for the frames the most samples were taken in"""
+    self_samples = Counter()
+    for stack, count in stacks.items():
+        self_samples[stack.rpartition(';')[2]] += count
+    return self_samples.most_common(limit)
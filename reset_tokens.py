@@ -0,0 +1,37 @@
+"""
+Signed, expiring password reset tokens.
+
+Tokens are signed with SECRET_KEY and SECURITY_PASSWORD_SALT and embed a
+fingerprint of the user's current password hash, so a token stops working
+as soon as it has been used to change the password.
+"""
+import hashlib
+
+from itsdangerous import URLSafeTimedSerializer, BadSignature, SignatureExpired
+
+RESET_TOKEN_MAX_AGE = 3600  # seconds
+
+
+def _serializer(app):
+    return URLSafeTimedSerializer(app.config['SECRET_KEY'], salt=app.config['SECURITY_PASSWORD_SALT'])
+
+
+def _fingerprint(password_hash):
+    return hashlib.sha256(password_hash.encode('utf-8')).hexdigest()[:16]
+
+
+def generate_reset_token(app, user):
+    """Create a reset token for a users row"""
+    return _serializer(app).dumps({'id': user['id'], 'fp': _fingerprint(user['password_hash'])})
+
+
+def verify_reset_token(app, conn, token, max_age=RESET_TOKEN_MAX_AGE):
+    """Return the users row a token was issued for, or None if it is invalid or used"""
+    try:
+        data = _serializer(app).loads(token, max_age=max_age)
+    except (BadSignature, SignatureExpired):
+        return None
+    user = conn.execute('SELECT * FROM users WHERE id = ?', (data.get('id'),)).fetchone()
+    if not user or _fingerprint(user['password_hash']) != data.get('fp'):
+        return None
+    return user
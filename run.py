@@ -1,4 +1,5 @@
-from app_simple import app
+from app_simple import app, start_background_workers
 
 if __name__ == '__main__':
+    start_background_workers()
     app.run(debug=True)
\ No newline at end of file
@@ -0,0 +1,267 @@
+"""
+Audit trail of SDG score changes.
+
+Every change to a score or its notes, made in the wizard steps, the edit
+form or through autosave, is recorded with its value before and after, who
+made it, where and when. Recording only appends to an in-memory ring buffer;
+a background thread writes the buffer to the score_audit table in batches,
+one transaction per batch, so the audit adds no writes to the request path.
+The table is append-only: its triggers reject UPDATE and DELETE. Rows are
+keyed by assessment id, so assessments use AUTOINCREMENT: an id freed by a
+purge is never handed to a new assessment, which would inherit the history.
+
+The buffer is flushed every FLUSH_INTERVAL seconds, as soon as BATCH_SIZE
+entries are waiting, and at exit. It holds at most CAPACITY entries; if
+flushes keep failing the oldest entries are pushed out, and counted as
+dropped in snapshot().
+"""
+import atexit
+import re
+import threading
+from collections import deque
+
+from db_types import utcnow
+
+# Entries kept in memory at most
+CAPACITY = 10000
+
+# Waiting entries that trigger a flush before the interval is up
+BATCH_SIZE = 200
+
+# Seconds between flushes
+FLUSH_INTERVAL = 2.0
+
+# Rows per page of history()
+PAGE_SIZE = 100
+
+# Above any id, for the first page
+NO_CURSOR = 2 ** 63 - 1
+
+FIELDS = ('score', 'notes')
+
+# Name of the new assessments table while autoincrement_assessments() copies rows into it
+REBUILT = 'assessments_rebuild'
+
+INSERT = '''
+    INSERT INTO score_audit (assessment_id, sdg_id, field, old_value, new_value, user_id, source, changed_at)
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+'''
+
+HISTORY_COLUMNS = '''
+    SELECT s.id, s.assessment_id, s.sdg_id, s.field, s.old_value, s.new_value, s.user_id, s.source,
+           s.changed_at, u.name AS user_name, u.email AS user_email
+    FROM score_audit s LEFT JOIN users u ON u.id = s.user_id
+'''
+
+BY_ASSESSMENT_AND_USER = HISTORY_COLUMNS + '''
+    WHERE s.assessment_id = ? AND s.user_id = ? AND s.id < ? ORDER BY s.id DESC LIMIT ?
+'''
+BY_ASSESSMENT = HISTORY_COLUMNS + 'WHERE s.assessment_id = ? AND s.id < ? ORDER BY s.id DESC LIMIT ?'
+BY_USER = HISTORY_COLUMNS + 'WHERE s.user_id = ? AND s.id < ? ORDER BY s.id DESC LIMIT ?'
+RECENT = HISTORY_COLUMNS + 'WHERE s.id < ? ORDER BY s.id DESC LIMIT ?'
+
+
+def ensure_table(conn):
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS score_audit (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            assessment_id INTEGER NOT NULL,
+            sdg_id INTEGER NOT NULL,
+            field TEXT NOT NULL,
+            old_value,
+            new_value,
+            user_id INTEGER,
+            source TEXT,
+            changed_at TIMESTAMP NOT NULL
+        )
+    ''')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_score_audit_assessment ON score_audit (assessment_id, id)')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_score_audit_user ON score_audit (user_id, id)')
+    conn.execute('''
+        CREATE TRIGGER IF NOT EXISTS trg_score_audit_no_update BEFORE UPDATE ON score_audit
+        BEGIN
+            SELECT RAISE(ABORT, 'score_audit is append-only');
+        END
+    ''')
+    conn.execute('''
+        CREATE TRIGGER IF NOT EXISTS trg_score_audit_no_delete BEFORE DELETE ON score_audit
+        BEGIN
+            SELECT RAISE(ABORT, 'score_audit is append-only');
+        END
+    ''')
+
+
+def _table_sql(conn):
+    return conn.execute("SELECT sql FROM sqlite_master WHERE type = 'table' AND name = 'assessments'").fetchone()[0]
+
+
+def _has_autoincrement(conn):
+    return 'AUTOINCREMENT' in _table_sql(conn).upper()
+
+
+def autoincrement_assessments(conn):
+    """Rebuild an older assessments table with AUTOINCREMENT ids; return True if it was rebuilt
+
+    The sequence starts above every id the audit trail has seen, including
+    ids of assessments purged before the rebuild.
+    """
+    conn.commit()
+    if _has_autoincrement(conn):
+        return False
+    foreign_keys = conn.execute('PRAGMA foreign_keys').fetchone()[0]
+    # Foreign keys off so the table can be dropped; legacy renames leave other triggers' SQL alone
+    conn.execute('PRAGMA foreign_keys = OFF')
+    conn.execute('PRAGMA legacy_alter_table = ON')
+    try:
+        conn.execute('BEGIN IMMEDIATE')
+        # Checked again under the write lock, so only one worker rebuilds
+        if _has_autoincrement(conn):
+            conn.rollback()
+            return False
+        table_sql = _table_sql(conn)
+        rebuilt_sql, replaced = re.subn(r'\bid\s+INTEGER\s+PRIMARY\s+KEY\b', 'id INTEGER PRIMARY KEY AUTOINCREMENT',
+                                        table_sql, count=1, flags=re.IGNORECASE)
+        if not replaced:
+            conn.rollback()
+            print("Cannot switch assessments to AUTOINCREMENT: unexpected id column")
+            return False
+        rebuilt_sql = re.sub(r'^CREATE TABLE\s+(IF NOT EXISTS\s+)?["`]?assessments["`]?', f'CREATE TABLE {REBUILT}',
+                             rebuilt_sql, count=1, flags=re.IGNORECASE)
+        dependents = [row[0] for row in conn.execute(
+            "SELECT sql FROM sqlite_master WHERE tbl_name = 'assessments' AND type IN ('index', 'trigger') "
+            "AND sql IS NOT NULL").fetchall()]
+
+        conn.execute(rebuilt_sql)
+        conn.execute(f'INSERT INTO {REBUILT} SELECT * FROM assessments')
+        conn.execute('DROP TABLE assessments')
+        conn.execute(f'ALTER TABLE {REBUILT} RENAME TO assessments')
+        for sql in dependents:
+            conn.execute(sql)
+        last_id = max(conn.execute('SELECT MAX(id) FROM assessments').fetchone()[0] or 0,
+                      conn.execute('SELECT MAX(assessment_id) FROM score_audit').fetchone()[0] or 0)
+        conn.execute("DELETE FROM sqlite_sequence WHERE name = 'assessments'")
+        conn.execute("INSERT INTO sqlite_sequence (name, seq) VALUES ('assessments', ?)", (last_id,))
+        conn.commit()
+        return True
+    except BaseException:
+        conn.rollback()
+        raise
+    finally:
+        conn.execute('PRAGMA legacy_alter_table = OFF')
+        conn.execute(f'PRAGMA foreign_keys = {int(foreign_keys)}')
+
+
+def read_scores(conn, assessment_id):
+    """{sdg_id: {'score': ..., 'notes': ...}} as currently stored for an assessment"""
+    rows = conn.execute('SELECT sdg_id, score, notes FROM sdg_scores WHERE assessment_id = ?',
+                        (assessment_id,)).fetchall()
+    return {row[0]: {'score': row[1], 'notes': row[2]} for row in rows}
+
+
+def _same(field, old, new):
+    if field == 'notes':
+        # The forms send '' where an untouched row has NULL
+        return (old or '') == (new or '')
+    return old == new
+
+
+def diff(assessment_id, before, after, user_id, source):
+    """Audit entries for the fields that differ between two read_scores() results"""
+    changed_at = utcnow()
+    entries = []
+    for sdg_id in sorted(after.keys() | before.keys()):
+        old, new = before.get(sdg_id, {}), after.get(sdg_id, {})
+        for field in FIELDS:
+            if not _same(field, old.get(field), new.get(field)):
+                entries.append((assessment_id, sdg_id, field, old.get(field), new.get(field),
+                                user_id, source, changed_at))
+    return entries
+
+
+class AuditLog:
+    """Ring buffer of audit entries with a background thread that writes them in batches"""
+
+    def __init__(self, connect, capacity=CAPACITY, batch_size=BATCH_SIZE, interval=FLUSH_INTERVAL):
+        self.connect = connect
+        self.batch_size = batch_size
+        self.interval = interval
+        self._buffer = deque(maxlen=capacity)
+        self._lock = threading.Lock()
+        # Serialises flushes, so batches are written in the order they were recorded
+        self._flush_lock = threading.Lock()
+        self._wake = threading.Event()
+        self._thread = None
+        self.stats = {'recorded': 0, 'written': 0, 'dropped': 0, 'batches': 0, 'failures': 0}
+
+    def record(self, entries):
+        """Queue entries made by diff()"""
+        if not entries:
+            return
+        with self._lock:
+            self.stats['dropped'] += max(0, len(self._buffer) + len(entries) - self._buffer.maxlen)
+            self._buffer.extend(entries)
+            self.stats['recorded'] += len(entries)
+            if len(self._buffer) >= self.batch_size:
+                self._wake.set()
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='score-audit', daemon=True)
+                self._thread.start()
+                atexit.register(self.flush)
+
+    def record_changes(self, assessment_id, before, after, user_id, source):
+        self.record(diff(assessment_id, before, after, user_id, source))
+
+    def flush(self):
+        """Write everything waiting; returns how many entries were written"""
+        with self._flush_lock:
+            with self._lock:
+                batch = list(self._buffer)
+                self._buffer.clear()
+            if not batch:
+                return 0
+            try:
+                conn = self.connect()
+                try:
+                    with conn:
+                        conn.executemany(INSERT, batch)
+                finally:
+                    conn.close()
+            except Exception as e:
+                print(f"Score audit flush failed for {len(batch)} entries: {e}")
+                self._requeue(batch)
+                return 0
+            with self._lock:
+                self.stats['written'] += len(batch)
+                self.stats['batches'] += 1
+            return len(batch)
+
+    def _requeue(self, batch):
+        # Put the failed batch back in front of anything recorded since, keeping the newest
+        with self._lock:
+            self.stats['failures'] += 1
+            entries = batch + list(self._buffer)
+            self.stats['dropped'] += max(0, len(entries) - self._buffer.maxlen)
+            self._buffer.clear()
+            self._buffer.extend(entries)
+
+    def _run(self):
+        while True:
+            self._wake.wait(self.interval)
+            self._wake.clear()
+            self.flush()
+
+    def snapshot(self):
+        with self._lock:
+            return dict(self.stats, pending=len(self._buffer), capacity=self._buffer.maxlen)
+
+
+def history(conn, assessment_id=None, user_id=None, before_id=None, limit=PAGE_SIZE):
+    """Audit rows, newest first, for an assessment and/or a user; before_id pages back"""
+    cursor = before_id or NO_CURSOR
+    if assessment_id is not None and user_id is not None:
+        return conn.execute(BY_ASSESSMENT_AND_USER, (assessment_id, user_id, cursor, limit)).fetchall()
+    if assessment_id is not None:
+        return conn.execute(BY_ASSESSMENT, (assessment_id, cursor, limit)).fetchall()
+    if user_id is not None:
+        return conn.execute(BY_USER, (user_id, cursor, limit)).fetchall()
+    return conn.execute(RECENT, (cursor, limit)).fetchall()
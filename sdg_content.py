@@ -0,0 +1,131 @@
+"""
+Static SDG content shared by the database seed, the assessment wizard and the
+text matching features.
+"""
+
+# (number, name, description, color_code) for the 17 goals
+SDG_GOALS = [
+    (1, "No Poverty", "End poverty in all its forms everywhere", "#E5243B"),
+    (2, "Zero Hunger", "End hunger, achieve food security and improved nutrition and promote sustainable agriculture", "#DDA63A"),
+    (3, "Good Health and Well-being", "Ensure healthy lives and promote well-being for all at all ages", "#4C9F38"),
+    (4, "Quality Education", "Ensure inclusive and equitable quality education and promote lifelong learning opportunities for all", "#C5192D"),
+    (5, "Gender Equality", "Achieve gender equality and empower all women and girls", "#FF3A21"),
+    (6, "Clean Water and Sanitation", "Ensure availability and sustainable management of water and sanitation for all", "#26BDE2"),
+    (7, "Affordable and Clean Energy", "Ensure access to affordable, reliable, sustainable and modern energy for all", "#FCC30B"),
+    (8, "Decent Work and Economic Growth", "Promote sustained, inclusive and sustainable economic growth, full and productive employment and decent work for all", "#A21942"),
+    (9, "Industry, Innovation and Infrastructure", "Build resilient infrastructure, promote inclusive and sustainable industrialization and foster innovation", "#FD6925"),
+    (10, "Reduced Inequality", "Reduce inequality within and among countries", "#DD1367"),
+    (11, "Sustainable Cities and Communities", "Make cities and human settlements inclusive, safe, resilient and sustainable", "#FD9D24"),
+    (12, "Responsible Consumption and Production", "Ensure sustainable consumption and production patterns", "#BF8B2E"),
+    (13, "Climate Action", "Take urgent action to combat climate change and its impacts", "#3F7E44"),
+    (14, "Life Below Water", "Conserve and sustainably use the oceans, seas and marine resources for sustainable development", "#0A97D9"),
+    (15, "Life on Land", "Protect, restore and promote sustainable use of terrestrial ecosystems, sustainably manage forests, combat desertification, and halt and reverse land degradation and halt biodiversity loss", "#56C02B"),
+    (16, "Peace, Justice and Strong Institutions", "Promote peaceful and inclusive societies for sustainable development, provide access to justice for all and build effective, accountable and inclusive institutions at all levels", "#00689D"),
+    (17, "Partnerships for the Goals", "Strengthen the means of implementation and revitalize the global partnership for sustainable development", "#19486A")
+]
+
+# Content shown in the assessment wizard for the SDGs it covers in detail
+SDG_TITLES = {
+    1: 'No Poverty',
+    2: 'Zero Hunger',
+    3: 'Good Health and Well-being',
+    6: 'Clean Water and Sanitation',
+    13: 'Climate Action',
+    14: 'Life Below Water',
+    15: 'Life on Land'
+}
+
+SDG_SUBTITLES = {
+    1: 'End poverty in all its forms everywhere',
+    2: 'End hunger, achieve food security and improved nutrition',
+    3: 'Ensure healthy lives and promote well-being for all',
+    6: 'Ensure availability and sustainable management of water',
+    13: 'Take urgent action to combat climate change and its impacts',
+    14: 'Conserve and sustainably use the oceans, seas and marine resources',
+    15: 'Protect, restore and promote sustainable use of terrestrial ecosystems'
+}
+
+SDG_TARGETS = {
+    1: [
+        {'code': '1.4', 'text': 'By 2030, ensure that all people have equal rights to economic resources, basic services, ownership and control over land and property'},
+        {'code': '1.5', 'text': 'Build the resilience of the poor to reduce their exposure to climate-related extreme events and disasters'}
+    ],
+    2: [
+        {'code': '2.1', 'text': 'By 2030, end hunger and ensure access to safe, nutritious food'},
+        {'code': '2.4', 'text': 'By 2030, ensure sustainable food production systems and resilient agricultural practices'}
+    ],
+    3: [
+        {'code': '3.4', 'text': 'Reduce premature mortality from non-communicable diseases and promote mental health and well-being'},
+        {'code': '3.9', 'text': 'Reduce deaths and illnesses from hazardous chemicals and air, water and soil pollution'}
+    ],
+    6: [
+        {'code': '6.1', 'text': 'By 2030, achieve universal and equitable access to safe and affordable drinking water'},
+        {'code': '6.2', 'text': 'By 2030, achieve access to adequate and equitable sanitation and hygiene'},
+        {'code': '6.3', 'text': 'By 2030, improve water quality by reducing pollution and increasing recycling and safe reuse'},
+        {'code': '6.4', 'text': 'By 2030, substantially increase water-use efficiency across all sectors'}
+    ],
+    13: [
+        {'code': '13.1', 'text': 'Strengthen resilience and adaptive capacity to climate-related hazards'},
+        {'code': '13.2', 'text': 'Integrate climate change measures into policies and planning'},
+        {'code': '13.3', 'text': 'Improve education and capacity on climate change mitigation and adaptation'}
+    ],
+    14: [
+        {'code': '14.1', 'text': 'Prevent and reduce marine pollution of all kinds'},
+        {'code': '14.2', 'text': 'Sustainably manage and protect marine and coastal ecosystems'}
+    ],
+    15: [
+        {'code': '15.1', 'text': 'Ensure conservation of terrestrial and inland freshwater ecosystems'},
+        {'code': '15.2', 'text': 'Promote sustainable management of forests'},
+        {'code': '15.5', 'text': 'Take action to reduce degradation of natural habitats and halt biodiversity loss'}
+    ]
+}
+
+SDG_APPLICATIONS = {
+    1: [
+        'Energy poverty reduction through efficient building design',
+        'Affordable housing solutions using sustainable materials',
+        'Disaster resilience in vulnerable communities',
+        'Inclusive design for all socioeconomic backgrounds'
+    ],
+    2: [
+        'Urban agriculture integration in building designs',
+        'Food storage solutions to reduce waste',
+        'Community food spaces and markets',
+        'Water-efficient design for food production'
+    ],
+    3: [
+        'Healthy buildings with adequate ventilation and natural light',
+        'Biophilic design to reduce stress and improve mental health',
+        'Active design that encourages physical activity',
+        'Healthcare facilities and wellness centers',
+        'Air quality management systems'
+    ],
+    6: [
+        'Water-efficient fixtures and appliances',
+        'Rainwater harvesting and greywater recycling',
+        'Sustainable drainage solutions',
+        'On-site wastewater treatment',
+        'Water-sensitive urban design'
+    ],
+    13: [
+        'Low-carbon or carbon-neutral design strategies',
+        'Climate-resilient building techniques',
+        'Design for extreme weather events',
+        'Urban heat island mitigation',
+        'Carbon sequestration in building materials and landscapes'
+    ],
+    14: [
+        'Responsible waterfront development',
+        'Stormwater management to prevent water pollution',
+        'Wastewater treatment and recycling',
+        'Prevention of harmful runoff into water bodies',
+        'Marine-friendly construction practices'
+    ],
+    15: [
+        'Biodiversity-friendly site planning',
+        'Native plant species selection',
+        'Preservation of habitats and ecological corridors',
+        'Sustainable forestry practices in material sourcing',
+        'Green roofs and walls for biodiversity'
+    ]
+}
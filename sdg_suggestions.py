@@ -0,0 +1,134 @@
+"""
+Suggest relevant SDGs and targets from a project description.
+
+Every goal description, target and application text is indexed once at
+import time into a TF-IDF matrix, stored column-wise as an inverted index
+(term -> [(document, weight)]). Scoring a description is then a single
+sparse matrix-vector product over the terms it contains. Results are cached
+per description hash, since the same project is scored on every wizard step.
+"""
+import hashlib
+import math
+import re
+import threading
+from collections import Counter, OrderedDict
+
+from sdg_content import SDG_GOALS, SDG_TITLES, SDG_SUBTITLES, SDG_TARGETS, SDG_APPLICATIONS
+
+# Minimum cosine similarity for a goal or target to be highlighted
+SDG_THRESHOLD = 0.08
+TARGET_THRESHOLD = 0.12
+
+CACHE_SIZE = 1024
+
+STOPWORDS = frozenset('''
+    a all an and any are as at be by for from has have in into is it its of on
+    or our that the their this to with will within 2030 ensure promote
+    sustainable sustainably
+'''.split())
+
+_TOKEN_RE = re.compile(r'[a-z]+')
+
+
+def tokenize(text):
+    """Lowercase word tokens with stopwords removed and plurals folded"""
+    tokens = []
+    for token in _TOKEN_RE.findall((text or '').lower()):
+        if len(token) < 3 or token in STOPWORDS:
+            continue
+        if token.endswith('ies') and len(token) > 4:
+            token = token[:-3] + 'y'
+        elif token.endswith('s') and not token.endswith('ss') and len(token) > 3:
+            token = token[:-1]
+        tokens.append(token)
+    return tokens
+
+
+def _documents():
+    """Yield (sdg_number, target_code or None, text) for everything we index"""
+    for number, name, description, _ in SDG_GOALS:
+        yield number, None, f'{name} {description} {SDG_TITLES.get(number, "")} {SDG_SUBTITLES.get(number, "")}'
+    for number, targets in SDG_TARGETS.items():
+        for target in targets:
+            yield number, target['code'], target['text']
+    for number, applications in SDG_APPLICATIONS.items():
+        for application in applications:
+            yield number, None, application
+
+
+class SuggestionEngine:
+    """Precomputed TF-IDF index over the SDG texts"""
+
+    def __init__(self, documents):
+        documents = list(documents)
+        self.doc_sdg = [doc[0] for doc in documents]
+        self.doc_target = [doc[1] for doc in documents]
+
+        counts = [Counter(tokenize(doc[2])) for doc in documents]
+        doc_freq = Counter(term for count in counts for term in count)
+        total = len(documents)
+        self.idf = {term: math.log((1 + total) / (1 + df)) + 1 for term, df in doc_freq.items()}
+
+        # Column-wise sparse matrix of L2-normalised TF-IDF weights
+        self.postings = {}
+        for doc_index, count in enumerate(counts):
+            weights = {term: (1 + math.log(tf)) * self.idf[term] for term, tf in count.items()}
+            norm = math.sqrt(sum(w * w for w in weights.values())) or 1.0
+            for term, weight in weights.items():
+                self.postings.setdefault(term, []).append((doc_index, weight / norm))
+
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+
+    def score(self, description):
+        """Return cosine similarity of a description to every indexed document"""
+        count = Counter(t for t in tokenize(description) if t in self.idf)
+        weights = {term: (1 + math.log(tf)) * self.idf[term] for term, tf in count.items()}
+        norm = math.sqrt(sum(w * w for w in weights.values()))
+        scores = [0.0] * len(self.doc_sdg)
+        if not norm:
+            return scores
+        for term, weight in weights.items():
+            weight /= norm
+            for doc_index, doc_weight in self.postings[term]:
+                scores[doc_index] += weight * doc_weight
+        return scores
+
+    def suggest(self, description):
+        """Return {'sdgs': {number: score}, 'targets': {code: score}} above the thresholds"""
+        key = hashlib.sha1((description or '').strip().encode('utf-8')).hexdigest()
+        with self._lock:
+            if key in self._cache:
+                self._cache.move_to_end(key)
+                return self._cache[key]
+
+        sdgs = {}
+        targets = {}
+        for doc_index, similarity in enumerate(self.score(description)):
+            if not similarity:
+                continue
+            number = self.doc_sdg[doc_index]
+            sdgs[number] = max(sdgs.get(number, 0.0), similarity)
+            code = self.doc_target[doc_index]
+            if code and similarity >= TARGET_THRESHOLD:
+                targets[code] = round(similarity, 3)
+        result = {
+            'sdgs': {number: round(s, 3) for number, s in sdgs.items() if s >= SDG_THRESHOLD},
+            'targets': targets,
+        }
+
+        with self._lock:
+            self._cache[key] = result
+            if len(self._cache) > CACHE_SIZE:
+                self._cache.popitem(last=False)
+        return result
+
+
+engine = SuggestionEngine(_documents())
+
+
+def suggest_for_project(project):
+    """Suggestions for a project row, based on its name and description"""
+    if not project:
+        return {'sdgs': {}, 'targets': {}}
+    return engine.suggest(f"{project['name'] or ''}\n{project['description'] or ''}")
@@ -0,0 +1,395 @@
+"""
+Optional per-organisation database sharding.
+
+With SHARD_COUNT > 0, organisations can be placed on their own SQLite files
+(SHARD_DIR/shard_00.db, shard_01.db, ...), so one busy organisation no longer
+holds the write lock for everyone and a damaged file only affects the
+organisations on it. The main database stays the directory: it holds users,
+the shard_map, and the data of users whose organisation is not on a shard.
+
+Shard files are created with the main database's schema minus the users
+table, plus a copy of the SDG reference data. Their connections ATTACH the
+main database as "directory", so the existing queries that join or update
+users work on any shard unchanged.
+
+Organisations are only ever moved by the CLI, never implicitly:
+
+    python sharding.py status
+    python sharding.py move "<organisation>" shard_02
+    python sharding.py rebalance [--dry-run]
+
+A move marks the organisation as moving (its requests get a 503 for the
+duration), waits for every worker's cached shard map to expire, copies the
+rows to the new shard with fresh ids, switches the map and finally purges
+the old copies in small batches. The score audit trail moves with its
+assessments, but score_audit is append-only (its triggers reject DELETE), so
+the source shard keeps its audit rows under the old assessment ids.
+
+Per-process indexes built from the database must not quietly cover one shard:
+the peer benchmark is loaded from every shard (ShardedPeerBenchmark), and the
+similar-project index is turned off while SHARD_COUNT > 0 (DisabledIndex).
+"""
+import argparse
+import os
+import shutil
+import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import db_types
+import evidence
+import project_purge
+
+# Name of the main (directory) database when it is used as a shard
+MAIN = 'main'
+
+# Seconds each worker caches the shard map
+MAP_TTL = 30
+
+# Tables that only exist in the main database
+DIRECTORY_TABLES = ('users', 'shard_map')
+
+# Reference data copied into every new shard
+REFERENCE_TABLES = ('sdg_goals', 'sdg_criteria')
+
+
+class ShardMoving(Exception):
+    """Raised while an organisation's data is being moved between shards"""
+
+    def __init__(self, organization):
+        super().__init__(f'{organization} is being moved to another shard')
+        self.organization = organization
+
+
+class ShardRouter:
+    """Maps organisations to shard files and opens connections to them"""
+
+    def __init__(self, directory_path, shard_dir, shard_count, upload_folder, map_ttl=MAP_TTL):
+        self.directory_path = directory_path
+        self.shard_dir = shard_dir
+        self.names = [f'shard_{i:02d}' for i in range(shard_count)]
+        self.base_upload_folder = upload_folder
+        self.map_ttl = map_ttl
+        self._lock = threading.Lock()
+        self._map = {}
+        self._map_loaded_at = None
+        self._pool = ThreadPoolExecutor(max_workers=min(8, shard_count + 1), thread_name_prefix='shard')
+
+    def all_shards(self):
+        return [MAIN] + self.names
+
+    def path(self, shard):
+        if shard == MAIN:
+            return self.directory_path
+        return os.path.join(self.shard_dir, f'{shard}.db')
+
+    def upload_folder(self, shard):
+        """Evidence files are deduplicated per shard, so each shard has its own folder"""
+        if shard == MAIN:
+            return self.base_upload_folder
+        return os.path.join(self.base_upload_folder, 'shards', shard)
+
+    def connect(self, shard):
+        conn = db_types.connect(self.path(shard))
+        if shard != MAIN:
+            conn.execute('ATTACH DATABASE ? AS directory', (self.directory_path,))
+        return conn
+
+    def ensure_shards(self):
+        """Create the shard_map and any shard file that does not exist yet"""
+        conn = sqlite3.connect(self.directory_path)
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS shard_map (
+                organization TEXT PRIMARY KEY,
+                shard TEXT NOT NULL,
+                state TEXT DEFAULT 'active',
+                updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+        ''')
+        conn.commit()
+        conn.close()
+
+        os.makedirs(self.shard_dir, exist_ok=True)
+        for shard in self.names:
+            if not os.path.exists(self.path(shard)):
+                create_shard(self.directory_path, self.path(shard))
+
+    def shard_map(self, refresh=False):
+        """{organization: (shard, state)}, cached for map_ttl seconds"""
+        with self._lock:
+            if refresh or self._map_loaded_at is None or time.monotonic() - self._map_loaded_at > self.map_ttl:
+                conn = sqlite3.connect(self.directory_path)
+                try:
+                    self._map = {row[0]: (row[1], row[2]) for row in
+                                 conn.execute('SELECT organization, shard, state FROM shard_map')}
+                finally:
+                    conn.close()
+                self._map_loaded_at = time.monotonic()
+            return self._map
+
+    def shard_for(self, organization):
+        """Shard holding an organisation's data; raises ShardMoving during a move"""
+        if not organization:
+            return MAIN
+        shard, state = self.shard_map().get(organization, (MAIN, 'active'))
+        if state == 'moving':
+            raise ShardMoving(organization)
+        return shard
+
+    def fan_out(self, query, shards=None):
+        """Run query(conn, shard) on every shard in parallel; return {shard: result}"""
+        def run(shard):
+            conn = self.connect(shard)
+            try:
+                return query(conn, shard)
+            finally:
+                conn.close()
+
+        shards = shards or self.all_shards()
+        return dict(zip(shards, self._pool.map(run, shards)))
+
+
+def create_shard(directory_path, shard_path):
+    """Create a shard file with the main database's schema and reference data"""
+    source = sqlite3.connect(directory_path)
+    target = sqlite3.connect(shard_path)
+    try:
+        target.execute('PRAGMA auto_vacuum = INCREMENTAL')
+        # Tables first, then their indexes and triggers
+        for tbl_name, sql in source.execute('''
+            SELECT tbl_name, sql FROM sqlite_master
+            WHERE sql IS NOT NULL AND name NOT LIKE 'sqlite_%'
+            ORDER BY type != 'table'
+        ''').fetchall():
+            if tbl_name not in DIRECTORY_TABLES:
+                target.execute(sql)
+        for table in REFERENCE_TABLES:
+            rows = source.execute(f'SELECT * FROM {table}').fetchall()
+            if rows:
+                target.executemany(f'INSERT INTO {table} VALUES ({", ".join("?" * len(rows[0]))})', rows)
+        target.commit()
+    finally:
+        target.close()
+        source.close()
+
+
+class ShardLocal:
+    """One instance of a per-database helper for each shard
+
+    Attribute access goes to the instance for the current request's shard,
+    so module-level helpers such as the autosave buffer keep their call sites.
+    """
+
+    def __init__(self, factory, current_shard):
+        self._factory = factory
+        self._current_shard = current_shard
+        self._instances = {}
+        self._lock = threading.Lock()
+
+    def get(self, shard=None):
+        shard = shard or self._current_shard()
+        with self._lock:
+            if shard not in self._instances:
+                self._instances[shard] = self._factory(shard)
+            return self._instances[shard]
+
+    def __getattr__(self, name):
+        return getattr(self.get(), name)
+
+
+def _insert(conn, table, row, overrides):
+    """Insert a copy of row (without its id) into table; return the new id"""
+    values = {key: row[key] for key in row.keys() if key != 'id'}
+    values.update(overrides)
+    columns = ', '.join(values)
+    placeholders = ', '.join('?' * len(values))
+    return conn.execute(f'INSERT INTO main.{table} ({columns}) VALUES ({placeholders})',
+                        list(values.values())).lastrowid
+
+
+def _copy_file(source, target):
+    if os.path.exists(source) and not os.path.exists(target):
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        shutil.copy2(source, target)
+
+
+def copy_organization(source, target, user_ids, source_uploads, target_uploads):
+    """Copy the projects of user_ids and everything under them to another shard
+
+    Ids are reassigned in the target, and audit entries follow their
+    assessment in the order they were made. Returns the source project ids.
+    """
+    marks = ','.join('?' * len(user_ids))
+    projects = source.execute(f'SELECT * FROM main.projects WHERE user_id IN ({marks})', user_ids).fetchall()
+    digests = set()
+    for project in projects:
+        new_project_id = _insert(target, 'projects', project, {})
+        for assessment in source.execute('SELECT * FROM main.assessments WHERE project_id = ?',
+                                         (project['id'],)).fetchall():
+            new_assessment_id = _insert(target, 'assessments', assessment, {'project_id': new_project_id})
+            for table in ('sdg_scores', 'sdg_actions', 'evidence', 'score_audit'):
+                for row in source.execute(f'SELECT * FROM main.{table} WHERE assessment_id = ? ORDER BY id',
+                                          (assessment['id'],)).fetchall():
+                    _insert(target, table, row, {'assessment_id': new_assessment_id})
+                    if table == 'evidence':
+                        digests.add(row['sha256'])
+
+    for digest in digests:
+        for table in ('evidence_blobs', 'evidence_tags'):
+            for row in source.execute(f'SELECT * FROM main.{table} WHERE sha256 = ?', (digest,)).fetchall():
+                columns = ', '.join(row.keys())
+                target.execute(f'INSERT OR IGNORE INTO main.{table} ({columns}) '
+                               f'VALUES ({", ".join("?" * len(row.keys()))})', tuple(row))
+        _copy_file(evidence.blob_path(source_uploads, digest), evidence.blob_path(target_uploads, digest))
+        for kind in ('png', 'txt'):
+            _copy_file(evidence.preview_path(source_uploads, digest, kind),
+                       evidence.preview_path(target_uploads, digest, kind))
+    return [project['id'] for project in projects]
+
+
+def _set_shard(router, organization, shard, state):
+    conn = sqlite3.connect(router.directory_path)
+    conn.execute('''
+        INSERT INTO shard_map (organization, shard, state, updated_at) VALUES (?, ?, ?, CURRENT_TIMESTAMP)
+        ON CONFLICT (organization) DO UPDATE SET shard = excluded.shard, state = excluded.state,
+                                                 updated_at = excluded.updated_at
+    ''', (organization, shard, state))
+    conn.commit()
+    conn.close()
+
+
+def move_organization(router, organization, target_shard, wait=None):
+    """Move an organisation's data to target_shard; return the number of projects moved"""
+    if target_shard not in router.all_shards():
+        raise ValueError(f'Unknown shard: {target_shard}')
+    source_shard = router.shard_map(refresh=True).get(organization, (MAIN, 'active'))[0]
+    if source_shard == target_shard:
+        return 0
+
+    # Stop traffic for the organisation and let every worker's cached map (and
+    # pending autosaves) catch up before reading its rows
+    _set_shard(router, organization, source_shard, 'moving')
+    time.sleep(router.map_ttl + 15 if wait is None else wait)
+
+    source = router.connect(source_shard)
+    target = router.connect(target_shard)
+    try:
+        user_ids = [row['id'] for row in source.execute('SELECT id FROM users WHERE organization = ?',
+                                                        (organization,)).fetchall()]
+        project_ids = []
+        if user_ids:
+            try:
+                project_ids = copy_organization(source, target, user_ids,
+                                                router.upload_folder(source_shard),
+                                                router.upload_folder(target_shard))
+                target.commit()
+            except Exception:
+                target.rollback()
+                _set_shard(router, organization, source_shard, 'active')
+                raise
+        _set_shard(router, organization, target_shard, 'active')
+
+        # Hide the old copies at once, then purge them in small batches
+        source.executemany('UPDATE projects SET deleted_at = ? WHERE id = ? AND deleted_at IS NULL',
+                           [(db_types.utcnow(), project_id)
+                            for project_id in project_ids])
+        source.commit()
+        for project_id in project_ids:
+            project_purge.purge_project(source, project_id, router.upload_folder(source_shard))
+    finally:
+        target.close()
+        source.close()
+    return len(project_ids)
+
+
+def organization_weights(router):
+    """{organization: (shard, project count)} for every organisation with users"""
+    shard_map = router.shard_map(refresh=True)
+    counts = router.fan_out(lambda conn, shard: {row[0]: row[1] for row in conn.execute('''
+        SELECT u.organization, COUNT(*) FROM main.projects p JOIN users u ON u.id = p.user_id
+        WHERE u.organization IS NOT NULL GROUP BY u.organization
+    ''')})
+    conn = sqlite3.connect(router.directory_path)
+    organizations = [row[0] for row in conn.execute(
+        "SELECT DISTINCT organization FROM users WHERE organization IS NOT NULL AND organization != ''")]
+    conn.close()
+
+    weights = {}
+    for organization in organizations:
+        shard = shard_map.get(organization, (MAIN, 'active'))[0]
+        weights[organization] = (shard, counts.get(shard, {}).get(organization, 0))
+    return weights
+
+
+def plan_rebalance(router, tolerance=0.2):
+    """Return [(organization, from_shard, to_shard)] moves that even out project counts
+
+    Organisations still on the main database are placed first (largest on the
+    least loaded shard); then the smallest organisation on the busiest shard
+    moves to the least busy one while that narrows the gap by more than the
+    tolerance.
+    """
+    weights = organization_weights(router)
+    load = {shard: 0 for shard in router.names}
+    placement = {}
+    for organization, (shard, weight) in weights.items():
+        if shard in load:
+            load[shard] += weight
+            placement[organization] = shard
+
+    moves = []
+    unplaced = sorted((o for o in weights if o not in placement), key=lambda o: -weights[o][1])
+    for organization in unplaced:
+        target = min(load, key=load.get)
+        load[target] += weights[organization][1]
+        placement[organization] = target
+        moves.append((organization, weights[organization][0], target))
+
+    average = sum(load.values()) / len(load) if load else 0
+    while load:
+        busiest = max(load, key=load.get)
+        idlest = min(load, key=load.get)
+        gap = load[busiest] - load[idlest]
+        if gap <= tolerance * average:
+            break
+        candidates = sorted((weights[o][1], o) for o, shard in placement.items()
+                            if shard == busiest and 0 < weights[o][1] < gap)
+        if not candidates:
+            break
+        weight, organization = candidates[0]
+        load[busiest] -= weight
+        load[idlest] += weight
+        placement[organization] = idlest
+        moves = [m for m in moves if m[0] != organization]
+        moves.append((organization, weights[organization][0], idlest))
+    return [move for move in moves if move[1] != move[2]]
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Inspect and rebalance organisation shards')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    subparsers.add_parser('status', help='Show each organisation\'s shard and size')
+    move_parser = subparsers.add_parser('move', help='Move one organisation to a shard')
+    move_parser.add_argument('organization')
+    move_parser.add_argument('shard')
+    rebalance_parser = subparsers.add_parser('rebalance', help='Place and move organisations to even out shards')
+    rebalance_parser.add_argument('--dry-run', action='store_true')
+    rebalance_parser.add_argument('--tolerance', type=float, default=0.2)
+    args = parser.parse_args()
+
+    from app_simple import router
+    if router is None:
+        raise SystemExit('Sharding is disabled; set SHARD_COUNT')
+
+    if args.command == 'status':
+        for organization, (shard, weight) in sorted(organization_weights(router).items()):
+            print(f'{shard:10} {weight:8} project(s)  {organization}')
+    elif args.command == 'move':
+        moved = move_organization(router, args.organization, args.shard)
+        print(f'Moved {moved} project(s) of {args.organization} to {args.shard}')
+    elif args.command == 'rebalance':
+        for organization, source, target in plan_rebalance(router, args.tolerance):
+            print(f'{organization}: {source} -> {target}')
+            if not args.dry_run:
+                move_organization(router, organization, target)
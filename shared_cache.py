@@ -0,0 +1,289 @@
+"""
+A cache shared by every worker on the host.
+
+Entries live in their own SQLite file (SHARED_CACHE_PATH, in WAL mode so
+readers never wait for a writer), so a value computed by one gunicorn worker
+is there for the others and deleting or replacing it reaches every worker.
+No server is involved. In front of it each process keeps a small in-memory
+L1 tier whose entries expire after SHARED_CACHE_L1_TTL seconds, which
+bounds how long a worker can keep serving a value another worker replaced.
+
+* set(key, value, ttl) and get(key); values are pickled
+* every entry has a version that goes up on each write, and
+  compare_and_set(key, value, expected_version) only writes when nobody
+  else wrote in between (0 means "only if absent"); it returns the new
+  version, CONFLICT when someone did, or None when the write failed
+* namespaced keys: key(namespace, *parts) includes the namespace's
+  generation, so bump(namespace) invalidates everything in it at once
+* expired entries and, past max_entries, the least recently used ones are
+  evicted every EVICT_EVERY writes
+
+The cache holds copies of data whose source of truth is elsewhere: losing
+the file loses nothing, and errors reading it are treated as misses.
+"""
+import os
+import pickle
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+# Writes between eviction passes
+EVICT_EVERY = 100
+
+# A read only records the access when the last one is older than this, so
+# LRU order costs a write per entry per minute at most rather than per read
+TOUCH_SECONDS = 60
+
+GENERATION_PREFIX = '__generation__:'
+
+# Returned by compare_and_set when the key is no longer at the expected version
+CONFLICT = 0
+
+# Attempts bump() makes when other writers keep moving the generation
+BUMP_ATTEMPTS = 5
+
+
+class LocalLRU:
+    """In-process L1 tier: an LRU of (value, version) that forgets entries after ttl seconds
+
+    Anything with the same get/set/delete/clear methods can be passed to
+    SharedCache as its l1 instead.
+    """
+
+    def __init__(self, maxsize=1024, ttl=2.0):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if entry[2] < time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return entry[0], entry[1]
+
+    def set(self, key, value, version, ttl=None):
+        ttl = self.ttl if ttl is None else min(ttl, self.ttl)
+        with self._lock:
+            self._entries[key] = (value, version, time.monotonic() + ttl)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+class SharedCache:
+    """SQLite-backed cache shared between processes, with an optional in-process L1"""
+
+    def __init__(self, path, max_entries=10000, l1=None):
+        self.path = path
+        self.max_entries = max_entries
+        self.l1 = l1
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._writes = 0
+        self.stats = {'l1_hits': 0, 'hits': 0, 'misses': 0, 'sets': 0, 'cas_conflicts': 0, 'evictions': 0,
+                      'errors': 0}
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        # Not kept: a connection must not be carried into forked workers
+        conn = self._connect()
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS cache (
+                key TEXT PRIMARY KEY,
+                value BLOB NOT NULL,
+                version INTEGER NOT NULL,
+                expires_at REAL,
+                accessed_at REAL NOT NULL
+            )
+        ''')
+        conn.execute('CREATE INDEX IF NOT EXISTS idx_cache_accessed_at ON cache (accessed_at)')
+        conn.execute('CREATE INDEX IF NOT EXISTS idx_cache_expires_at ON cache (expires_at) WHERE expires_at IS NOT NULL')
+        conn.close()
+
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+        conn.execute('PRAGMA journal_mode = WAL')
+        conn.execute('PRAGMA synchronous = OFF')
+        return conn
+
+    def _conn(self):
+        # One connection per thread, and new ones after a fork
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = self._connect()
+            self._local.conn, self._local.pid = conn, os.getpid()
+        return conn
+
+    def _count(self, name, n=1):
+        with self._lock:
+            self.stats[name] += n
+
+    def get_with_version(self, key):
+        """(value, version), or (None, 0) when the key is absent or expired"""
+        if self.l1 is not None:
+            entry = self.l1.get(key)
+            if entry is not None:
+                self._count('l1_hits')
+                return entry
+        now = time.time()
+        try:
+            row = self._conn().execute(
+                'SELECT value, version, expires_at, accessed_at FROM cache WHERE key = ?', (key,)).fetchone()
+            if row is None or (row[2] is not None and row[2] <= now):
+                self._count('misses')
+                return None, 0
+            if now - row[3] > TOUCH_SECONDS:
+                self._conn().execute('UPDATE cache SET accessed_at = ? WHERE key = ?', (now, key))
+            value = pickle.loads(row[0])
+        except (sqlite3.Error, pickle.UnpicklingError) as e:
+            print(f"Shared cache read failed for {key}: {e}")
+            self._count('errors')
+            return None, 0
+        self._count('hits')
+        if self.l1 is not None:
+            self.l1.set(key, value, row[1], None if row[2] is None else row[2] - now)
+        return value, row[1]
+
+    def get(self, key, default=None):
+        value, version = self.get_with_version(key)
+        return default if version == 0 else value
+
+    def set(self, key, value, ttl=None):
+        """Store value under key; returns its new version, or None when the write failed"""
+        return self._write(key, value, ttl, None)
+
+    def compare_and_set(self, key, value, expected_version, ttl=None):
+        """Store value only if key is still at expected_version (0: absent)
+
+        Returns the new version, CONFLICT when key has moved on, or None when
+        the write failed.
+        """
+        return self._write(key, value, ttl, expected_version)
+
+    def _write(self, key, value, ttl, expected_version):
+        now = time.time()
+        expires_at = now + ttl if ttl else None
+        blob = pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+        conn = self._conn()
+        try:
+            conn.execute('BEGIN IMMEDIATE')
+            try:
+                row = conn.execute('SELECT version, expires_at FROM cache WHERE key = ?', (key,)).fetchone()
+                current = 0 if row is None or (row[1] is not None and row[1] <= now) else row[0]
+                if expected_version is not None and current != expected_version:
+                    conn.execute('ROLLBACK')
+                    self._count('cas_conflicts')
+                    return CONFLICT
+                # Versions keep counting through expiry, so an old version never matches again
+                version = (row[0] if row else 0) + 1
+                conn.execute('''
+                    INSERT INTO cache (key, value, version, expires_at, accessed_at) VALUES (?, ?, ?, ?, ?)
+                    ON CONFLICT (key) DO UPDATE SET value = excluded.value, version = excluded.version,
+                        expires_at = excluded.expires_at, accessed_at = excluded.accessed_at
+                ''', (key, blob, version, expires_at, now))
+                conn.execute('COMMIT')
+            except BaseException:
+                if conn.in_transaction:
+                    conn.execute('ROLLBACK')
+                raise
+        except sqlite3.Error as e:
+            print(f"Shared cache write failed for {key}: {e}")
+            self._count('errors')
+            return None
+
+        if self.l1 is not None:
+            self.l1.set(key, value, version, ttl)
+        self._count('sets')
+        with self._lock:
+            self._writes += 1
+            evict = self._writes % EVICT_EVERY == 0
+        if evict:
+            self.evict()
+        return version
+
+    def delete(self, key):
+        if self.l1 is not None:
+            self.l1.delete(key)
+        try:
+            self._conn().execute('DELETE FROM cache WHERE key = ?', (key,))
+        except sqlite3.Error as e:
+            print(f"Shared cache delete failed for {key}: {e}")
+            self._count('errors')
+
+    def get_or_set(self, key, compute, ttl=None):
+        """The cached value for key, or compute() stored under key"""
+        value, version = self.get_with_version(key)
+        if version:
+            return value
+        value = compute()
+        self.set(key, value, ttl)
+        return value
+
+    def key(self, namespace, *parts):
+        """A key inside namespace that changes whenever the namespace is bumped"""
+        generation = self.get(GENERATION_PREFIX + namespace, 0)
+        return ':'.join([namespace, f'g{generation}', *map(str, parts)])
+
+    def bump(self, namespace):
+        """Invalidate every key made with key(namespace, ...); returns whether it took effect"""
+        generation_key = GENERATION_PREFIX + namespace
+        for _ in range(BUMP_ATTEMPTS):
+            # Compare against the stored version, not a possibly stale L1 copy
+            if self.l1 is not None:
+                self.l1.delete(generation_key)
+            generation, version = self.get_with_version(generation_key)
+            result = self.compare_and_set(generation_key, (generation or 0) + 1, version)
+            if result is None:
+                return False
+            if result != CONFLICT:
+                return True
+        print(f"Shared cache bump of {namespace} gave up after {BUMP_ATTEMPTS} conflicting writes")
+        return False
+
+    def evict(self):
+        """Drop expired entries, then the least recently used beyond max_entries; return how many"""
+        conn = self._conn()
+        try:
+            removed = conn.execute('DELETE FROM cache WHERE expires_at <= ?', (time.time(),)).rowcount
+            excess = conn.execute('SELECT COUNT(*) FROM cache').fetchone()[0] - self.max_entries
+            if excess > 0:
+                removed += conn.execute('''
+                    DELETE FROM cache WHERE key IN (
+                        SELECT key FROM cache WHERE key NOT LIKE ? ORDER BY accessed_at LIMIT ?
+                    )
+                ''', (GENERATION_PREFIX + '%', excess)).rowcount
+        except sqlite3.Error as e:
+            print(f"Shared cache eviction failed: {e}")
+            self._count('errors')
+            return 0
+        self._count('evictions', removed)
+        return removed
+
+    def clear(self):
+        if self.l1 is not None:
+            self.l1.clear()
+        self._conn().execute('DELETE FROM cache')
+
+    def snapshot(self):
+        with self._lock:
+            stats = dict(self.stats)
+        lookups = stats['l1_hits'] + stats['hits'] + stats['misses']
+        stats['hit_ratio'] = round((stats['l1_hits'] + stats['hits']) / lookups, 3) if lookups else None
+        try:
+            stats['entries'] = self._conn().execute('SELECT COUNT(*) FROM cache').fetchone()[0]
+        except sqlite3.Error:
+            stats['entries'] = None
+        return stats
@@ -0,0 +1,376 @@
+"""
+"Projects like this one": nearest-neighbour search over SDG score vectors.
+
+The latest finalized assessment of every project is a 17-dimensional vector.
+Vectors live in a contiguous float32 matrix saved next to the database
+(snapshot_prefix) and opened with mmap, so every worker shares the same
+pages instead of holding its own copy. Changes made after the snapshot are
+kept in a small in-memory delta that overrides the snapshot rows; once the
+delta grows past DELTA_LIMIT the worker writes a fresh snapshot and the
+others pick it up, keeping their own delta entries until they have re-read
+them from the database.
+
+Changes reach every worker through the project_vector_changes log: triggers
+add the project id whenever a finalized score, an assessment's status, or a
+project's type, location or deletion changes, and each worker pulls the
+projects logged after its watermark (the last log id it has seen) every
+REFRESH_SECONDS. The log is pruned after CHANGE_RETENTION_SECONDS by
+prune_changes(); a worker whose watermark fell behind the pruned rows, or
+whose snapshot is missing or from before the log, rebuilds from the database.
+
+The index is turned off (DisabledIndex) when sharding is on: each shard file
+numbers its projects from 1 and an index per shard would only ever find
+projects of the organisations on the same shard, so rather than answer from
+part of the data the app shows no similar projects.
+"""
+import os
+import threading
+import time
+
+import numpy as np
+
+NUM_SDGS = 17
+
+# Number of in-memory updates tolerated before the snapshot is rewritten
+DELTA_LIMIT = 1000
+
+# How often to pull changes made by other workers
+REFRESH_SECONDS = 30
+
+# Seconds change log rows are kept; a worker that has not refreshed for longer rebuilds
+CHANGE_RETENTION_SECONDS = 24 * 3600
+
+# Project ids per IN (...) when re-reading changed projects
+READ_CHUNK = 500
+
+METRICS = ('cosine', 'euclidean')
+
+LATEST_VECTORS_SQL = '''
+    SELECT a.project_id, p.project_type, p.location, s.sdg_id, s.score
+    FROM assessments a
+    JOIN projects p ON p.id = a.project_id
+    LEFT JOIN sdg_scores s ON s.assessment_id = a.id
+    WHERE a.status = 'completed'
+      AND p.deleted_at IS NULL
+      AND a.id = (SELECT MAX(a2.id) FROM assessments a2
+                  WHERE a2.project_id = a.project_id AND a2.status = 'completed')
+'''
+
+LAST_CHANGE_SQL = "SELECT seq FROM sqlite_sequence WHERE name = 'project_vector_changes'"
+CHANGED_PROJECTS_SQL = 'SELECT DISTINCT project_id FROM project_vector_changes WHERE id > ? AND id <= ?'
+
+
+def ensure_table(conn):
+    """The change log and the triggers that fill it"""
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS project_vector_changes (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            project_id INTEGER NOT NULL,
+            changed_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_project_vector_changes_changed_at '
+                 'ON project_vector_changes (changed_at)')
+    for name, event, condition, project_id in (
+        ('trg_projects_vector_change', 'UPDATE OF project_type, location, deleted_at ON projects',
+         'OLD.project_type IS NOT NEW.project_type OR OLD.location IS NOT NEW.location '
+         'OR OLD.deleted_at IS NOT NEW.deleted_at', 'NEW.id'),
+        ('trg_assessments_insert_vector_change', 'INSERT ON assessments',
+         "NEW.status = 'completed'", 'NEW.project_id'),
+        ('trg_assessments_update_vector_change', 'UPDATE OF status ON assessments',
+         "OLD.status IS NOT NEW.status AND 'completed' IN (OLD.status, NEW.status)", 'NEW.project_id'),
+        ('trg_assessments_delete_vector_change', 'DELETE ON assessments',
+         "OLD.status = 'completed'", 'OLD.project_id'),
+        ('trg_sdg_scores_insert_vector_change', 'INSERT ON sdg_scores',
+         "(SELECT status FROM assessments WHERE id = NEW.assessment_id) = 'completed'",
+         '(SELECT project_id FROM assessments WHERE id = NEW.assessment_id)'),
+        ('trg_sdg_scores_update_vector_change', 'UPDATE OF score ON sdg_scores',
+         "OLD.score IS NOT NEW.score AND (SELECT status FROM assessments WHERE id = NEW.assessment_id) = 'completed'",
+         '(SELECT project_id FROM assessments WHERE id = NEW.assessment_id)'),
+    ):
+        conn.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS {name} AFTER {event}
+            WHEN {condition}
+            BEGIN
+                INSERT INTO project_vector_changes (project_id) VALUES ({project_id});
+            END
+        ''')
+
+
+def prune_changes(conn, retention=CHANGE_RETENTION_SECONDS):
+    """Delete change log rows older than retention seconds; returns how many"""
+    removed = conn.execute("DELETE FROM project_vector_changes WHERE changed_at < datetime('now', ?)",
+                           (f'-{retention} seconds',)).rowcount
+    conn.commit()
+    return removed
+
+
+def snapshot_prefix(db_path):
+    """File prefix of the snapshot that belongs to the database at db_path"""
+    return os.path.splitext(db_path)[0] + '.project_vectors'
+
+
+def discard_snapshot(prefix):
+    """Remove a snapshot, e.g. after its database was restored; workers rebuild on their next query"""
+    for suffix in ('.meta.npz', '.vectors.npy'):
+        if os.path.exists(prefix + suffix):
+            os.remove(prefix + suffix)
+
+
+def _rows_to_vectors(rows):
+    """Group (project, sdg, score) rows into {project_id: (type, location, vector)}"""
+    vectors = {}
+    for row in rows:
+        project_id = row['project_id']
+        if project_id not in vectors:
+            vectors[project_id] = (row['project_type'] or '', row['location'] or '',
+                                   np.zeros(NUM_SDGS, dtype=np.float32))
+        sdg_id, score = row['sdg_id'], row['score']
+        if sdg_id and 1 <= sdg_id <= NUM_SDGS and isinstance(score, (int, float)):
+            vectors[project_id][2][sdg_id - 1] = score
+    return vectors
+
+
+def _last_change(conn):
+    row = conn.execute(LAST_CHANGE_SQL).fetchone()
+    return row[0] if row else 0
+
+
+class SimilarProjectIndex:
+    """Memory-mapped score matrix with vectorised top-k queries"""
+
+    def __init__(self, path):
+        # path is a file prefix, from snapshot_prefix()
+        self.path = path
+        self._lock = threading.Lock()
+        self._snapshot_mtime = None
+        self._refreshed_at = 0
+        self._watermark = -1
+        self._vectors = np.zeros((0, NUM_SDGS), dtype=np.float32)
+        self._norms = np.zeros(0, dtype=np.float32)
+        self._ids = np.zeros(0, dtype=np.int64)
+        self._types = np.zeros(0, dtype=object)
+        self._locations = np.zeros(0, dtype=object)
+        self._row_of = {}
+        self._delta = {}  # project_id -> (type, location, vector), or None when removed
+        self._merged_cache = None
+
+    @property
+    def _vectors_file(self):
+        return self.path + '.vectors.npy'
+
+    @property
+    def _meta_file(self):
+        return self.path + '.meta.npz'
+
+    def ensure_current(self, conn):
+        """Open the latest snapshot and pull in changes logged since it was taken"""
+        if not os.path.exists(self._meta_file):
+            self.rebuild(conn)
+        elif os.path.getmtime(self._meta_file) != self._snapshot_mtime:
+            # Another worker wrote it; our own delta entries are re-read rather than trusted over it
+            self.refresh(conn, self._open_snapshot())
+        elif time.time() - self._refreshed_at > REFRESH_SECONDS:
+            self.refresh(conn)
+
+    def rebuild(self, conn):
+        """Write a fresh snapshot from the database"""
+        with self._lock:
+            before = dict(self._delta)
+        watermark = _last_change(conn)
+        vectors = _rows_to_vectors(conn.execute(LATEST_VECTORS_SQL).fetchall())
+        self._write_snapshot(vectors, watermark)
+        self._open_snapshot(compacted=before)
+        self._refreshed_at = time.time()
+
+    def refresh(self, conn, projects=()):
+        """Re-read the projects logged as changed since the watermark, and projects"""
+        with self._lock:
+            watermark = self._watermark
+        last = _last_change(conn)
+        if watermark < 0 or self._missed(conn, watermark, last):
+            self.rebuild(conn)
+            return
+        changed = set(projects)
+        if last > watermark:
+            changed.update(row[0] for row in conn.execute(CHANGED_PROJECTS_SQL, (watermark, last)).fetchall())
+        if len(changed) > DELTA_LIMIT:
+            self.rebuild(conn)
+            return
+        changed = sorted(changed)
+        vectors = {}
+        for i in range(0, len(changed), READ_CHUNK):
+            chunk = changed[i:i + READ_CHUNK]
+            vectors.update(_rows_to_vectors(conn.execute(
+                LATEST_VECTORS_SQL + f' AND a.project_id IN ({",".join("?" * len(chunk))})', chunk).fetchall()))
+        with self._lock:
+            for project_id in changed:
+                # None: no longer finalized, or deleted
+                self._delta[project_id] = vectors.get(project_id)
+            if changed:
+                self._merged_cache = None
+            self._watermark = max(self._watermark, last)
+            self._refreshed_at = time.time()
+        self._maybe_compact()
+
+    @staticmethod
+    def _missed(conn, watermark, last):
+        """Whether log rows after watermark were pruned before this worker read them"""
+        if last <= watermark:
+            return False
+        first = conn.execute('SELECT MIN(id) FROM project_vector_changes').fetchone()[0]
+        return first is None or first > watermark + 1
+
+    def upsert(self, project_id, project_type, location, scores):
+        """Record the scores of a newly finalized assessment"""
+        vector = np.zeros(NUM_SDGS, dtype=np.float32)
+        for sdg_id, score in scores.items():
+            if sdg_id and 1 <= sdg_id <= NUM_SDGS and isinstance(score, (int, float)):
+                vector[sdg_id - 1] = score
+        with self._lock:
+            self._delta[project_id] = (project_type or '', location or '', vector)
+            self._merged_cache = None
+        self._maybe_compact()
+
+    def remove(self, project_id):
+        """Exclude a project from future queries"""
+        with self._lock:
+            self._delta[project_id] = None
+            self._merged_cache = None
+
+    def query(self, project_id, k=5, metric='cosine', project_type=None, location=None):
+        """Return up to k (project_id, score) pairs nearest to a project's vector
+
+        Cosine returns similarity (higher is closer), euclidean returns distance.
+        """
+        if metric not in METRICS:
+            raise ValueError(f'Unknown metric: {metric}')
+        with self._lock:
+            vectors, norms, ids, types, locations = self._merged()
+        matches = np.nonzero(ids == project_id)[0]
+        if not len(matches):
+            return []
+        target = vectors[matches[0]]
+
+        mask = ids != project_id
+        if project_type:
+            mask &= types == project_type
+        if location:
+            mask &= locations == location
+
+        if metric == 'cosine':
+            target_norm = float(np.linalg.norm(target))
+            if target_norm == 0:
+                return []
+            with np.errstate(divide='ignore', invalid='ignore'):
+                scores = (vectors @ target) / (norms * target_norm)
+            scores = np.where(norms > 0, scores, -np.inf)
+            scores = np.where(mask, scores, -np.inf)
+            order_key = -scores
+        else:
+            scores = np.sqrt(((vectors - target) ** 2).sum(axis=1))
+            scores = np.where(mask, scores, np.inf)
+            order_key = scores
+
+        k = min(k, int(mask.sum()))
+        if k <= 0:
+            return []
+        top = np.argpartition(order_key, k - 1)[:k]
+        top = top[np.argsort(order_key[top], kind='stable')]
+        return [(int(ids[i]), round(float(scores[i]), 4)) for i in top if np.isfinite(scores[i])]
+
+    def _merged(self):
+        """Snapshot rows with the delta applied on top, built once per change of the delta"""
+        if not self._delta:
+            return self._vectors, self._norms, self._ids, self._types, self._locations
+        if self._merged_cache is not None:
+            return self._merged_cache
+        keep = np.ones(len(self._ids), dtype=bool)
+        for project_id in self._delta:
+            row = self._row_of.get(project_id)
+            if row is not None:
+                keep[row] = False
+        added = [(pid, entry) for pid, entry in self._delta.items() if entry is not None]
+        added_vectors = np.array([entry[2] for _, entry in added], dtype=np.float32).reshape(-1, NUM_SDGS)
+        self._merged_cache = (
+            np.concatenate([self._vectors[keep], added_vectors]),
+            np.concatenate([self._norms[keep], np.linalg.norm(added_vectors, axis=1)]),
+            np.concatenate([self._ids[keep], np.array([pid for pid, _ in added], dtype=np.int64)]),
+            np.concatenate([self._types[keep], np.array([e[0] for _, e in added], dtype=object)]),
+            np.concatenate([self._locations[keep], np.array([e[1] for _, e in added], dtype=object)]),
+        )
+        return self._merged_cache
+
+    def _maybe_compact(self):
+        with self._lock:
+            if len(self._delta) < DELTA_LIMIT:
+                return
+            vectors, _, ids, types, locations = self._merged()
+            merged = {int(pid): (types[i], locations[i], vectors[i]) for i, pid in enumerate(ids)}
+            watermark = self._watermark
+            compacted = dict(self._delta)
+        self._write_snapshot(merged, watermark)
+        self._open_snapshot(compacted=compacted)
+
+    def _write_snapshot(self, vectors, watermark):
+        os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+        ids = np.array(list(vectors), dtype=np.int64)
+        matrix = np.array([vectors[pid][2] for pid in ids], dtype=np.float32).reshape(-1, NUM_SDGS)
+
+        # Write to temporary files and swap them in so readers never see half a snapshot
+        tmp_vectors = self._vectors_file + '.tmp.npy'
+        np.save(tmp_vectors, np.ascontiguousarray(matrix))
+        tmp_meta = self._meta_file + '.tmp.npz'
+        np.savez(tmp_meta, ids=ids,
+                 types=np.array([vectors[pid][0] for pid in ids], dtype=str),
+                 locations=np.array([vectors[pid][1] for pid in ids], dtype=str),
+                 watermark=np.array(watermark, dtype=np.int64))
+        os.replace(tmp_vectors, self._vectors_file)
+        os.replace(tmp_meta, self._meta_file)
+
+    def _open_snapshot(self, compacted=None):
+        """Map the snapshot files; returns the projects whose delta entries were kept over it
+
+        compacted is the delta that went into a snapshot this worker built;
+        entries still identical to it are dropped, anything newer is kept.
+        """
+        mtime = os.path.getmtime(self._meta_file)
+        with np.load(self._meta_file) as meta:
+            ids = meta['ids']
+            types = meta['types'].astype(object)
+            locations = meta['locations'].astype(object)
+            # Snapshots from before the change log carry a timestamp; -1 makes the next refresh rebuild
+            watermark = int(meta['watermark']) if meta['watermark'].dtype.kind in 'iu' else -1
+        vectors = np.load(self._vectors_file, mmap_mode='r')
+        with self._lock:
+            self._vectors = vectors
+            self._norms = np.linalg.norm(vectors, axis=1) if len(vectors) else np.zeros(0, dtype=np.float32)
+            self._ids = ids
+            self._types = types
+            self._locations = locations
+            self._row_of = {int(pid): row for row, pid in enumerate(ids)}
+            for project_id, entry in (compacted or {}).items():
+                if project_id in self._delta and self._delta[project_id] is entry:
+                    del self._delta[project_id]
+            self._merged_cache = None
+            self._watermark = watermark
+            self._snapshot_mtime = mtime
+            return set(self._delta)
+
+
+class DisabledIndex:
+    """Stands in for SimilarProjectIndex where it cannot cover every project (SHARD_COUNT > 0)"""
+
+    def ensure_current(self, conn):
+        pass
+
+    def upsert(self, project_id, project_type, location, scores):
+        pass
+
+    def remove(self, project_id):
+        pass
+
+    def query(self, project_id, k=5, metric='cosine', project_type=None, location=None):
+        if metric not in METRICS:
+            raise ValueError(f'Unknown metric: {metric}')
+        return []
@@ -0,0 +1,81 @@
+"""
+Fast worker startup.
+
+Without it every gunicorn worker compiles each template the first time a
+visitor hits it, so after a restart the first person on every wizard step
+waits for Jinja. With FAST_STARTUP=1 (see gunicorn.conf.py) the app is
+loaded once in the master before fork:
+
+* every template under app/templates is compiled into the Jinja environment
+  and into an on-disk bytecode cache, so forked workers start with them in
+  memory and workers started later (max_requests, a crash) load bytecode
+  instead of compiling
+* shared data is loaded once and inherited by every worker
+* a warmup pass renders the main pages, which also takes care of lazy
+  imports and first-use setup inside Flask and Werkzeug
+
+The bytecode cache is used even without FAST_STARTUP, so plain worker
+restarts get faster too.
+"""
+import os
+import time
+
+from jinja2 import FileSystemBytecodeCache, TemplateSyntaxError
+
+# Pages rendered by warmup(); all of them work without a login
+WARMUP_PATHS = ('/', '/about', '/resources', '/login', '/register', '/forgot-password')
+
+
+def install_bytecode_cache(app, cache_dir):
+    """Store compiled templates under cache_dir, shared by every worker"""
+    os.makedirs(cache_dir, exist_ok=True)
+    app.jinja_env.bytecode_cache = FileSystemBytecodeCache(cache_dir)
+
+
+def precompile_templates(app):
+    """Compile every template the app can load; return (compiled, {name: error})"""
+    compiled = 0
+    errors = {}
+    for name in app.jinja_env.list_templates(extensions=('html', 'txt', 'xml')):
+        try:
+            app.jinja_env.get_template(name)
+            compiled += 1
+        except TemplateSyntaxError as e:
+            errors[name] = f'line {e.lineno}: {e.message}'
+    return compiled, errors
+
+
+def warmup(app, paths=WARMUP_PATHS):
+    """GET each path once through the test client; return {path: (status, seconds)}"""
+    results = {}
+    client = app.test_client()
+    for path in paths:
+        started = time.perf_counter()
+        try:
+            status = client.get(path).status_code
+        except Exception as e:
+            status = type(e).__name__
+        results[path] = (status, time.perf_counter() - started)
+    return results
+
+
+def prepare(app, cache_dir, preload=None, paths=WARMUP_PATHS):
+    """Run the whole pre-fork startup and print what it did"""
+    started = time.perf_counter()
+    install_bytecode_cache(app, cache_dir)
+    compiled, errors = precompile_templates(app)
+    for name, error in errors.items():
+        print(f"Template {name} failed to compile: {error}")
+    compiled_at = time.perf_counter()
+
+    if preload is not None:
+        preload()
+    preloaded_at = time.perf_counter()
+
+    results = warmup(app, paths)
+    failed = [f'{path} ({status})' for path, (status, _) in results.items() if status != 200]
+    print(f"Startup: {compiled} templates compiled in {compiled_at - started:.2f}s, "
+          f"data preloaded in {preloaded_at - compiled_at:.2f}s, "
+          f"{len(results)} pages warmed in {time.perf_counter() - preloaded_at:.2f}s"
+          + (f"; warmup failed for {', '.join(failed)}" if failed else ''))
+    return results
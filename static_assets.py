@@ -0,0 +1,200 @@
+"""
+Fingerprinted, precompressed static assets.
+
+The build step copies every file under app/static to app/static/dist with a
+hash of its content in the name (css/app.css -> dist/css/app.1a2b3c4d5e6f.css),
+writes .gz (and .br when the brotli package is installed) variants of text
+assets next to it, and records everything in dist/manifest.json:
+
+    python static_assets.py build
+
+Templates link assets with asset_url('static', filename='css/app.css'),
+which takes the same arguments as url_for and returns the fingerprinted URL
+when the file is in the manifest. A fingerprinted URL never changes content,
+so it is served with a one-year immutable Cache-Control header and the
+smallest variant the browser accepts; a deploy only changes the URLs of the
+files that actually changed. Relative url(...) references inside CSS are
+rewritten to the fingerprinted names.
+
+Earlier builds are left in dist so pages rendered before a deploy keep
+working; delete dist to start over.
+"""
+import argparse
+import gzip
+import hashlib
+import json
+import mimetypes
+import os
+import posixpath
+import re
+
+from flask import current_app, request, send_from_directory
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+BUILD_DIR = 'dist'
+MANIFEST = 'manifest.json'
+
+# Only text formats shrink; images and woff fonts are already compressed
+COMPRESSIBLE = {'.css', '.js', '.mjs', '.map', '.json', '.svg', '.txt', '.html', '.xml', '.ico', '.ttf', '.otf', '.eot'}
+
+# Keep a variant only when it saves at least this fraction
+MIN_SAVING = 0.05
+
+# Served with fingerprinted files; the URL changes whenever the content does
+IMMUTABLE_MAX_AGE = 365 * 24 * 3600
+
+HASH_LENGTH = 12
+
+CSS_URL = re.compile(r'''url\(\s*(['"]?)([^'")]+)\1\s*\)''')
+
+
+def _fingerprint(path, content):
+    digest = hashlib.sha256(content).hexdigest()[:HASH_LENGTH]
+    root, ext = posixpath.splitext(path)
+    return f'{root}.{digest}{ext}'
+
+
+def _rewrite_css(name, content, files):
+    """Point relative url(...) references at already built fingerprinted files"""
+    base = posixpath.dirname(name)
+
+    def replace(match):
+        quote, ref = match.groups()
+        if ref.startswith(('data:', 'http:', 'https:', '//', '/', '#')):
+            return match.group(0)
+        target, suffix = re.match(r'([^?#]*)(.*)', ref).groups()
+        entry = files.get(posixpath.normpath(posixpath.join(base, target)))
+        if entry is None:
+            return match.group(0)
+        built = posixpath.relpath(entry['file'], posixpath.join(BUILD_DIR, base))
+        return f'url({quote}{built}{suffix}{quote})'
+
+    return CSS_URL.sub(replace, content.decode('utf-8')).encode('utf-8')
+
+
+def _write_variants(path, content):
+    """Write .gz/.br files for path when they are worth it; return their sizes"""
+    sizes = {}
+    variants = [('gzip', '.gz', lambda data: gzip.compress(data, compresslevel=9, mtime=0))]
+    if brotli is not None:
+        variants.append(('br', '.br', lambda data: brotli.compress(data, quality=11)))
+    for encoding, suffix, compress in variants:
+        compressed = compress(content)
+        if len(compressed) <= len(content) * (1 - MIN_SAVING):
+            with open(path + suffix, 'wb') as f:
+                f.write(compressed)
+            sizes[encoding] = len(compressed)
+    return sizes
+
+
+def build(static_folder):
+    """Fingerprint and compress everything under static_folder; return the manifest"""
+    build_root = os.path.join(static_folder, BUILD_DIR)
+    sources = []
+    for directory, subdirs, filenames in os.walk(static_folder):
+        if os.path.abspath(directory) == os.path.abspath(static_folder) and BUILD_DIR in subdirs:
+            subdirs.remove(BUILD_DIR)
+        for filename in filenames:
+            full_path = os.path.join(directory, filename)
+            sources.append(os.path.relpath(full_path, static_folder).replace(os.sep, '/'))
+
+    # CSS last, so the files it references already have their fingerprints
+    sources.sort(key=lambda name: (name.endswith('.css'), name))
+
+    files = {}
+    for name in sources:
+        with open(os.path.join(static_folder, name), 'rb') as f:
+            content = f.read()
+        if name.endswith('.css'):
+            content = _rewrite_css(name, content, files)
+
+        built = posixpath.join(BUILD_DIR, _fingerprint(name, content))
+        target = os.path.join(static_folder, built)
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        if not os.path.exists(target):
+            with open(target + '.tmp', 'wb') as f:
+                f.write(content)
+            os.replace(target + '.tmp', target)
+
+        entry = {'file': built, 'bytes': len(content), 'encodings': {}}
+        if posixpath.splitext(name)[1].lower() in COMPRESSIBLE:
+            entry['encodings'] = _write_variants(target, content)
+        files[name] = entry
+
+    manifest_path = os.path.join(build_root, MANIFEST)
+    os.makedirs(build_root, exist_ok=True)
+    with open(manifest_path + '.tmp', 'w') as f:
+        json.dump(files, f, indent=2, sort_keys=True)
+    os.replace(manifest_path + '.tmp', manifest_path)
+    return files
+
+
+class AssetManifest:
+    """The build manifest, loaded once per process"""
+
+    def __init__(self, static_folder):
+        self.static_folder = static_folder
+        self.files = {}
+        self.built = {}
+        path = os.path.join(static_folder, BUILD_DIR, MANIFEST)
+        if os.path.exists(path):
+            with open(path) as f:
+                self.files = json.load(f)
+            self.built = {entry['file']: entry for entry in self.files.values()}
+
+    def url_filename(self, filename):
+        """The fingerprinted filename to link to, or filename itself when it was not built"""
+        entry = self.files.get(filename)
+        return entry['file'] if entry else filename
+
+    def variant(self, filename, accept_encodings):
+        """(file to send, Content-Encoding or None) for a fingerprinted filename
+
+        accept_encodings is the request's werkzeug Accept object; brotli wins
+        over gzip when both are accepted. Returns None for unbuilt files.
+        """
+        entry = self.built.get(filename)
+        if entry is None:
+            return None
+        for encoding, suffix in (('br', '.br'), ('gzip', '.gz')):
+            if encoding in entry['encodings'] and accept_encodings[encoding]:
+                return filename + suffix, encoding
+        return filename, None
+
+    def send(self, filename):
+        """Serve a static file, precompressed and immutable when it is a built one"""
+        variant = self.variant(filename, request.accept_encodings)
+        if variant is None:
+            return current_app.send_static_file(filename)
+
+        path, encoding = variant
+        mimetype = mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+        response = send_from_directory(self.static_folder, path, mimetype=mimetype, max_age=IMMUTABLE_MAX_AGE)
+        response.cache_control.public = True
+        response.cache_control.immutable = True
+        response.vary.add('Accept-Encoding')
+        if encoding:
+            response.headers['Content-Encoding'] = encoding
+        return response
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Fingerprint and precompress static assets')
+    parser.add_argument('command', choices=['build'])
+    parser.add_argument('--static-folder', default=os.path.join('app', 'static'))
+    args = parser.parse_args()
+
+    if not os.path.isdir(args.static_folder):
+        raise SystemExit(f'{args.static_folder} does not exist')
+    if brotli is None:
+        print('brotli is not installed; writing gzip variants only')
+    manifest = build(args.static_folder)
+    total = sum(entry['bytes'] for entry in manifest.values())
+    for name, entry in sorted(manifest.items()):
+        sizes = ', '.join(f'{encoding} {size:,}' for encoding, size in sorted(entry['encodings'].items()))
+        print(f"{name} -> {entry['file']}  {entry['bytes']:,} bytes" + (f'  ({sizes})' if sizes else ''))
+    print(f'{len(manifest)} assets, {total:,} bytes')
@@ -0,0 +1,300 @@
+"""
+Storage layer shared by the app and its scripts.
+
+Code that only needs projects, assessments, scores and users goes through a
+Storage object instead of writing SQL against a connection, so the engine
+underneath can be chosen per deployment with STORAGE_ENGINE:
+
+    sqlite      - raw sqlite3 on the app's own connection (the default)
+    sqlalchemy  - SQLAlchemy Core on a pooled engine (storage_sqlalchemy.py)
+
+Both engines keep the same contract, checked by tests/test_storage.py, and
+benchmark_storage.py compares what each operation costs.
+
+Rows come back as mappings (row['name']); writes commit straight away unless
+they run inside storage.transaction(). Projects are always filtered on
+deleted_at IS NULL, like every other project query in the app.
+"""
+from abc import ABC, abstractmethod
+from contextlib import contextmanager
+
+import db_types
+
+ENGINES = ('sqlite', 'sqlalchemy')
+
+# Columns a project update may touch
+PROJECT_FIELDS = ('name', 'description', 'project_type', 'location', 'size_sqm', 'status')
+
+
+class UserRepository(ABC):
+    @abstractmethod
+    def get(self, user_id):
+        """The user with this id, or None"""
+
+    @abstractmethod
+    def get_by_email(self, email):
+        """The user with this email, or None"""
+
+    @abstractmethod
+    def create(self, email, password_hash, name, organization=None):
+        """Insert a user and return its id"""
+
+    @abstractmethod
+    def set_password(self, user_id, password_hash):
+        """Replace a user's password hash; return False if there is no such user"""
+
+
+class ProjectRepository(ABC):
+    @abstractmethod
+    def get(self, project_id, user_id):
+        """The user's live project with this id, or None"""
+
+    @abstractmethod
+    def list_for_user(self, user_id):
+        """The user's live projects, oldest first"""
+
+    @abstractmethod
+    def create(self, user_id, name, description=None, project_type=None, location=None, size_sqm=None):
+        """Insert a project and return its id"""
+
+    @abstractmethod
+    def update(self, project_id, user_id, **fields):
+        """Change PROJECT_FIELDS of the user's live project; return False if there is none"""
+
+    @abstractmethod
+    def soft_delete(self, project_id, user_id):
+        """Stamp deleted_at on the user's live project; return False if there is none"""
+
+
+class AssessmentRepository(ABC):
+    @abstractmethod
+    def get(self, assessment_id):
+        """The assessment with this id, or None"""
+
+    @abstractmethod
+    def list_for_project(self, project_id):
+        """A project's assessments, newest first"""
+
+    @abstractmethod
+    def create(self, project_id):
+        """Insert a draft assessment and return its id"""
+
+    @abstractmethod
+    def complete(self, assessment_id, overall_score):
+        """Mark an assessment completed with its overall score; return False if it does not exist"""
+
+    @abstractmethod
+    def latest_completed(self, project_id):
+        """A project's most recently completed assessment, or None"""
+
+
+class ScoreRepository(ABC):
+    @abstractmethod
+    def for_assessment(self, assessment_id):
+        """{sdg_id: score row} for an assessment"""
+
+    @abstractmethod
+    def save(self, assessment_id, sdg_id, score, notes=None):
+        """Insert or update one SDG score"""
+
+    @abstractmethod
+    def save_many(self, assessment_id, scores):
+        """Insert or update {sdg_id: (score, notes)} for an assessment"""
+
+
+class Storage(ABC):
+    """One unit of work: the four repositories over a single connection
+
+    Close it when done, as with a connection.
+    """
+
+    users = None
+    projects = None
+    assessments = None
+    scores = None
+
+    @abstractmethod
+    def transaction(self):
+        """Context manager that commits everything inside it at once, or nothing"""
+
+    @abstractmethod
+    def close(self):
+        """Release the connection"""
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+# Raw sqlite3 engine
+
+def connect_sqlite(path, timeout=30):
+    """Open a connection tuned for the storage layer
+
+    A larger statement cache keeps every repository query prepared, and the
+    page cache and temp store settings only apply to this connection.
+    """
+    conn = db_types.connect(path, timeout=timeout, cached_statements=256)
+    conn.execute('PRAGMA cache_size = -8000')
+    conn.execute('PRAGMA temp_store = MEMORY')
+    return conn
+
+
+class _SqliteRepository:
+    def __init__(self, storage):
+        self.storage = storage
+        self.conn = storage.conn
+
+    def _write(self, sql, params=()):
+        cursor = self.conn.execute(sql, params)
+        self.storage._commit()
+        return cursor
+
+
+class SqliteUsers(_SqliteRepository, UserRepository):
+    def get(self, user_id):
+        return self.conn.execute('SELECT * FROM users WHERE id = ?', (user_id,)).fetchone()
+
+    def get_by_email(self, email):
+        return self.conn.execute('SELECT * FROM users WHERE email = ?', (email,)).fetchone()
+
+    def create(self, email, password_hash, name, organization=None):
+        return self._write('INSERT INTO users (email, password_hash, name, organization) VALUES (?, ?, ?, ?)',
+                           (email, password_hash, name, organization)).lastrowid
+
+    def set_password(self, user_id, password_hash):
+        return self._write('UPDATE users SET password_hash = ? WHERE id = ?',
+                           (password_hash, user_id)).rowcount > 0
+
+
+class SqliteProjects(_SqliteRepository, ProjectRepository):
+    def get(self, project_id, user_id):
+        return self.conn.execute('SELECT * FROM projects WHERE id = ? AND user_id = ? AND deleted_at IS NULL',
+                                 (project_id, user_id)).fetchone()
+
+    def list_for_user(self, user_id):
+        return self.conn.execute('SELECT * FROM projects WHERE user_id = ? AND deleted_at IS NULL ORDER BY id',
+                                 (user_id,)).fetchall()
+
+    def create(self, user_id, name, description=None, project_type=None, location=None, size_sqm=None):
+        return self._write('''
+            INSERT INTO projects (name, description, project_type, location, size_sqm, user_id)
+            VALUES (?, ?, ?, ?, ?, ?)
+        ''', (name, description, project_type, location, size_sqm, user_id)).lastrowid
+
+    def update(self, project_id, user_id, **fields):
+        unknown = set(fields) - set(PROJECT_FIELDS)
+        if unknown:
+            raise ValueError(f'Cannot update project field(s): {", ".join(sorted(unknown))}')
+        assignments = ''.join(f'{name} = ?, ' for name in fields)
+        return self._write(f'''
+            UPDATE projects SET {assignments}updated_at = CURRENT_TIMESTAMP
+            WHERE id = ? AND user_id = ? AND deleted_at IS NULL
+        ''', (*fields.values(), project_id, user_id)).rowcount > 0
+
+    def soft_delete(self, project_id, user_id):
+        return self._write('UPDATE projects SET deleted_at = ? WHERE id = ? AND user_id = ? AND deleted_at IS NULL',
+                           (db_types.utcnow(), project_id, user_id)).rowcount > 0
+
+
+class SqliteAssessments(_SqliteRepository, AssessmentRepository):
+    def get(self, assessment_id):
+        return self.conn.execute('SELECT * FROM assessments WHERE id = ?', (assessment_id,)).fetchone()
+
+    def list_for_project(self, project_id):
+        return self.conn.execute('SELECT * FROM assessments WHERE project_id = ? ORDER BY created_at DESC, id DESC',
+                                 (project_id,)).fetchall()
+
+    def create(self, project_id):
+        return self._write("INSERT INTO assessments (project_id, status) VALUES (?, 'draft')",
+                           (project_id,)).lastrowid
+
+    def complete(self, assessment_id, overall_score):
+        now = db_types.utcnow()
+        return self._write('''
+            UPDATE assessments SET status = 'completed', completed_at = ?, overall_score = ?, updated_at = ?
+            WHERE id = ?
+        ''', (now, overall_score, now, assessment_id)).rowcount > 0
+
+    def latest_completed(self, project_id):
+        return self.conn.execute('''
+            SELECT * FROM assessments WHERE project_id = ? AND status = 'completed'
+            ORDER BY completed_at DESC, id DESC LIMIT 1
+        ''', (project_id,)).fetchone()
+
+
+class SqliteScores(_SqliteRepository, ScoreRepository):
+    def for_assessment(self, assessment_id):
+        rows = self.conn.execute('SELECT * FROM sdg_scores WHERE assessment_id = ?', (assessment_id,)).fetchall()
+        return {row['sdg_id']: row for row in rows}
+
+    def save(self, assessment_id, sdg_id, score, notes=None):
+        self.save_many(assessment_id, {sdg_id: (score, notes)})
+
+    def save_many(self, assessment_id, scores):
+        # sdg_scores has no unique key to upsert on, so look up which rows
+        # exist once and then batch the UPDATEs and INSERTs
+        existing = {row[0] for row in self.conn.execute(
+            'SELECT sdg_id FROM sdg_scores WHERE assessment_id = ?', (assessment_id,))}
+        updates = [(score, notes, assessment_id, sdg_id)
+                   for sdg_id, (score, notes) in scores.items() if sdg_id in existing]
+        inserts = [(assessment_id, sdg_id, score, notes)
+                   for sdg_id, (score, notes) in scores.items() if sdg_id not in existing]
+        if updates:
+            self.conn.executemany('UPDATE sdg_scores SET score = ?, notes = ? WHERE assessment_id = ? AND sdg_id = ?',
+                                  updates)
+        if inserts:
+            self.conn.executemany('INSERT INTO sdg_scores (assessment_id, sdg_id, score, notes) VALUES (?, ?, ?, ?)',
+                                  inserts)
+        self.storage._commit()
+
+
+class SqliteStorage(Storage):
+    """Storage over a sqlite3 connection, e.g. one from get_db_connection()"""
+
+    def __init__(self, conn):
+        self.conn = conn
+        self._depth = 0
+        self.users = SqliteUsers(self)
+        self.projects = SqliteProjects(self)
+        self.assessments = SqliteAssessments(self)
+        self.scores = SqliteScores(self)
+
+    @classmethod
+    def open(cls, path):
+        return cls(connect_sqlite(path))
+
+    def _commit(self):
+        if not self._depth:
+            self.conn.commit()
+
+    @contextmanager
+    def transaction(self):
+        if self._depth == 0 and self.conn.in_transaction:
+            self.conn.commit()
+        self._depth += 1
+        try:
+            yield self
+        except BaseException:
+            self._depth -= 1
+            if not self._depth:
+                self.conn.rollback()
+            raise
+        self._depth -= 1
+        if not self._depth:
+            self.conn.commit()
+
+    def close(self):
+        self.conn.close()
+
+
+def open_storage(engine, database):
+    """Open a Storage on the named engine for a database path"""
+    if engine == 'sqlite':
+        return SqliteStorage.open(database)
+    if engine == 'sqlalchemy':
+        from storage_sqlalchemy import SqlAlchemyStorage, get_engine
+        return SqlAlchemyStorage(get_engine(database))
+    raise ValueError(f'Unknown storage engine: {engine}')
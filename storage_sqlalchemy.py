@@ -0,0 +1,257 @@
+"""
+SQLAlchemy Core engine for the storage layer (STORAGE_ENGINE=sqlalchemy).
+
+Each database gets one pooled Engine per process: connections are checked
+out for a unit of work and returned to the pool on close() instead of being
+reopened on every request. Tables are reflected from the live schema once
+per engine, and their column types are replaced so values come back exactly
+as the raw sqlite engine returns them (timestamps decoded by db_types).
+
+Shard files reach the users table through the directory database, which is
+attached to every pooled connection as it is opened.
+"""
+import os
+import threading
+from contextlib import contextmanager
+
+from sqlalchemy import MetaData, and_, bindparam, create_engine, event, func, insert, select, update
+from sqlalchemy.types import Date, DateTime, Integer, NullType, String, TypeDecorator
+
+import db_types
+
+from storage import (AssessmentRepository, PROJECT_FIELDS, ProjectRepository, ScoreRepository, Storage,
+                     UserRepository)
+
+POOL_SIZE = 5
+MAX_OVERFLOW = 10
+
+TABLES = ('projects', 'assessments', 'sdg_scores')
+
+_engines = {}
+_engines_lock = threading.Lock()
+
+
+class _Timestamp(TypeDecorator):
+    """TIMESTAMP decoded like db_types; datetimes are bound through its sqlite3 adapter"""
+    impl = String
+    cache_ok = True
+
+    def process_result_value(self, value, dialect):
+        return db_types.parse_timestamp(value) if isinstance(value, str) else value
+
+
+class _Date(TypeDecorator):
+    impl = String
+    cache_ok = True
+
+    def process_result_value(self, value, dialect):
+        return db_types.parse_date(value) if isinstance(value, str) else value
+
+
+def _column_types(inspector, table, column_info):
+    # Integer keeps primary keys autoincrementing, and timestamps decode the
+    # same way as db_types; SQLAlchemy's own types would store datetimes in a
+    # different format and turn NUMERIC into Decimal, so the rest are untyped
+    reflected = column_info['type']
+    if isinstance(reflected, DateTime):
+        column_info['type'] = _Timestamp()
+    elif isinstance(reflected, Date):
+        column_info['type'] = _Date()
+    elif not isinstance(reflected, Integer):
+        column_info['type'] = NullType()
+
+
+def get_engine(database, directory=None, pool_size=POOL_SIZE, max_overflow=MAX_OVERFLOW):
+    """The process-wide pooled Engine for a database path, created on first use"""
+    key = (os.path.abspath(database), directory)
+    with _engines_lock:
+        engine = _engines.get(key)
+        if engine is None:
+            engine = _engines[key] = _create_engine(database, directory, pool_size, max_overflow)
+        return engine
+
+
+def dispose_engines():
+    """Drop pooled connections inherited from a parent process without closing them under it"""
+    with _engines_lock:
+        for engine in _engines.values():
+            engine.dispose(close=False)
+
+
+def _create_engine(database, directory, pool_size, max_overflow):
+    engine = create_engine(
+        f'sqlite:///{os.path.abspath(database)}',
+        pool_size=pool_size,
+        max_overflow=max_overflow,
+        connect_args={'timeout': 30, 'check_same_thread': False},
+    )
+
+    @event.listens_for(engine, 'connect')
+    def configure(dbapi_conn, record):
+        dbapi_conn.execute('PRAGMA cache_size = -8000')
+        dbapi_conn.execute('PRAGMA temp_store = MEMORY')
+        if directory:
+            dbapi_conn.execute('ATTACH DATABASE ? AS directory', (directory,))
+
+    metadata = MetaData()
+    event.listen(metadata, 'column_reflect', _column_types)
+    metadata.reflect(engine, only=TABLES)
+    users_metadata = MetaData(schema='directory' if directory else None)
+    event.listen(users_metadata, 'column_reflect', _column_types)
+    users_metadata.reflect(engine, only=('users',))
+
+    engine.storage_tables = dict(metadata.tables)
+    engine.storage_tables['users'] = next(iter(users_metadata.tables.values()))
+    return engine
+
+
+class _SqlAlchemyRepository:
+    def __init__(self, storage, table):
+        self.storage = storage
+        self.table = storage.tables[table]
+
+    def _one(self, statement):
+        return self.storage.conn.execute(statement).mappings().first()
+
+    def _all(self, statement):
+        return self.storage.conn.execute(statement).mappings().all()
+
+    def _write(self, statement):
+        result = self.storage.conn.execute(statement)
+        self.storage._commit()
+        return result
+
+
+class SqlAlchemyUsers(_SqlAlchemyRepository, UserRepository):
+    def get(self, user_id):
+        return self._one(select(self.table).where(self.table.c.id == user_id))
+
+    def get_by_email(self, email):
+        return self._one(select(self.table).where(self.table.c.email == email))
+
+    def create(self, email, password_hash, name, organization=None):
+        return self._write(insert(self.table).values(
+            email=email, password_hash=password_hash, name=name, organization=organization
+        )).inserted_primary_key[0]
+
+    def set_password(self, user_id, password_hash):
+        return self._write(update(self.table).where(self.table.c.id == user_id)
+                           .values(password_hash=password_hash)).rowcount > 0
+
+
+class SqlAlchemyProjects(_SqlAlchemyRepository, ProjectRepository):
+    def _live(self, project_id, user_id):
+        c = self.table.c
+        return and_(c.id == project_id, c.user_id == user_id, c.deleted_at.is_(None))
+
+    def get(self, project_id, user_id):
+        return self._one(select(self.table).where(self._live(project_id, user_id)))
+
+    def list_for_user(self, user_id):
+        c = self.table.c
+        return self._all(select(self.table).where(c.user_id == user_id, c.deleted_at.is_(None)).order_by(c.id))
+
+    def create(self, user_id, name, description=None, project_type=None, location=None, size_sqm=None):
+        return self._write(insert(self.table).values(
+            name=name, description=description, project_type=project_type,
+            location=location, size_sqm=size_sqm, user_id=user_id
+        )).inserted_primary_key[0]
+
+    def update(self, project_id, user_id, **fields):
+        unknown = set(fields) - set(PROJECT_FIELDS)
+        if unknown:
+            raise ValueError(f'Cannot update project field(s): {", ".join(sorted(unknown))}')
+        return self._write(update(self.table).where(self._live(project_id, user_id))
+                           .values(**fields, updated_at=func.current_timestamp())).rowcount > 0
+
+    def soft_delete(self, project_id, user_id):
+        return self._write(update(self.table).where(self._live(project_id, user_id))
+                           .values(deleted_at=db_types.utcnow())).rowcount > 0
+
+
+class SqlAlchemyAssessments(_SqlAlchemyRepository, AssessmentRepository):
+    def get(self, assessment_id):
+        return self._one(select(self.table).where(self.table.c.id == assessment_id))
+
+    def list_for_project(self, project_id):
+        c = self.table.c
+        return self._all(select(self.table).where(c.project_id == project_id)
+                         .order_by(c.created_at.desc(), c.id.desc()))
+
+    def create(self, project_id):
+        return self._write(insert(self.table).values(project_id=project_id, status='draft')).inserted_primary_key[0]
+
+    def complete(self, assessment_id, overall_score):
+        now = db_types.utcnow()
+        return self._write(update(self.table).where(self.table.c.id == assessment_id).values(
+            status='completed', completed_at=now, overall_score=overall_score, updated_at=now
+        )).rowcount > 0
+
+    def latest_completed(self, project_id):
+        c = self.table.c
+        return self._one(select(self.table).where(c.project_id == project_id, c.status == 'completed')
+                         .order_by(c.completed_at.desc(), c.id.desc()).limit(1))
+
+
+class SqlAlchemyScores(_SqlAlchemyRepository, ScoreRepository):
+    def for_assessment(self, assessment_id):
+        rows = self._all(select(self.table).where(self.table.c.assessment_id == assessment_id))
+        return {row['sdg_id']: row for row in rows}
+
+    def save(self, assessment_id, sdg_id, score, notes=None):
+        self.save_many(assessment_id, {sdg_id: (score, notes)})
+
+    def save_many(self, assessment_id, scores):
+        c = self.table.c
+        conn = self.storage.conn
+        existing = set(conn.execute(select(c.sdg_id).where(c.assessment_id == assessment_id)).scalars())
+        updates = [{'b_sdg_id': sdg_id, 'score': score, 'notes': notes}
+                   for sdg_id, (score, notes) in scores.items() if sdg_id in existing]
+        inserts = [{'assessment_id': assessment_id, 'sdg_id': sdg_id, 'score': score, 'notes': notes}
+                   for sdg_id, (score, notes) in scores.items() if sdg_id not in existing]
+        if updates:
+            conn.execute(update(self.table)
+                         .where(c.assessment_id == assessment_id, c.sdg_id == bindparam('b_sdg_id')),
+                         updates)
+        if inserts:
+            conn.execute(insert(self.table), inserts)
+        self.storage._commit()
+
+
+class SqlAlchemyStorage(Storage):
+    """Storage over a connection checked out of a pooled Engine"""
+
+    def __init__(self, engine):
+        self.engine = engine
+        self.tables = engine.storage_tables
+        self.conn = engine.connect()
+        self._depth = 0
+        self.users = SqlAlchemyUsers(self, 'users')
+        self.projects = SqlAlchemyProjects(self, 'projects')
+        self.assessments = SqlAlchemyAssessments(self, 'assessments')
+        self.scores = SqlAlchemyScores(self, 'sdg_scores')
+
+    def _commit(self):
+        if not self._depth:
+            self.conn.commit()
+
+    @contextmanager
+    def transaction(self):
+        if self._depth == 0 and self.conn.in_transaction():
+            self.conn.commit()
+        self._depth += 1
+        try:
+            yield self
+        except BaseException:
+            self._depth -= 1
+            if not self._depth:
+                self.conn.rollback()
+            raise
+        self._depth -= 1
+        if not self._depth:
+            self.conn.commit()
+
+    def close(self):
+        # Returns the connection to the pool, rolling back anything uncommitted
+        self.conn.close()
+
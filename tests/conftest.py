@@ -0,0 +1,128 @@
+"""
+Shared fixtures: a scratch database with the app's schema and a local SMTP sink.
+"""
+import os
+import socketserver
+import sys
+import tempfile
+import threading
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Tests that import app_simple would otherwise create its shared cache and
+# template cache under ./instance in the checkout
+_app_files = tempfile.mkdtemp(prefix='sdg-tests-')
+os.environ.setdefault('SHARED_CACHE_PATH', os.path.join(_app_files, 'shared_cache.db'))
+os.environ.setdefault('TEMPLATE_CACHE_DIR', os.path.join(_app_files, 'jinja_cache'))
+
+import db_types
+from init_db import make_scratch_db
+
+
+class SmtpSink:
+    """SMTP server on localhost that records every message it accepts
+
+    Recipients in reject get a 550 at RCPT TO, as a server refusing an
+    address does. connections counts the SMTP sessions opened.
+    """
+
+    def __init__(self, reject=()):
+        self.reject = set(reject)
+        self.messages = []
+        self.connections = 0
+        sink = self
+
+        class Handler(socketserver.StreamRequestHandler):
+            def handle(self):
+                sink.connections += 1
+                self.reply('220 sink ready')
+                sender, recipients = None, []
+                for line in self.rfile:
+                    command = line.decode('latin-1').rstrip('\r\n')
+                    verb = command[:4].upper()
+                    if verb == 'EHLO':
+                        self.reply('250-sink\r\n250 8BITMIME')
+                    elif verb == 'HELO':
+                        self.reply('250 sink')
+                    elif verb == 'MAIL':
+                        sender, recipients = _address(command), []
+                        self.reply('250 OK')
+                    elif verb == 'RCPT':
+                        address = _address(command)
+                        if address in sink.reject:
+                            self.reply('550 No such user')
+                        else:
+                            recipients.append(address)
+                            self.reply('250 OK')
+                    elif verb == 'DATA':
+                        self.reply('354 End data with <CR><LF>.<CR><LF>')
+                        data = []
+                        for data_line in self.rfile:
+                            if data_line.rstrip(b'\r\n') == b'.':
+                                break
+                            data.append(data_line[1:] if data_line.startswith(b'..') else data_line)
+                        sink.messages.append((sender, recipients, b''.join(data).decode('utf-8', 'replace')))
+                        self.reply('250 OK')
+                    elif verb in ('RSET', 'NOOP'):
+                        if verb == 'RSET':
+                            sender, recipients = None, []
+                        self.reply('250 OK')
+                    elif verb == 'QUIT':
+                        self.reply('221 Bye')
+                        return
+                    else:
+                        self.reply('502 Command not implemented')
+
+            def reply(self, text):
+                self.wfile.write(text.encode('latin-1') + b'\r\n')
+
+        self._server = socketserver.ThreadingTCPServer(('127.0.0.1', 0), Handler)
+        self._server.daemon_threads = True
+        self.port = self._server.server_address[1]
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+
+    def recipients(self):
+        return [address for _, recipients, _ in self.messages for address in recipients]
+
+    def close(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+
+def _address(command):
+    return command[command.index('<') + 1:command.rindex('>')]
+
+
+@pytest.fixture
+def database(tmp_path):
+    """Path of a fresh database built by init_db"""
+    return make_scratch_db(str(tmp_path))
+
+
+@pytest.fixture
+def conn(database):
+    conn = db_types.connect(database)
+    yield conn
+    conn.close()
+
+
+@pytest.fixture
+def smtp_sink():
+    sink = SmtpSink()
+    yield sink
+    sink.close()
+
+
+@pytest.fixture
+def mailer(smtp_sink):
+    """(app, mail) sending through smtp_sink, as mail_outbox expects them"""
+    from flask import Flask
+    from flask_mail import Mail
+
+    app = Flask(__name__)
+    app.config.update(MAIL_SERVER='127.0.0.1', MAIL_PORT=smtp_sink.port, MAIL_USE_TLS=False,
+                      MAIL_USE_SSL=False, MAIL_DEFAULT_SENDER='noreply@sdgassessment.org')
+    return app, Mail(app)
@@ -0,0 +1,67 @@
+"""
+Action reminders: due actions become one digest per user, sent over the outbox.
+"""
+from datetime import date, timedelta
+from functools import partial
+
+import action_plans
+import db_types
+import mail_outbox
+
+
+def add_user(conn, email, name):
+    return conn.execute('INSERT INTO users (email, password_hash, name) VALUES (?, ?, ?)',
+                        (email, 'x', name)).lastrowid
+
+
+def add_action(conn, user_id, description, target_date, status='planned', deleted=False):
+    project_id = conn.execute('INSERT INTO projects (name, user_id, deleted_at) VALUES (?, ?, ?)',
+                              (f'Project {description}', user_id,
+                               '2024-01-01 00:00:00' if deleted else None)).lastrowid
+    assessment_id = conn.execute("INSERT INTO assessments (project_id, status) VALUES (?, 'draft')",
+                                 (project_id,)).lastrowid
+    return action_plans.create_action(conn, assessment_id, 1, description, target_date.isoformat(), status)
+
+
+def test_one_digest_per_user(conn, database, mailer, smtp_sink):
+    today = date.today()
+    ana = add_user(conn, 'ana@example.org', 'Ana')
+    ben = add_user(conn, 'ben@example.org', 'Ben')
+    cleo = add_user(conn, 'cleo@example.org', 'Cleo')
+    add_action(conn, ana, 'Rainwater tanks', today + timedelta(days=1))
+    add_action(conn, ana, 'Solar survey', today - timedelta(days=2), status='in_progress')
+    add_action(conn, ben, 'Bike parking', today + timedelta(days=action_plans.REMINDER_LEAD_DAYS))
+    # Not due yet, already done, or on a deleted project
+    add_action(conn, cleo, 'Green roof', today + timedelta(days=30))
+    add_action(conn, cleo, 'Audit', today, status='completed')
+    add_action(conn, cleo, 'Old plan', today, deleted=True)
+
+    scheduler = action_plans.ReminderScheduler(partial(db_types.connect, database))
+    assert scheduler.tick() == 2
+    # reminded_on keeps the next tick on the same day from queueing them again
+    assert scheduler.tick() == 0
+
+    app, mail = mailer
+    assert mail_outbox.drain(app, mail, conn) == (2, 0)
+    assert smtp_sink.connections == 1
+    assert sorted(smtp_sink.recipients()) == ['ana@example.org', 'ben@example.org']
+
+    bodies = {recipients[0]: body for _, recipients, body in smtp_sink.messages}
+    assert 'Rainwater tanks' in bodies['ana@example.org'] and 'Solar survey' in bodies['ana@example.org']
+    assert 'overdue since' in bodies['ana@example.org']
+    assert 'Bike parking' in bodies['ben@example.org'] and 'Rainwater tanks' not in bodies['ben@example.org']
+    assert 'SDG action reminders (2)' in bodies['ana@example.org']
+
+
+def test_build_digests_groups_by_user(conn):
+    today = date.today()
+    ana = add_user(conn, 'ana@example.org', 'Ana')
+    ben = add_user(conn, 'ben@example.org', 'Ben')
+    for description in ('One', 'Two', 'Three'):
+        add_action(conn, ana, description, today)
+    add_action(conn, ben, 'Four', today)
+
+    digests = action_plans.build_digests(conn, action_plans.due_for_reminder(conn, today))
+    assert sorted((user['email'], len(actions)) for user, actions in digests) == [
+        ('ana@example.org', 3), ('ben@example.org', 1)]
+    assert action_plans.build_digests(conn, []) == []
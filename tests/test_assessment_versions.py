@@ -0,0 +1,99 @@
+"""
+Concurrent edits of an assessment: row_version checks, autosave against full
+saves, field-level merges and autosave retries.
+"""
+import contextlib
+import io
+import sqlite3
+from functools import partial
+
+import pytest
+
+import autosave
+import db_types
+from assessment_versions import VersionConflict, begin_write, contention_stats, field_merge
+from autosave import AutosaveBuffer
+
+
+@pytest.fixture
+def database(database):
+    """The app's full schema: init_db plus the columns add_missing_columns adds"""
+    import app_simple
+    with contextlib.redirect_stdout(io.StringIO()):
+        app_simple.add_missing_columns(partial(db_types.connect, database))
+    return database
+
+
+@pytest.fixture
+def assessment_id(conn):
+    user_id = conn.execute("INSERT INTO users (email, password_hash, name) VALUES ('ana@example.org', 'x', 'Ana')").lastrowid
+    project_id = conn.execute('INSERT INTO projects (name, user_id) VALUES (?, ?)', ('School', user_id)).lastrowid
+    assessment_id = conn.execute("INSERT INTO assessments (project_id, status) VALUES (?, 'draft')",
+                                 (project_id,)).lastrowid
+    conn.execute("INSERT INTO sdg_scores (assessment_id, sdg_id, score, notes) VALUES (?, 1, 4, 'Rainwater')",
+                 (assessment_id,))
+    conn.commit()
+    return assessment_id
+
+
+@pytest.fixture
+def buffer(database):
+    # Long windows keep the background flusher out of the way; the tests flush themselves
+    return AutosaveBuffer(partial(db_types.connect, database), window=3600, max_delay=3600)
+
+
+def full_save(conn, assessment_id, version, score):
+    begin_write(conn, assessment_id, version)
+    conn.execute('UPDATE sdg_scores SET score = ? WHERE assessment_id = ? AND sdg_id = 1', (score, assessment_id))
+    conn.commit()
+
+
+def stored_score(conn, assessment_id):
+    return conn.execute('SELECT score FROM sdg_scores WHERE assessment_id = ? AND sdg_id = 1',
+                        (assessment_id,)).fetchone()[0]
+
+
+def test_stale_row_version_is_rejected(conn, assessment_id):
+    full_save(conn, assessment_id, 1, 5)
+    with pytest.raises(VersionConflict) as conflict:
+        full_save(conn, assessment_id, 1, 2)
+    assert (conflict.value.expected, conflict.value.current) == (1, 2)
+    assert not conn.in_transaction
+    assert stored_score(conn, assessment_id) == 5
+
+
+def test_autosave_older_than_a_full_save_is_discarded(conn, assessment_id, buffer):
+    buffer.add(assessment_id, {1: {'score': 2}}, row_version=1)
+    full_save(conn, assessment_id, 1, 5)
+    buffer.flush(assessment_id)
+    assert buffer.discarded == 1
+    assert stored_score(conn, assessment_id) == 5
+
+    # Autosaves from the page rendered after the save still go through
+    buffer.add(assessment_id, {1: {'score': 3}}, row_version=2)
+    buffer.flush(assessment_id)
+    assert stored_score(conn, assessment_id) == 3
+
+
+def test_field_merge_reports_only_changed_fields(conn, assessment_id):
+    full_save(conn, assessment_id, 1, 5)
+    form = {'score_1': '4', 'notes_1': 'Rainwater', 'score_2': '', 'csrf_token': 'x'}
+    conflicts, unchanged = field_merge(conn, assessment_id, form)
+    assert conflicts == [{'name': 'score_1', 'field': 'score', 'sdg_id': 1, 'yours': '4', 'theirs': '5'}]
+    assert unchanged == {'notes_1': 'Rainwater', 'score_2': ''}
+
+
+def test_failing_autosave_is_dropped_after_max_retries(conn, assessment_id, buffer, monkeypatch):
+    def locked(*args):
+        raise sqlite3.OperationalError('database is locked')
+    monkeypatch.setattr(autosave, 'write_changes', locked)
+    dropped = contention_stats.dropped
+
+    buffer.add(assessment_id, {1: {'score': 2}}, row_version=1)
+    for _ in range(autosave.MAX_RETRIES):
+        buffer.flush(assessment_id)
+        assert assessment_id in buffer._pending
+    buffer.flush(assessment_id)
+    assert assessment_id not in buffer._pending
+    assert contention_stats.dropped == dropped + 1
+    assert stored_score(conn, assessment_id) == 4
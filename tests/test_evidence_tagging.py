@@ -0,0 +1,46 @@
+"""
+SDG tagging of evidence text: phrase matching and hit counts.
+"""
+from evidence_tagging import Automaton, get_automaton, scan_file
+
+
+def scan(text, vocabulary=None, chunk=None):
+    automaton = Automaton(vocabulary) if vocabulary is not None else get_automaton()
+    scanner = automaton.scanner()
+    chunk = chunk or len(text) or 1
+    for i in range(0, len(text), chunk):
+        scanner.feed(text[i:i + chunk])
+    return scanner.finish()
+
+
+def test_whole_words_only():
+    vocabulary = {'solar': {7}, 'water': {6}}
+    assert scan('Solar-powered WATER pumps; solaris waterproof', vocabulary) == {7: (1, [0]), 6: (1, [14])}
+
+
+def test_longest_match_wins_and_counts_once():
+    # "climate action" names SDG 13; "climate" alone also names SDG 1
+    tags = scan('We take Climate Action now.')
+    assert tags == {13: (1, [8])}
+    assert scan('A climate plan.') == {1: (1, [2]), 13: (1, [2])}
+
+
+def test_overlapping_phrases_do_not_double_count():
+    vocabulary = {'clean energy': {7}, 'energy': {7}, 'energy efficiency': {7, 9}, 'efficiency': {9}}
+    # Leftmost-longest: "clean energy", then "efficiency" on its own
+    assert scan('clean energy efficiency', vocabulary) == {7: (1, [0]), 9: (1, [13])}
+    assert scan('energy efficiency', vocabulary) == {7: (1, [0]), 9: (1, [0])}
+
+
+def test_chunk_boundaries_do_not_matter():
+    text = 'Our plan for climate action covers energy efficiency and clean water. ' * 20
+    whole = scan(text)
+    assert whole
+    assert scan(text, chunk=1) == whole
+    assert scan(text, chunk=7) == whole
+
+
+def test_scan_file(tmp_path):
+    path = tmp_path / 'report.txt'
+    path.write_text('Climate action plan\n', encoding='utf-8')
+    assert scan_file(str(path), 'text/plain') == {13: (1, [0])}
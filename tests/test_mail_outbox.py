@@ -0,0 +1,109 @@
+"""
+Mail outbox: claims, retries with backoff, and batches over one SMTP connection.
+"""
+from datetime import timedelta
+
+import db_types
+import mail_outbox
+
+
+def outbox(conn, message_id):
+    return conn.execute('SELECT * FROM mail_outbox WHERE id = ?', (message_id,)).fetchone()
+
+
+def make_due(conn):
+    """Move every pending retry into the past, as if the backoff had elapsed"""
+    conn.execute("UPDATE mail_outbox SET next_attempt_at = '2000-01-01 00:00:00' WHERE status = 'pending'")
+    conn.commit()
+
+
+def test_batch_reuses_one_connection(conn, mailer, smtp_sink):
+    for i in range(5):
+        mail_outbox.enqueue(conn, f'user{i}@example.org', f'Subject {i}', 'Body')
+    app, mail = mailer
+
+    assert mail_outbox.send_batch(app, mail, conn) == (5, 0)
+    assert smtp_sink.connections == 1
+    assert sorted(smtp_sink.recipients()) == [f'user{i}@example.org' for i in range(5)]
+    assert mail_outbox.send_batch(app, mail, conn) == (0, 0)
+    assert smtp_sink.connections == 1
+
+
+def test_refused_recipient_is_retried_with_backoff(conn, mailer, smtp_sink):
+    smtp_sink.reject.add('bounce@example.org')
+    good = mail_outbox.enqueue(conn, 'ana@example.org', 'Hello', 'Body')
+    bad = mail_outbox.enqueue(conn, 'bounce@example.org', 'Hello', 'Body')
+    after = mail_outbox.enqueue(conn, 'ben@example.org', 'Hello', 'Body')
+    app, mail = mailer
+
+    started = db_types.utcnow()
+    assert mail_outbox.send_batch(app, mail, conn) == (2, 1)
+    # The refusal did not cost the rest of the batch its connection
+    assert smtp_sink.connections == 1
+    assert outbox(conn, good)['status'] == outbox(conn, after)['status'] == 'sent'
+
+    row = outbox(conn, bad)
+    assert row['status'] == 'pending' and row['attempts'] == 1 and row['claim_token'] is None
+    assert 'bounce@example.org' in row['last_error']
+    retry_in = (row['next_attempt_at'] - started).total_seconds()
+    assert mail_outbox.RETRY_BASE_SECONDS - 2 <= retry_in <= mail_outbox.RETRY_BASE_SECONDS + 2
+
+    # Not due until the backoff has passed
+    assert mail_outbox.send_batch(app, mail, conn) == (0, 0)
+
+    smtp_sink.reject.clear()
+    make_due(conn)
+    assert mail_outbox.drain(app, mail, conn) == (1, 0)
+    assert outbox(conn, bad)['status'] == 'sent'
+    assert smtp_sink.recipients().count('bounce@example.org') == 1
+
+
+def test_backoff_doubles_until_failed(conn, mailer, smtp_sink):
+    smtp_sink.reject.add('bounce@example.org')
+    message_id = mail_outbox.enqueue(conn, 'bounce@example.org', 'Hello', 'Body')
+    app, mail = mailer
+
+    delays = []
+    for attempt in range(1, mail_outbox.MAX_ATTEMPTS + 1):
+        started = db_types.utcnow()
+        assert mail_outbox.send_batch(app, mail, conn) == (0, 1)
+        row = outbox(conn, message_id)
+        assert row['attempts'] == attempt
+        delays.append(round((row['next_attempt_at'] - started).total_seconds() / mail_outbox.RETRY_BASE_SECONDS))
+        make_due(conn)
+
+    assert delays == [2 ** n for n in range(mail_outbox.MAX_ATTEMPTS)]
+    assert outbox(conn, message_id)['status'] == 'failed'
+    # Given up: never claimed again
+    assert mail_outbox.send_batch(app, mail, conn) == (0, 0)
+
+
+def test_claims_are_exclusive_until_stale(conn, database):
+    for i in range(3):
+        mail_outbox.enqueue(conn, f'user{i}@example.org', 'Hello', 'Body')
+    other = db_types.connect(database)
+    try:
+        now = db_types.utcnow()
+        first = mail_outbox.claim_batch(conn, limit=2, now=now)
+        second = mail_outbox.claim_batch(other, now=now)
+        assert len(first) == 2 and len(second) == 1
+        assert not {row['id'] for row in first} & {row['id'] for row in second}
+        assert mail_outbox.claim_batch(conn, now=now) == []
+
+        # A sender that crashed mid-batch gives its claims up after CLAIM_TIMEOUT_SECONDS
+        later = now + timedelta(seconds=mail_outbox.CLAIM_TIMEOUT_SECONDS + 1)
+        reclaimed = mail_outbox.claim_batch(other, now=later)
+        assert sorted(row['id'] for row in reclaimed) == sorted(row['id'] for row in first + second)
+    finally:
+        other.close()
+
+
+def test_connection_failure_requeues_the_batch(conn, mailer, smtp_sink):
+    for i in range(3):
+        mail_outbox.enqueue(conn, f'user{i}@example.org', 'Hello', 'Body')
+    app, mail = mailer
+    smtp_sink.close()
+
+    assert mail_outbox.send_batch(app, mail, conn) == (0, 3)
+    rows = conn.execute('SELECT status, attempts, claim_token FROM mail_outbox').fetchall()
+    assert [tuple(row) for row in rows] == [('pending', 1, None)] * 3
@@ -0,0 +1,16 @@
+"""
+The query-plan checks of check_query_plans.py, at its default scales.
+"""
+import check_query_plans
+
+
+def test_query_plans(tmp_path, monkeypatch):
+    for setting, value in check_query_plans.QUIET.items():
+        monkeypatch.setenv(setting, value)
+    # The app keeps its caches under relative paths; keep them out of the checkout
+    monkeypatch.chdir(tmp_path)
+    statements = check_query_plans.check(str(tmp_path))
+    problems = {statement.name: check_query_plans.failures(statement, check_query_plans.SCALES)
+                for statement in statements}
+    assert {name: found for name, found in problems.items() if found} == {}
+    assert len(statements) > 100
@@ -0,0 +1,59 @@
+"""
+Score audit trail: a purged assessment's history never reaches a new one.
+"""
+import sqlite3
+
+import db_types
+import project_purge
+import score_audit
+
+
+def add_assessment(conn, project_id):
+    return conn.execute("INSERT INTO assessments (project_id, status) VALUES (?, 'draft')",
+                        (project_id,)).lastrowid
+
+
+def audit(conn, assessment_id, user_id):
+    conn.execute(score_audit.INSERT, (assessment_id, 1, 'score', 2, 4, user_id, 'test', db_types.utcnow()))
+
+
+def test_purged_assessment_id_is_not_reused(conn, tmp_path):
+    user_id = conn.execute("INSERT INTO users (email, password_hash, name) VALUES ('ana@example.org', 'x', 'Ana')").lastrowid
+    project_id = conn.execute('INSERT INTO projects (name, user_id) VALUES (?, ?)', ('School', user_id)).lastrowid
+    old = add_assessment(conn, project_id)
+    audit(conn, old, user_id)
+    conn.commit()
+    assert len(score_audit.history(conn, old)) == 1
+
+    project_purge.soft_delete(conn, project_id, user_id)
+    project_purge.purge_project(conn, project_id, str(tmp_path / 'uploads'), pause=0)
+    project_id = conn.execute('INSERT INTO projects (name, user_id) VALUES (?, ?)', ('School', user_id)).lastrowid
+    new = add_assessment(conn, project_id)
+    conn.commit()
+
+    assert new != old
+    assert score_audit.history(conn, new) == []
+    # The old history is kept, under its own id
+    assert len(score_audit.history(conn, old)) == 1
+
+
+def test_older_assessments_table_is_rebuilt(tmp_path):
+    conn = sqlite3.connect(tmp_path / 'old.db')
+    conn.execute('CREATE TABLE assessments (id INTEGER PRIMARY KEY, project_id INTEGER NOT NULL, status TEXT)')
+    conn.execute('CREATE INDEX idx_assessments_project_id ON assessments (project_id)')
+    conn.execute("CREATE TRIGGER trg_no_archived BEFORE INSERT ON assessments WHEN NEW.status = 'archived' "
+                 "BEGIN SELECT RAISE(ABORT, 'archived'); END")
+    score_audit.ensure_table(conn)
+    conn.executemany('INSERT INTO assessments (id, project_id, status) VALUES (?, 1, ?)', [(1, 'draft'), (2, 'draft')])
+    audit(conn, 2, None)
+    audit(conn, 3, None)  # an assessment purged earlier
+    conn.execute('DELETE FROM assessments WHERE id = 2')
+    conn.commit()
+
+    assert score_audit.autoincrement_assessments(conn)
+    assert not score_audit.autoincrement_assessments(conn)
+    assert conn.execute('SELECT id, project_id, status FROM assessments').fetchall() == [(1, 1, 'draft')]
+    assert conn.execute("INSERT INTO assessments (project_id, status) VALUES (1, 'draft')").lastrowid == 4
+    names = {row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE tbl_name = 'assessments'")}
+    assert {'idx_assessments_project_id', 'trg_no_archived'} <= names
+    conn.close()
@@ -0,0 +1,123 @@
+"""
+Similar-project index: queries, and changes reaching every worker's copy.
+
+Two SimilarProjectIndex instances on the same snapshot files stand in for
+two gunicorn workers.
+"""
+import pytest
+
+import similar_projects
+from similar_projects import SimilarProjectIndex
+
+
+def add_project(conn, scores, project_type='Office', location='Lisbon'):
+    """A project with one finalized assessment scoring {sdg_id: score}; returns its id"""
+    user_id = conn.execute("SELECT id FROM users LIMIT 1").fetchone()[0]
+    project_id = conn.execute('INSERT INTO projects (name, project_type, location, user_id) VALUES (?, ?, ?, ?)',
+                              ('P', project_type, location, user_id)).lastrowid
+    assessment_id = conn.execute("INSERT INTO assessments (project_id, status) VALUES (?, 'draft')",
+                                 (project_id,)).lastrowid
+    conn.executemany('INSERT INTO sdg_scores (assessment_id, sdg_id, score) VALUES (?, ?, ?)',
+                     [(assessment_id, sdg_id, score) for sdg_id, score in scores.items()])
+    conn.execute("UPDATE assessments SET status = 'completed', completed_at = CURRENT_TIMESTAMP WHERE id = ?",
+                 (assessment_id,))
+    conn.commit()
+    return project_id
+
+
+def set_score(conn, project_id, sdg_id, score):
+    conn.execute('UPDATE sdg_scores SET score = ? WHERE sdg_id = ? AND assessment_id = '
+                 '(SELECT id FROM assessments WHERE project_id = ?)', (score, sdg_id, project_id))
+    conn.commit()
+
+
+def ids(matches):
+    return [project_id for project_id, _ in matches]
+
+
+@pytest.fixture
+def prefix(tmp_path):
+    return str(tmp_path / 'vectors')
+
+
+@pytest.fixture
+def projects(conn):
+    return [add_project(conn, {1: 5, 2: 5}), add_project(conn, {1: 5, 2: 4}),
+            add_project(conn, {1: 1, 3: 5}, project_type='School')]
+
+
+def test_nearest_first(conn, prefix, projects):
+    index = SimilarProjectIndex(prefix)
+    index.ensure_current(conn)
+    assert ids(index.query(projects[0], k=2)) == [projects[1], projects[2]]
+    assert ids(index.query(projects[0], metric='euclidean', project_type='School')) == [projects[2]]
+    with pytest.raises(ValueError):
+        index.query(projects[0], metric='manhattan')
+
+
+def test_changes_made_elsewhere_reach_every_worker(conn, prefix, projects):
+    worker = SimilarProjectIndex(prefix)
+    worker.ensure_current(conn)
+
+    # Another worker edits a finalized score, re-files a project and deletes one
+    set_score(conn, projects[2], 2, 5)
+    set_score(conn, projects[2], 3, 0)
+    conn.execute("UPDATE projects SET project_type = 'School' WHERE id = ?", (projects[1],))
+    new = add_project(conn, {1: 5, 2: 5})
+    conn.execute("UPDATE projects SET deleted_at = CURRENT_TIMESTAMP WHERE id = ?", (new,))
+    conn.commit()
+
+    worker.refresh(conn)
+    assert ids(worker.query(projects[0], project_type='School', metric='euclidean')) == [projects[1], projects[2]]
+    assert new not in ids(worker.query(projects[0], k=10))
+
+
+def test_own_changes_survive_another_workers_snapshot(conn, prefix, projects, monkeypatch):
+    first, second = SimilarProjectIndex(prefix), SimilarProjectIndex(prefix)
+    first.ensure_current(conn)
+    second.ensure_current(conn)
+
+    conn.execute("UPDATE projects SET deleted_at = CURRENT_TIMESTAMP WHERE id = ?", (projects[1],))
+    conn.commit()
+    first.remove(projects[1])
+
+    # The second worker, which has not seen the delete, compacts its state into a new snapshot
+    monkeypatch.setattr(similar_projects, 'DELTA_LIMIT', 0)
+    second.upsert(projects[2], 'School', 'Lisbon', {1: 1, 3: 5})
+    monkeypatch.setattr(similar_projects, 'DELTA_LIMIT', 1000)
+
+    first.ensure_current(conn)
+    assert projects[1] not in ids(first.query(projects[0], k=10))
+    second.refresh(conn)
+    assert projects[1] not in ids(second.query(projects[0], k=10))
+
+
+def test_merged_arrays_are_reused_until_the_delta_changes(conn, prefix, projects):
+    index = SimilarProjectIndex(prefix)
+    index.ensure_current(conn)
+    index.upsert(projects[2], 'School', 'Lisbon', {1: 5, 2: 5})
+    merged = index._merged()
+    index.query(projects[0])
+    assert index._merged() is merged
+    index.remove(projects[1])
+    assert index._merged() is not merged
+
+
+def test_pruned_log_makes_a_lagging_worker_rebuild(conn, prefix, projects):
+    index = SimilarProjectIndex(prefix)
+    index.ensure_current(conn)
+    before = dict(index.query(projects[0], k=10))[projects[2]]
+    set_score(conn, projects[2], 1, 5)
+    set_score(conn, projects[2], 2, 5)
+    # The scheduled prune catches up with the log before this worker reads it
+    conn.execute("UPDATE project_vector_changes SET changed_at = datetime('now', '-2 days')")
+    assert similar_projects.prune_changes(conn)
+
+    index.refresh(conn)
+    assert dict(index.query(projects[0], k=10))[projects[2]] > before
+    assert not index._delta
+
+
+def test_snapshot_belongs_to_its_database(tmp_path):
+    assert similar_projects.snapshot_prefix(str(tmp_path / 'instance' / 'sdg_assessment.db')) == \
+        str(tmp_path / 'instance' / 'sdg_assessment.project_vectors')
@@ -0,0 +1,185 @@
+"""
+Contract tests for the storage engines.
+
+Every test runs against each engine in storage.ENGINES on a fresh scratch
+database, and test_engines_agree checks that both return identical rows for
+the same sequence of calls.
+"""
+from datetime import datetime
+from functools import partial
+
+import pytest
+
+from init_db import make_scratch_db
+from storage import ENGINES, Storage, UserRepository, open_storage
+
+
+@pytest.fixture(params=ENGINES)
+def engine(request):
+    if request.param == 'sqlalchemy':
+        pytest.importorskip('sqlalchemy')
+    return request.param
+
+
+@pytest.fixture
+def reopen(engine, database):
+    """Open another Storage on the same database"""
+    return partial(open_storage, engine, database)
+
+
+@pytest.fixture
+def storage(reopen):
+    storage = reopen()
+    yield storage
+    storage.close()
+
+
+def test_users(storage):
+    user_id = storage.users.create('ana@example.org', 'hash-1', 'Ana', 'Studio A')
+    user = storage.users.get(user_id)
+    assert user['email'] == 'ana@example.org' and user['organization'] == 'Studio A'
+    assert storage.users.get_by_email('ana@example.org')['id'] == user_id
+    assert storage.users.get_by_email('nobody@example.org') is None
+    assert storage.users.get(user_id + 1000) is None
+    assert storage.users.set_password(user_id, 'hash-2')
+    assert storage.users.get(user_id)['password_hash'] == 'hash-2'
+    assert not storage.users.set_password(user_id + 1000, 'hash-3')
+
+
+def test_projects(storage):
+    owner = storage.users.create('owner@example.org', 'x', 'Owner')
+    other = storage.users.create('other@example.org', 'x', 'Other')
+    first = storage.projects.create(owner, 'School', 'A school', 'Educational', 'Lisbon', 1200.5)
+    second = storage.projects.create(owner, 'Library')
+
+    project = storage.projects.get(first, owner)
+    assert project['name'] == 'School' and project['size_sqm'] == 1200.5
+    assert project['status'] == 'draft' and project['deleted_at'] is None
+    assert isinstance(project['created_at'], datetime)
+    assert storage.projects.get(first, other) is None
+    assert [p['id'] for p in storage.projects.list_for_user(owner)] == [first, second]
+    assert storage.projects.list_for_user(other) == []
+
+    assert storage.projects.update(first, owner, name='New school', status='active')
+    assert storage.projects.get(first, owner)['name'] == 'New school'
+    assert not storage.projects.update(first, other, name='Stolen')
+    with pytest.raises(ValueError):
+        storage.projects.update(first, owner, deleted_at=None)
+
+    assert storage.projects.soft_delete(second, owner)
+    assert not storage.projects.soft_delete(second, owner)
+    assert storage.projects.get(second, owner) is None
+    assert [p['id'] for p in storage.projects.list_for_user(owner)] == [first]
+    assert not storage.projects.update(second, owner, name='Deleted')
+
+
+def test_assessments(storage):
+    owner = storage.users.create('assessor@example.org', 'x', 'Assessor')
+    project_id = storage.projects.create(owner, 'Office')
+    first = storage.assessments.create(project_id)
+    second = storage.assessments.create(project_id)
+
+    assessment = storage.assessments.get(first)
+    assert assessment['project_id'] == project_id and assessment['status'] == 'draft'
+    assert storage.assessments.get(second + 1000) is None
+    assert [a['id'] for a in storage.assessments.list_for_project(project_id)] == [second, first]
+    assert storage.assessments.latest_completed(project_id) is None
+
+    assert storage.assessments.complete(first, 3.5)
+    assert not storage.assessments.complete(second + 1000, 1.0)
+    completed = storage.assessments.latest_completed(project_id)
+    assert completed['id'] == first and completed['overall_score'] == 3.5
+    assert isinstance(completed['completed_at'], datetime)
+
+
+def test_scores(storage):
+    owner = storage.users.create('scorer@example.org', 'x', 'Scorer')
+    assessment_id = storage.assessments.create(storage.projects.create(owner, 'Housing'))
+    assert storage.scores.for_assessment(assessment_id) == {}
+
+    storage.scores.save(assessment_id, 1, 3, 'Baseline')
+    storage.scores.save_many(assessment_id, {1: (4, 'Improved'), 2: (2, None), 3: (5, 'Strong')})
+    scores = storage.scores.for_assessment(assessment_id)
+    assert sorted(scores) == [1, 2, 3]
+    assert scores[1]['score'] == 4 and scores[1]['notes'] == 'Improved'
+    assert scores[2]['notes'] is None
+
+    # Saving again updates in place rather than adding duplicate rows
+    storage.scores.save(assessment_id, 2, 1)
+    assert len(storage.scores.for_assessment(assessment_id)) == 3
+    assert storage.scores.for_assessment(assessment_id)[2]['score'] == 1
+
+
+def test_transactions(storage):
+    owner = storage.users.create('tx@example.org', 'x', 'Tx')
+    with pytest.raises(RuntimeError):
+        with storage.transaction():
+            project_id = storage.projects.create(owner, 'Rolled back')
+            raise RuntimeError('abort')
+    assert storage.projects.get(project_id, owner) is None
+
+    with storage.transaction():
+        project_id = storage.projects.create(owner, 'Committed')
+        with storage.transaction():
+            assessment_id = storage.assessments.create(project_id)
+        storage.scores.save(assessment_id, 1, 2)
+    assert storage.projects.get(project_id, owner)['name'] == 'Committed'
+    assert storage.scores.for_assessment(assessment_id)[1]['score'] == 2
+
+
+def test_writes_are_committed(storage, reopen):
+    """Writes outside a transaction are committed, not just visible to this connection"""
+    user_id = storage.users.create('durable@example.org', 'x', 'Durable')
+    with reopen() as other:
+        assert other.users.get(user_id)['name'] == 'Durable'
+
+
+def test_incomplete_engine_is_rejected():
+    class Users(UserRepository):
+        def get(self, user_id):
+            return None
+
+    class HalfStorage(Storage):
+        def transaction(self):
+            return None
+
+    with pytest.raises(TypeError):
+        Users()
+    with pytest.raises(TypeError):
+        HalfStorage()
+
+
+def _plain(value):
+    """Rows as dicts, minus the timestamp columns that differ between runs"""
+    if isinstance(value, dict):
+        return {key: _plain(item) for key, item in value.items()}
+    if isinstance(value, list):
+        return [_plain(item) for item in value]
+    if hasattr(value, 'keys'):
+        return {key: value[key] for key in value.keys() if not key.endswith('_at')}
+    return value
+
+
+def _script(storage):
+    """The same calls on each engine; returns everything read back"""
+    user_id = storage.users.create('same@example.org', 'x', 'Same', 'Org')
+    project_id = storage.projects.create(user_id, 'Parity', 'Both engines', 'Residential', 'Porto', 80)
+    assessment_id = storage.assessments.create(project_id)
+    storage.scores.save_many(assessment_id, {sdg: (sdg % 5 + 1, f'Note {sdg}') for sdg in range(1, 18)})
+    storage.assessments.complete(assessment_id, 3.2)
+    return _plain([
+        storage.users.get(user_id),
+        storage.projects.list_for_user(user_id),
+        storage.assessments.list_for_project(project_id),
+        storage.scores.for_assessment(assessment_id),
+    ])
+
+
+def test_engines_agree(tmp_path):
+    pytest.importorskip('sqlalchemy')
+    outputs = {}
+    for engine in ENGINES:
+        with open_storage(engine, make_scratch_db(str(tmp_path / engine))) as storage:
+            outputs[engine] = _script(storage)
+    first, *rest = outputs.values()
+    assert all(output == first for output in rest)